@@ -0,0 +1,122 @@
+"""
+基准测试共用的统计工具
+"""
+import json
+import math
+import os
+import sys
+import time
+import tracemalloc
+from typing import Dict, List, Optional
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+
+def percentile(values: List[float], p: float) -> Optional[float]:
+    """最近秩法计算百分位数，没有数据时返回None"""
+    if not values:
+        return None
+    values = sorted(values)
+    return values[max(0, math.ceil(p / 100 * len(values)) - 1)]
+
+
+def latency_summary(values: List[float]) -> Dict[str, Optional[float]]:
+    """延迟的统计，单位为毫秒"""
+    if not values:
+        return {"count": 0, "p50": None, "p90": None, "p99": None, "max": None, "mean": None}
+    return {
+        "count": len(values),
+        "p50"  : percentile(values, 50) * 1000,
+        "p90"  : percentile(values, 90) * 1000,
+        "p99"  : percentile(values, 99) * 1000,
+        "max"  : max(values) * 1000,
+        "mean" : sum(values) / len(values) * 1000,
+    }
+
+
+def max_rss() -> Optional[int]:
+    """进程的峰值常驻内存，单位为字节，无法获取时返回None"""
+    if resource is None:
+        return None
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss if sys.platform == "darwin" else rss * 1024
+
+
+class ResourceMeter:
+
+    def __init__(self, traceMemory: bool = False):
+        """记录一段时间内主线程的CPU时间与内存增长
+
+        Notes:
+            CPU时间使用 `time.thread_time`，只统计调用线程 (即机器人的事件循环)，不包括本地服务所在的线程
+
+        Args:
+            traceMemory: 是否使用tracemalloc统计分配的内存，会明显降低吞吐
+        """
+        self.traceMemory = traceMemory
+        self.wall = 0.0
+        self.threadCpu = 0.0
+        self.processCpu = 0.0
+        self.rssGrowth: Optional[int] = None
+        self.tracedPeak: Optional[int] = None
+
+    def __enter__(self):
+        if self.traceMemory:
+            tracemalloc.start()
+        self._rss = max_rss()
+        self._wall = time.perf_counter()
+        self._thread = time.thread_time()
+        self._process = time.process_time()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.wall = time.perf_counter() - self._wall
+        self.threadCpu = time.thread_time() - self._thread
+        self.processCpu = time.process_time() - self._process
+        rss = max_rss()
+        if rss is not None and self._rss is not None:
+            self.rssGrowth = rss - self._rss
+        if self.traceMemory:
+            _, self.tracedPeak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+
+    def per_message(self, count: int) -> Dict[str, Optional[float]]:
+        count = max(count, 1)
+        return {
+            "loop_cpu_us"       : self.threadCpu / count * 1e6,
+            "process_cpu_us"    : self.processCpu / count * 1e6,
+            "rss_growth_bytes"  : self.rssGrowth / count if self.rssGrowth is not None else None,
+            "traced_peak_bytes" : self.tracedPeak / count if self.tracedPeak is not None else None,
+        }
+
+
+def print_report(title: str, report: dict):
+    """以表格形式输出结果"""
+    print(f"\n== {title} ==")
+    for section, values in report.items():
+        if isinstance(values, dict):
+            print(f"{section}:")
+            for k, v in values.items():
+                print(f"  {k:<20} {_format(v)}")
+        else:
+            print(f"{section:<22} {_format(values)}")
+
+
+def _format(value) -> str:
+    if value is None:
+        return "-"
+    if isinstance(value, float):
+        return f"{value:,.3f}"
+    return str(value)
+
+
+def dump_report(path: str, report: dict):
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2, ensure_ascii=False)
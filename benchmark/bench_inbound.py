@@ -0,0 +1,283 @@
+"""
+接收链路的基准测试
+
+将录制的回调通过本地的钉钉服务替身推送给机器人，统计吞吐、从收到消息到调用监听函数
+以及到发出回复的延迟，和每条消息的CPU与内存开销。全程离线运行。
+
+    python benchmark/bench_inbound.py --mode stream --messages 5000
+    python benchmark/bench_inbound.py --mode stream --messages 2000 --rate 200
+    python benchmark/bench_inbound.py --mode http --messages 5000 --http-concurrency 32
+    python benchmark/bench_inbound.py --mode stream --messages 5000 --workers 4
+"""
+import argparse
+import asyncio
+import json
+import os
+import tempfile
+import threading
+import time
+
+from _common import ROOT, ResourceMeter, dump_report, latency_summary, print_report
+from fake_dingtalk import FakeDingtalk, build_payloads, stream_frame
+
+APP_KEY = "bench-app-key"
+APP_SECRET = "bench-app-secret"
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Dingraia inbound pipeline benchmark")
+    parser.add_argument("--mode", choices=("stream", "http"), default="stream", help="接收模式")
+    parser.add_argument("--messages", "-n", type=int, default=2000, help="计入统计的消息数")
+    parser.add_argument("--warmup", type=int, default=200, help="预热的消息数，不计入统计")
+    parser.add_argument("--payload", default=os.path.join(ROOT, "benchmark", "payloads", "messages.json"),
+                        help="录制的回调数据，JSON数组")
+    parser.add_argument("--rate", type=float, default=0, help="每秒推送的消息数，为0时尽快推送(测试饱和吞吐)")
+    parser.add_argument("--conversations", type=int, default=16, help="消息分散到的会话数")
+    parser.add_argument("--concurrency", type=int, default=64, help="StreamOptions.maxConcurrency，0为逐条处理")
+    parser.add_argument("--workers", type=int, default=1, help="Stream模式下的进程数，大于1时使用多进程模式")
+    parser.add_argument("--http-concurrency", type=int, default=32, help="HTTP模式下同时进行的回调请求数")
+    parser.add_argument("--no-reply", action="store_true", help="监听函数不发送回复")
+    parser.add_argument("--handler-delay", type=float, default=0, help="监听函数中模拟的耗时，单位为秒")
+    parser.add_argument("--no-database", action="store_true", help="不使用数据库缓存")
+    parser.add_argument("--write-behind", action="store_true", help="启用数据库延迟写入")
+    parser.add_argument("--trace-memory", action="store_true", help="使用tracemalloc统计内存分配，会降低吞吐")
+    parser.add_argument("--timeout", type=float, default=120, help="等待处理完成的超时时间")
+    parser.add_argument("--log", action="store_true", help="保留框架日志输出")
+    parser.add_argument("--json", dest="jsonPath", help="将结果写入JSON文件")
+    return parser.parse_args()
+
+
+async def wait_for(condition, timeout: float):
+    deadline = time.perf_counter() + timeout
+    while not condition():
+        if time.perf_counter() > deadline:
+            return False
+        await asyncio.sleep(0.002)
+    return True
+
+
+async def run(args) -> dict:
+    # 在临时目录中导入，避免数据库缓存文件写入当前目录
+    from aiohttp import web
+    from dingraia.DingTalk import Dingtalk
+    from dingraia.cache import cache
+    from dingraia.config import Bot, CacheWriteBehind, Config, Stream, StreamOptions
+    from dingraia.element import AccessToken
+    from dingraia.event import MessageEvent
+    from dingraia.event.message import GroupMessage
+    from dingraia.model import Group
+    from dingraia.saya import Channel
+    from dingraia.saya.builtins.broadcast import ListenerSchema
+
+    if not args.log:
+        from loguru import logger
+        logger.remove()
+
+    fake = FakeDingtalk()
+    fake.start()
+    AccessToken.TOKEN_URL = fake.url + "/gettoken"
+    config = Config(
+        bot=Bot(APP_KEY, APP_SECRET, APP_KEY),
+        stream=[Stream(APP_KEY, APP_SECRET)] if args.mode == "stream" else None,
+        useDatabase=not args.no_database,
+        cacheWriteBehind=CacheWriteBehind() if args.write_behind else None,
+        streamOptions=StreamOptions(maxConcurrency=args.concurrency),
+    )
+    app = Dingtalk(config)
+    app.WS_CONNECT_URL = fake.url + "/v1.0/gateway/connections/open"
+    app._loop = asyncio.get_running_loop()
+    app.prepare()
+    app.api_request.host = fake.url
+    app.oapi_request.host = fake.url
+
+    handled = {}
+    reply = not args.no_reply
+    delay = args.handler_delay
+
+    @Channel.current().use(ListenerSchema(listening_events=[GroupMessage]))
+    async def on_message(group: Group, event: MessageEvent):
+        handled[event.id] = time.perf_counter()
+        if delay:
+            await asyncio.sleep(delay)
+        if reply:
+            await app.send_message(group, "pong")
+
+    with open(args.payload, encoding="utf-8") as f:
+        templates = json.load(f)
+    total = args.warmup + args.messages
+    payloads = build_payloads(templates, total, fake, args.conversations)
+    if args.mode == "stream":
+        items = [(msgId, stream_frame(msgId, data, APP_KEY)) for msgId, data in payloads]
+        app._create_stream(config.stream[0])
+        loop = asyncio.get_running_loop()
+        if not await loop.run_in_executor(None, fake.connected.wait, 10):
+            raise RuntimeError("Stream client did not connect to the fake gateway")
+
+        def push(batch):
+            return loop.run_in_executor(None, fake.push_frames, batch, args.rate)
+    else:
+        items = [(msgId, json.dumps(data, ensure_ascii=False)) for msgId, data in payloads]
+        webApp = web.Application()
+        webApp.add_routes([web.post("/", app.receive_data)])
+        runner = web.AppRunner(webApp, access_log=None)
+        await runner.setup()
+        site = web.TCPSite(runner, "127.0.0.1", 0)
+        await site.start()
+        callbackUrl = "http://127.0.0.1:%d/" % site._server.sockets[0].getsockname()[1]  # NOQA
+        loop = asyncio.get_running_loop()
+
+        def push(batch):
+            return loop.run_in_executor(None, fake.post_callbacks, callbackUrl, batch,
+                                        args.http_concurrency, args.rate)
+
+    def finished(batch):
+        return lambda: len(handled) >= len(batch) and (not reply or len(fake.replied) >= len(batch))
+
+    warmup, measured = items[:args.warmup], items[args.warmup:]
+    if warmup:
+        await push(warmup)
+        await wait_for(finished(warmup), args.timeout)
+    handled.clear()
+    fake.reset()
+
+    with ResourceMeter(traceMemory=args.trace_memory) as meter:
+        await push(measured)
+        completed = await wait_for(finished(measured), args.timeout)
+        if cache.writeBehind:
+            await loop.run_in_executor(None, cache.flush)
+
+    sent = dict(fake.sent)
+    replied = dict(fake.replied)
+    toHandler = [handled[k] - sent[k] for k in handled if k in sent]
+    toReply = [replied[k] - sent[k] for k in replied if k in sent]
+    start = min(sent.values()) if sent else 0
+    report = {
+        "mode"         : args.mode,
+        "messages"     : len(measured),
+        "completed"    : completed,
+        "handled"      : len(handled),
+        "replied"      : len(replied),
+        "acks"         : fake.acks if args.mode == "stream" else None,
+        "throughput"   : {
+            "handled_per_sec": len(handled) / (max(handled.values()) - start) if handled else 0.0,
+            "replied_per_sec": len(replied) / (max(replied.values()) - start) if replied else None,
+        },
+        "to_handler_ms": latency_summary(toHandler),
+        "to_reply_ms"  : latency_summary(toReply) if reply else None,
+        "per_message"  : meter.per_message(len(handled)),
+        "wall_sec"     : meter.wall,
+    }
+    await app.stop()
+    if args.mode == "http":
+        await runner.cleanup()
+    fake.stop()
+    return report
+
+
+def run_workers(args) -> dict:
+    """多进程模式，只能统计到回复的延迟，CPU时间为所有子进程的合计"""
+    from dingraia.DingTalk import Dingtalk
+    from dingraia.config import Bot, Config, Stream, StreamOptions
+    from dingraia.element import AccessToken
+    from dingraia.event.message import GroupMessage
+    from dingraia.model import Group
+    from dingraia.saya import Channel
+    from dingraia.saya.builtins.broadcast import ListenerSchema
+    from dingraia.workers import WorkerSupervisor
+
+    if not args.log:
+        from loguru import logger
+        logger.remove()
+
+    fake = FakeDingtalk()
+    fake.start()
+    AccessToken.TOKEN_URL = fake.url + "/gettoken"
+    config = Config(
+        bot=Bot(APP_KEY, APP_SECRET, APP_KEY),
+        stream=[Stream(APP_KEY, APP_SECRET)],
+        useDatabase=not args.no_database,
+        streamOptions=StreamOptions(maxConcurrency=args.concurrency),
+    )
+    app = Dingtalk(config)
+    app.WS_CONNECT_URL = fake.url + "/v1.0/gateway/connections/open"
+    delay = args.handler_delay
+
+    @Channel.current().use(ListenerSchema(listening_events=[GroupMessage]))
+    async def on_message(group: Group):
+        if delay:
+            await asyncio.sleep(delay)
+        await app.send_message(group, "pong")
+
+    with open(args.payload, encoding="utf-8") as f:
+        templates = json.load(f)
+    payloads = build_payloads(templates, args.warmup + args.messages, fake, args.conversations)
+    items = [(msgId, stream_frame(msgId, data, APP_KEY)) for msgId, data in payloads]
+    warmup, measured = items[:args.warmup], items[args.warmup:]
+    supervisor = app.workerSupervisor = WorkerSupervisor(app, args.workers, statsInterval=0.2)
+    report = {}
+
+    def wait_replies(count: int) -> bool:
+        deadline = time.perf_counter() + args.timeout
+        while len(fake.replied) < count:
+            if time.perf_counter() > deadline:
+                return False
+            time.sleep(0.002)
+        return True
+
+    def cpu_time() -> float:
+        time.sleep(0.5)
+        return supervisor.stats()["total"]["cpuTime"]
+
+    def drive():
+        try:
+            deadline = time.perf_counter() + 30
+            while len(fake.connections) < args.workers and time.perf_counter() < deadline:
+                time.sleep(0.05)
+            if warmup:
+                fake.push_frames(warmup, args.rate)
+                wait_replies(len(warmup))
+            fake.reset()
+            cpuBefore = cpu_time()
+            fake.push_frames(measured, args.rate)
+            completed = wait_replies(len(measured))
+            cpuAfter = cpu_time()
+            sent, replied = dict(fake.sent), dict(fake.replied)
+            start = min(sent.values()) if sent else 0
+            report.update({
+                "mode"       : f"stream x{args.workers} workers",
+                "messages"   : len(measured),
+                "completed"  : completed,
+                "replied"    : len(replied),
+                "acks"       : fake.acks,
+                "throughput" : {
+                    "replied_per_sec": len(replied) / (max(replied.values()) - start) if replied else 0.0,
+                },
+                "to_reply_ms": latency_summary([replied[k] - sent[k] for k in replied if k in sent]),
+                "per_message": {"workers_cpu_us": (cpuAfter - cpuBefore) / max(len(replied), 1) * 1e6},
+            })
+        finally:
+            supervisor.stop()
+
+    threading.Thread(target=drive, name="BenchDriver", daemon=True).start()
+    supervisor.run()
+    fake.stop()
+    return report
+
+
+def main():
+    args = parse_args()
+    if args.jsonPath:
+        args.jsonPath = os.path.abspath(args.jsonPath)
+    args.payload = os.path.abspath(args.payload)
+    os.chdir(tempfile.mkdtemp(prefix="dingraia-bench-"))
+    if args.workers > 1 and args.mode == "stream":
+        report = run_workers(args)
+    else:
+        report = asyncio.run(run(args))
+    print_report(f"Inbound pipeline ({report.get('mode', args.mode)})", report)
+    if args.jsonPath:
+        dump_report(args.jsonPath, report)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,106 @@
+"""
+日志的基准测试
+
+统计 `dingraia.log.logger` 每次调用的开销：调用线程中的耗时 (`caller_us`)，以及包括后台线程写出在内、
+直到全部日志写出的平均耗时 (`total_us`)。标准输出在测试期间被重定向到 /dev/null。
+
+    python benchmark/bench_logging.py --calls 20000
+    python benchmark/bench_logging.py --calls 20000 --no-enqueue
+"""
+import argparse
+import contextlib
+import os
+import sys
+import time
+
+from _common import dump_report, print_report
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Dingraia logging benchmark")
+    parser.add_argument("--calls", "-n", type=int, default=20000, help="每个场景的调用次数")
+    parser.add_argument("--no-enqueue", action="store_true", help="在调用线程中直接写出日志")
+    parser.add_argument("--json", dest="jsonPath", help="将结果写入JSON文件")
+    return parser.parse_args()
+
+
+@contextlib.contextmanager
+def silence_stdout():
+    """将文件描述符1重定向到 /dev/null，sys.stdout对象不变，因此对已经添加的sink同样有效"""
+    sys.stdout.flush()
+    saved = os.dup(1)
+    devnull = os.open(os.devnull, os.O_WRONLY)
+    os.dup2(devnull, 1)
+    try:
+        yield
+    finally:
+        sys.stdout.flush()
+        os.dup2(saved, 1)
+        os.close(devnull)
+        os.close(saved)
+
+
+def measure(call, calls: int) -> dict:
+    from loguru import logger as loguru_logger
+
+    for _ in range(min(calls, 200)):
+        call()
+    loguru_logger.complete()
+    start = time.perf_counter()
+    for _ in range(calls):
+        call()
+    caller = time.perf_counter() - start
+    loguru_logger.complete()
+    total = time.perf_counter() - start
+    return {"caller_us": caller / calls * 1e6, "total_us": total / calls * 1e6}
+
+
+def main():
+    args = parse_args()
+    from dingraia import log
+    from dingraia.log import LazyMessage, logger
+
+    if args.no_enqueue:
+        log.configure_logging(enqueue=False)
+
+    class Member:
+        name = "测试用户"
+        id = 123456
+
+    member = Member()
+    text = "这是一条用于测试的消息，包含一些 <b>标记</b> 和较长的内容" * 2
+
+    def eager():
+        logger.info(f"[RECV][{member.name}({member.id})] -> {repr(str(text))[1:-1]}", _inspect=['', '', ''])
+
+    def lazy():
+        logger.info(LazyMessage(lambda: f"[RECV][{member.name}({member.id})] -> {repr(str(text))[1:-1]}"),
+                    _inspect=['', '', ''])
+
+    scenarios = {}
+    with silence_stdout():
+        for index in (1, 2, 3, 4):
+            switched = logger.switch_logger(index)
+            scenarios[f"info_format_{index}"] = measure(lambda: switched.info("Hello, world!"), args.calls)
+        scenarios["info_markup"] = measure(lambda: logger.info(text), args.calls)
+        scenarios["info_message"] = measure(eager, args.calls)
+        scenarios["debug_enabled"] = measure(lambda: logger.debug("debug message"), args.calls)
+        log.set_level("INFO")
+        scenarios["debug_filtered"] = measure(lambda: logger.debug("debug message"), args.calls)
+        log.set_level("WARNING")
+        scenarios["info_filtered_eager"] = measure(eager, args.calls)
+        scenarios["info_filtered_lazy"] = measure(lazy, args.calls)
+        log.set_level("DEBUG")
+    report = {
+        "calls"    : args.calls,
+        "enqueue"  : not args.no_enqueue,
+        "caller_us": {k: v["caller_us"] for k, v in scenarios.items()},
+        "total_us" : {k: v["total_us"] for k, v in scenarios.items()},
+    }
+    print_report("Logging", report)
+    if args.jsonPath:
+        dump_report(args.jsonPath, report)
+
+
+if __name__ == '__main__':
+    main()
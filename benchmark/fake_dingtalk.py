@@ -0,0 +1,234 @@
+"""
+本地的钉钉服务替身，用于离线基准测试
+
+包含 Stream 网关 (连接申请与 Websocket)、gettoken、会话 Webhook 以及常用的
+api.dingtalk.com / oapi.dingtalk.com 接口。服务运行在独立线程的事件循环中，
+所有时间戳均使用 `time.perf_counter`，可以和主线程的记录直接比较。
+"""
+import asyncio
+import json
+import threading
+import time
+from typing import Dict, List, Optional
+
+from aiohttp import ClientSession, ClientTimeout, TCPConnector, WSMsgType, web
+
+
+class FakeDingtalk:
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 0):
+        """本地的钉钉服务替身
+
+        Args:
+            host: 监听地址
+            port: 监听端口，为0时自动选择
+        """
+        self.host = host
+        self.port = port
+        self.sent: Dict[str, float] = {}
+        """消息ID与发出时间"""
+        self.replied: Dict[str, float] = {}
+        """消息ID与收到回复的时间"""
+        self.acks: int = 0
+        self.apiCalls: Dict[str, int] = {}
+        self.connected = threading.Event()
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._thread: Optional[threading.Thread] = None
+        self._runner: Optional[web.AppRunner] = None
+        self.connections: List[web.WebSocketResponse] = []
+        """已连接的Stream客户端，推送时轮流使用"""
+        self._ready = threading.Event()
+
+    @property
+    def url(self) -> str:
+        return f"http://{self.host}:{self.port}"
+
+    def webhook(self, msgId: str) -> str:
+        """生成带有消息ID的会话Webhook，收到回复时可以对应到原消息"""
+        return f"{self.url}/robot/sendBySession?msgId={msgId}"
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name="FakeDingtalk", daemon=True)
+        self._thread.start()
+        self._ready.wait()
+
+    def stop(self):
+        if self._loop is None:
+            return
+        asyncio.run_coroutine_threadsafe(self._shutdown(), self._loop).result()
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join()
+
+    def reset(self):
+        self.sent.clear()
+        self.replied.clear()
+        self.acks = 0
+        self.apiCalls.clear()
+
+    def push_frames(self, frames: List[tuple], rate: float = 0, timeout: float = None):
+        """通过Stream网关推送消息，有多个连接时轮流推送，阻塞到全部写入Websocket
+
+        Args:
+            frames: (消息ID, 序列化后的帧) 的列表
+            rate: 每秒推送的消息数，为0时尽快推送
+            timeout: 超时时间
+        """
+        return asyncio.run_coroutine_threadsafe(self._push(frames, rate), self._loop).result(timeout)
+
+    def post_callbacks(self, url: str, bodies: List[tuple], concurrency: int, rate: float = 0, timeout: float = None):
+        """以HTTP回调的方式推送消息，阻塞到全部请求完成
+
+        Args:
+            url: 机器人的回调地址
+            bodies: (消息ID, 序列化后的请求体) 的列表
+            concurrency: 同时进行的请求数
+            rate: 每秒发起的请求数，为0时尽快发起
+            timeout: 超时时间
+        """
+        return asyncio.run_coroutine_threadsafe(self._post(url, bodies, concurrency, rate), self._loop).result(timeout)
+
+    def _run(self):
+        self._loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self._loop)
+        self._loop.run_until_complete(self._serve())
+        self._ready.set()
+        self._loop.run_forever()
+        self._loop.close()
+
+    async def _serve(self):
+        app = web.Application()
+        app.add_routes([
+            web.post("/v1.0/gateway/connections/open", self._open_connection),
+            web.get("/connect", self._gateway),
+            web.get("/gettoken", self._gettoken),
+            web.post("/robot/sendBySession", self._session_webhook),
+            web.route("*", "/{path:.*}", self._api),
+        ])
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, self.host, self.port)
+        await site.start()
+        self.port = site._server.sockets[0].getsockname()[1]  # NOQA
+
+    async def _shutdown(self):
+        for ws in list(self.connections):
+            await ws.close()
+        await self._runner.cleanup()
+
+    async def _open_connection(self, request: web.Request):
+        body = await request.json()
+        return web.json_response({
+            "endpoint": f"ws://{self.host}:{self.port}/connect",
+            "ticket"  : f"bench-{body.get('clientId')}"
+        })
+
+    async def _gateway(self, request: web.Request):
+        ws = web.WebSocketResponse(max_msg_size=0)
+        await ws.prepare(request)
+        self.connections.append(ws)
+        self.connected.set()
+        try:
+            async for msg in ws:
+                if msg.type == WSMsgType.TEXT:
+                    self.acks += 1
+                elif msg.type == WSMsgType.ERROR:
+                    break
+        finally:
+            self.connections.remove(ws)
+            if not self.connections:
+                self.connected.clear()
+        return ws
+
+    @staticmethod
+    async def _gettoken(_):
+        return web.json_response({"errcode": 0, "errmsg": "ok", "access_token": "bench-token", "expires_in": 7200})
+
+    async def _session_webhook(self, request: web.Request):
+        await request.read()
+        msgId = request.query.get("msgId")
+        if msgId:
+            self.replied[msgId] = time.perf_counter()
+        return web.json_response({"errcode": 0, "errmsg": "ok"})
+
+    async def _api(self, request: web.Request):
+        await request.read()
+        self.apiCalls[request.path] = self.apiCalls.get(request.path, 0) + 1
+        if request.path.startswith("/v1.0/"):
+            return web.json_response({"processQueryKey": "bench", "result": {}})
+        return web.json_response({"errcode": 0, "errmsg": "ok", "result": {}})
+
+    @staticmethod
+    async def _pace(start: float, index: int, rate: float):
+        if rate > 0:
+            delay = start + index / rate - time.perf_counter()
+            if delay > 0:
+                await asyncio.sleep(delay)
+
+    async def _push(self, frames: List[tuple], rate: float = 0):
+        start = time.perf_counter()
+        for i, (msgId, frame) in enumerate(frames):
+            connections = [ws for ws in self.connections if not ws.closed]
+            if not connections:
+                raise RuntimeError("No stream client connected")
+            await self._pace(start, i, rate)
+            self.sent[msgId] = time.perf_counter()
+            await connections[i % len(connections)].send_str(frame)
+
+    async def _post(self, url: str, bodies: List[tuple], concurrency: int, rate: float = 0):
+        queue = iter(enumerate(bodies))
+        headers = {"Content-Type": "application/json", "User-Agent": "DingTalk-Bench"}
+        timeout = ClientTimeout(total=None)
+        start = time.perf_counter()
+
+        async def worker(session: ClientSession):
+            for i, (msgId, body) in queue:
+                await self._pace(start, i, rate)
+                self.sent[msgId] = time.perf_counter()
+                async with session.post(url, data=body, headers=headers) as resp:
+                    await resp.read()
+
+        async with ClientSession(connector=TCPConnector(limit=concurrency), timeout=timeout) as session:
+            await asyncio.gather(*[worker(session) for _ in range(concurrency)])
+
+
+def build_payloads(templates: List[dict], count: int, fake: FakeDingtalk, conversations: int = 16) -> List[tuple]:
+    """根据录制的回调生成测试消息
+
+    Args:
+        templates: 录制的回调数据
+        count: 消息数
+        fake: 本地服务，用于生成会话Webhook
+        conversations: 分散到的会话数
+
+    Returns:
+        (消息ID, 回调数据) 的列表
+    """
+    now = int(time.time() * 1000)
+    payloads = []
+    for i in range(count):
+        data = dict(templates[i % len(templates)])
+        msgId = f"msgBench{i}"
+        data["msgId"] = msgId
+        data["conversationId"] = f"{data['conversationId']}-{i % max(conversations, 1)}"
+        data["sessionWebhook"] = fake.webhook(msgId)
+        data["sessionWebhookExpiredTime"] = now + 3600 * 1000
+        data["createAt"] = now
+        payloads.append((msgId, data))
+    return payloads
+
+
+def stream_frame(msgId: str, data: dict, appKey: str) -> str:
+    """将回调数据包装为Stream网关推送的帧"""
+    return json.dumps({
+        "specVersion": "1.0",
+        "type"       : "CALLBACK",
+        "headers"    : {
+            "appId"       : appKey,
+            "connectionId": "bench-connection",
+            "contentType" : "application/json",
+            "messageId"   : msgId,
+            "time"        : str(int(time.time() * 1000)),
+            "topic"       : "/v1.0/im/bot/messages/get"
+        },
+        "data"       : json.dumps(data, ensure_ascii=False)
+    }, ensure_ascii=False)
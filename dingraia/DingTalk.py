@@ -1,6 +1,5 @@
 import asyncio
 import base64
-import collections
 import datetime
 import functools
 import hmac
@@ -16,35 +15,49 @@ import uuid
 from concurrent.futures import ThreadPoolExecutor
 from contextlib import contextmanager
 from functools import reduce
-from typing import Coroutine, Dict, Tuple, TypeVar
+from typing import Any, Awaitable, Coroutine, Dict, Set, Tuple, TypeVar
 from urllib.parse import urlencode, urljoin
 
 import mutagen
 import websockets
-from aiohttp import ClientResponse, ClientSession, web
+from aiohttp import ClientConnectionError, ClientResponse, ClientSession, ClientTimeout, TCPConnector, TraceConfig, web
 from pymediainfo import MediaInfo
 
 from .VERSION import VERSION
+from .accesslog import AccessLogWriter, check_ua as check_ua_policy
 from .callback_handler import callback_handler
 from .card import *
-from .config import Config, CustomStreamConnect, FailedMessage, Stream
+from .card.callback import CardCallbackHub
+from .card.streaming import StreamingUpdater
+from .config import AccessLog, BroadcastOptions, Config, CustomStreamConnect, FailedMessage, RetryPolicy, Stream
+from .context import send_accepted
 from .element import *
 from .event import MessageEvent
 from .event.event import *
 from .event.message import *
 from .exceptions import *
 from .http_page import *
+from .log import LazyMessage
 from .message.chain import MessageChain
 from .message.element import *
-from .model import Group, Webhook
+from .metrics import (API_ERRORS, API_REQUEST_SECONDS, API_RESPONSES, SEND_MESSAGE_SECONDS, STREAM_ACK_SECONDS,
+                      STREAM_FRAMES, STREAM_INFLIGHT, STREAM_RECONNECTS, MetricsRegistry, registry, timed)
+from .model import Group, Webhook, event_timestamp
 from .module import load_modules
+from .profiler import HandlerProfiler
+from .ratelimit import RateLimiter, TokenBucket
+from .retry import Retrier
 from .saya import Channel, Saya
 from .signer import decrypt, sign_js
+from .stall_monitor import StallMonitor
+from .stream import Backoff, EventDeduplicator, StreamDispatcher, StreamFrame, conversation_key
+from .token_manager import AccessTokenManager
 from .tools import write_temp_file
 from .tools.timer import format_time
 from .vars import *
-from .verify import get_token, url_res
+from .verify import get_token, set_client_session, url_res
 from .waiter import Waiter
+from .workers import WorkerContext, WorkerSupervisor, fork_supported, worker_stats
 
 send_url = "https://oapi.dingtalk.com/robot/send?access_token={}&timestamp={}&sign={}"
 channel = Channel.current()
@@ -98,8 +111,16 @@ class Dingtalk:
     api_request: "Dingtalk._api_request" = None
     oapi_request: "Dingtalk._oapi_request" = None
     async_tasks = []
-    stream_checker = {}
-    """用于检测重复的回调, 键为任务名, 值为容纳50个StreamID的列表"""
+    stream_checker: Dict[str, EventDeduplicator] = {}
+    """用于检测重复的回调, 键为AppKey, 同一AppKey的Stream连接共用"""
+    stream_dispatchers: Dict[str, StreamDispatcher] = {}
+    """Stream消息的并发处理器, 键为任务名"""
+    stream_received: Dict[str, int] = {}
+    """Stream接收到的消息数(不含系统消息和重复消息), 键为任务名"""
+    worker: Optional[WorkerContext] = None
+    """多进程模式下子进程的信息，单进程运行时为None"""
+    workerSupervisor: Optional[WorkerSupervisor] = None
+    """多进程模式下父进程的管理器"""
     message_trace_id: Dict[TraceId, dict] = FixedSizeDict(max_size=500)
     """用于容纳发送的信息的追溯ID, 键为消息ID"""
     media_id_cache = FixedSizeDict(max_size=500)
@@ -114,7 +135,7 @@ class Dingtalk:
     """HTTP路由"""
     oauth_data: Dict[str, str] = {}
     """OAuth数据，键为uuid"""
-    cardInstanceCallBack: Dict[str, dict] = {}
+    cardInstanceCallBack: CardCallbackHub = CardCallbackHub()
     """卡片回调数据"""
     _handle_messages: Dict[str, dict] = {}
     """等待处理的信息"""
@@ -143,15 +164,44 @@ class Dingtalk:
             if isinstance(config, Config):
                 self.config = config
                 cache.enable = config.useDatabase
+                cache.infoCache.ttl = config.dataCacheTime.objectCacheTime
+                cache.infoCache.maxSize = config.dataCacheTime.objectCacheSize
+                if config.useDatabase and config.cacheWriteBehind:
+                    cache.enable_write_behind(
+                        maxBatchSize=config.cacheWriteBehind.maxBatchSize,
+                        flushInterval=config.cacheWriteBehind.flushInterval
+                    )
                 self.stream_connect = config.customStreamConnect
             else:
                 raise ValueError(f"Config '{repr(config)}' is not a class:Config or None")
         else:
             self.config = Config()
-
+        self.tokenManager = AccessTokenManager(self, self._access_token_dict, self.config.tokenRefreshAhead)
+        self.rateLimiter = RateLimiter(self.config.rateLimit)
+        self.retrier = Retrier(self.config.retryPolicy)
+        self.accessLogWriter: Optional[AccessLogWriter] = None
+        self.metrics: MetricsRegistry = registry
+        """运行指标，`self.metrics.render()` 以Prometheus文本格式导出"""
+        self.stream_dispatchers = {}
+        self._metricsAcquired = False
+        if self.config.metrics.enabled:
+            registry.acquire()
+            self._metricsAcquired = True
+        STREAM_INFLIGHT.add_function(self._stream_inflight)
+        if self.config.profiler.enabled:
+            Channel.profiler = HandlerProfiler(self.config.profiler.blockThreshold, self.config.profiler.top)
+        self.stallMonitor: Optional[StallMonitor] = None
+        """事件循环卡顿监控，未启用时为None"""
+        if self.config.stallWatchdog.enabled:
+            watchdog = self.config.stallWatchdog
+            self.stallMonitor = StallMonitor(watchdog.threshold, watchdog.interval, watchdog.captureStack,
+                                             watchdog.stackLimit)
+
+    @timed(SEND_MESSAGE_SECONDS)
     async def send_message(
             self, target: Union[Group, Member, OpenConversationId, str, Webhook, BasicMessage, None], *msg,
-            headers=None
+            headers=None,
+            concurrent: bool = None
     ):
         """发送普通的文本信息
         
@@ -160,6 +210,7 @@ class Dingtalk:
                     使用BasicMessage需要在Config配置对应选项
             msg: 要发送的对象
             headers: 要包含的请求头
+            concurrent: 发送多条消息时是否先并行上传文件，为None时使用 `AdvancedSendMessage.concurrentSend`
 
         Notes:
             如果target为None，则会发送到测试群，需要在配置文件中配置测试群的Webhook地址。
@@ -233,12 +284,17 @@ class Dingtalk:
             send_data['robotCode'] = self.config.bot.robotCode
             send_data['openConversationId'] = str(target)
         elif isinstance(msg, list):
-            res = []
-            for m in msg:
-                try:
-                    res.append(await self.send_message(target, m, headers=headers))
-                except Exception as err:
-                    logger.exception(err)
+            if concurrent is None:
+                concurrent = self.config.advancedSendMessage.concurrentSend
+            if concurrent:
+                res = await self._send_messages_concurrently(target, msg, headers)
+            else:
+                res = []
+                for m in msg:
+                    try:
+                        res.append(await self.send_message(target, m, headers=headers))
+                    except Exception as err:
+                        logger.exception(err)
             if len(res) == 1:
                 res = res[0]
             return res
@@ -300,7 +356,7 @@ class Dingtalk:
             sign = self.get_sign()
             url = send_url.format(sign[2], sign[1], sign[0])
             response.recall_type = "url"
-            logger.info(f"[SEND] <- {repr(str(msg))[1:-1]}", _inspect=['', '', ''])
+            logger.info(LazyMessage(lambda: f"[SEND] <- {repr(str(msg))[1:-1]}"), _inspect=['', '', ''])
         elif isinstance(target, Group):
             if time.time() < target.webhook.expired_time:
                 url = target.webhook.url
@@ -308,13 +364,15 @@ class Dingtalk:
                 if target.member:
                     target.name = target.member.name
                     target.id = target.member.id
-                logger.info(f"[SEND][{target.name}({int(target)})] <- {repr(str(msg))[1:-1]}", _inspect=['', '', ''])
+                logger.info(LazyMessage(lambda: f"[SEND][{target.name}({int(target)})] <- {repr(str(msg))[1:-1]}"),
+                            _inspect=['', '', ''])
             else:
                 logger.warning(i18n.WebhookUrlExpiredWarning)
                 return await self.send_message(target=target.openConversationId, *msg, headers=headers)
         elif isinstance(target, Member):
             url = f"https://api.dingtalk.com/v1.0/robot/oToMessages/batchSend"
-            logger.info(f"[SEND][{target.name}({int(target)})] <- {repr(str(msg))[1:-1]}", _inspect=['', '', ''])
+            logger.info(LazyMessage(lambda: f"[SEND][{target.name}({int(target)})] <- {repr(str(msg))[1:-1]}"),
+                        _inspect=['', '', ''])
             send_data['userIds'] = [target.staffid or target.staffId]  # NOQA
             send_data['robotCode'] = self.config.bot.robotCode
             if hasattr(target, 'traceId'):
@@ -336,10 +394,11 @@ class Dingtalk:
             url = 'https://api.dingtalk.com/v1.0/robot/groupMessages/send'
             response.recallType = "group"
             response.recallOpenConversationId = target
-            logger.info(f"[SEND][{target.name}({int(target)})] <- {repr(str(msg))[1:-1]}", _inspect=['', '', ''])
+            logger.info(LazyMessage(lambda: f"[SEND][{target.name}({int(target)})] <- {repr(str(msg))[1:-1]}"),
+                        _inspect=['', '', ''])
         else:
             url = str(target)
-            logger.info(f"[SEND][WebHook] <- {repr(str(msg))[1:-1]}", _inspect=['', '', ''])
+            logger.info(LazyMessage(lambda: f"[SEND][WebHook] <- {repr(str(msg))[1:-1]}"), _inspect=['', '', ''])
         if url and "http" not in url:
             logger.error(i18n.InvalidMessageSendingUrlError.format(url=url))
             response.ok = False
@@ -363,6 +422,8 @@ class Dingtalk:
                         _ = self.loop.create_task(logger.catch(func)(**send))
                     else:
                         self.loop.run_in_executor(pool, functools.partial(logger.catch(func), **send), ())
+        accepted = send_accepted.get()
+        requestOptions = {"trace_request_ctx": {"sendAccepted": accepted}} if accepted is not None else {}
         try:
             if 'access_token' not in url:
                 switchAccessToken = None
@@ -378,20 +439,22 @@ class Dingtalk:
                 if switchAccessToken:
                     with self.with_access_token(switchAccessToken):
                         if '//oapi' in url:
-                            resp = await self.oapi_request.post(url, json=send_data, headers=headers)
+                            resp = await self.oapi_request.post(url, json=send_data, headers=headers, **requestOptions)
                         elif '//api' in url:
-                            resp = await self.api_request.post(url, json=send_data, headers=headers)
+                            resp = await self.api_request.post(url, json=send_data, headers=headers, **requestOptions)
                         else:
-                            resp = await url_res(url, 'POST', json=send_data, headers=headers, res='raw')
+                            resp = await url_res(url, 'POST', json=send_data, headers=headers, res='raw',
+                                                 **requestOptions)
                 else:
                     if '//oapi' in url:
-                        resp = await self.oapi_request.post(url, json=send_data, headers=headers)
+                        resp = await self.oapi_request.post(url, json=send_data, headers=headers, **requestOptions)
                     elif '//api' in url:
-                        resp = await self.api_request.post(url, json=send_data, headers=headers)
+                        resp = await self.api_request.post(url, json=send_data, headers=headers, **requestOptions)
                     else:
-                        resp = await url_res(url, 'POST', json=send_data, headers=headers, res='raw')
+                        resp = await url_res(url, 'POST', json=send_data, headers=headers, res='raw',
+                                             **requestOptions)
             else:
-                resp = await url_res(url, 'POST', json=send_data, headers=headers, res='raw')
+                resp = await url_res(url, 'POST', json=send_data, headers=headers, res='raw', **requestOptions)
             response.ok = resp.ok
             response.text = await resp.text()
             response.url = url
@@ -425,6 +488,54 @@ class Dingtalk:
                 self._add_message_times(target=target, no_raise=True)
             return response
 
+    async def _send_messages_concurrently(self, target, messages: list, headers: dict) -> list:
+        """并行上传所有文件后发送消息，上传或发送失败的消息会被跳过"""
+        options = self.config.advancedSendMessage
+        semaphore = asyncio.Semaphore(max(options.maxConcurrentUploads, 1))
+        failed = object()
+
+        async def upload(m):
+            if not isinstance(m, File) or m.mediaId:
+                return m
+            try:
+                async with semaphore:
+                    return await self.upload_file(m)
+            except Exception as err:
+                logger.exception(err)
+                return failed
+
+        async def send(m):
+            try:
+                return await self.send_message(target, m, headers=headers, concurrent=True)
+            except Exception as err:
+                logger.exception(err)
+                return failed
+
+        async def send_in_order(m, accepted: asyncio.Event):
+            send_accepted.set(accepted)
+            try:
+                return await send(m)
+            finally:
+                accepted.set()
+
+        messages = [m for m in await asyncio.gather(*[upload(m) for m in messages]) if m is not failed]
+        if not options.keepSendOrder:
+            res = await asyncio.gather(*[send(m) for m in messages])
+            return [r for r in res if r is not failed]
+        # 上一条消息的请求发出后才开始发送下一条，不等待响应，请求按顺序到达
+        tasks = []
+        try:
+            for m in messages:
+                accepted = asyncio.Event()
+                tasks.append(asyncio.ensure_future(send_in_order(m, accepted)))
+                await accepted.wait()
+            res = await asyncio.gather(*tasks)
+        except BaseException:
+            for task in tasks:
+                task.cancel()
+            raise
+        return [r for r in res if r is not failed]
+
     def sendMessage(
             self, target: Union[Group, Member, OpenConversationId, str, Webhook, None], msg,
             headers=None
@@ -449,7 +560,8 @@ class Dingtalk:
             openConversationId: Union[OpenConversationId, Group, str] = None,
             processQueryKeys: Union[str, List[str]] = None,
             robotCode: str = None,
-            inThreadTime: int = 0
+            inThreadTime: int = 0,
+            batch: bool = None
     ):
         """撤回一条消息
         
@@ -459,6 +571,7 @@ class Dingtalk:
             processQueryKeys: 消息的加密ID
             robotCode: 机器人的机器码
             inThreadTime: 是否不等待撤回
+            batch: 撤回多条消息时是否将同一会话的消息合并为一次请求，为None时使用 `AdvancedSendMessage.batchRecall`
 
         Returns:
             text
@@ -468,6 +581,10 @@ class Dingtalk:
             if len(message) == 1:
                 message = message[0]
             else:
+                if batch is None:
+                    batch = self.config.advancedSendMessage.batchRecall
+                if batch:
+                    return await self._batch_recall(message, robotCode=robotCode, inThreadTime=inThreadTime)
                 res = []
                 for m in message:
                     try:
@@ -515,6 +632,167 @@ class Dingtalk:
         else:
             return self.loop.create_task(_run(inThreadTime))
 
+    async def _batch_recall(self, messages: List[Response], robotCode: str = None, inThreadTime: int = 0):
+        """按会话合并撤回请求，每次请求最多包含20条消息
+
+        Returns:
+            每次请求的结果，inThreadTime不为0时返回Task
+        """
+        if robotCode is None:
+            robotCode = self.config.bot.robotCode
+        groups: Dict[Optional[str], List[str]] = {}
+        for message in messages:
+            try:
+                if message.recallType not in ['group', 'personal']:
+                    raise UnsupportedRecallType(f"The recall type '{message.recallType}' is not supported for recall")
+                openConversationId = None
+                if message.recallType == 'group':
+                    openConversationId = str(message.recallOpenConversationId)
+                groups.setdefault(openConversationId, []).append(str(message.json()['processQueryKey']))
+            except Exception as err:
+                logger.exception(err)
+        requests = []
+        for openConversationId, processQueryKeys in groups.items():
+            for i in range(0, len(processQueryKeys), 20):
+                post_data = {
+                    "processQueryKeys": processQueryKeys[i:i + 20],
+                    "robotCode"       : robotCode
+                }
+                url = "/v1.0/robot/otoMessages/batchRecall"
+                if openConversationId:
+                    url = "/v1.0/robot/groupMessages/recall"
+                    post_data['openConversationId'] = openConversationId
+                requests.append((url, post_data))
+
+        async def _recall(url: str, post_data: dict):
+            try:
+                res = await self.api_request.post(url, json=post_data)
+                return await res.json()
+            except Exception as err:
+                logger.exception(err)
+
+        async def _run(_inThreadTime):
+            await asyncio.sleep(_inThreadTime)
+            return list(await asyncio.gather(*[_recall(url, post_data) for url, post_data in requests]))
+
+        if not inThreadTime:
+            return await _run(inThreadTime)
+        else:
+            return self.loop.create_task(_run(inThreadTime))
+
+    async def broadcast(
+            self,
+            targets: List[Union[Member, Group, OpenConversationId, str]],
+            msg,
+            *,
+            robotCode: str = None,
+            options: BroadcastOptions = None
+    ) -> BroadcastReport:
+        """向大量用户和群发送同一条消息
+
+        Notes:
+            用户按 `userBatchSize` 分批通过 `oToMessages/batchSend` 发送，群通过 `groupMessages/send` 发送，
+            所有请求共用 `qps` 的限额并发进行。触发限流的请求(包括被钉钉流控的用户)按指数退避重试，
+            其他错误不会重试。文件只会上传一次
+
+        Args:
+            targets: 用户(Member或staffId)和群(Group, OpenConversationId或以cid开头的字符串)的列表，重复的目标只发送一次
+            msg: 要发送的消息，可以是文本、文件或消息卡片
+            robotCode: 机器人的机器码
+            options: 本次发送的配置，为None时使用 `Config.broadcastOptions`
+
+        Returns:
+            BroadcastReport: 每个目标的发送结果
+        """
+        options = options or self.config.broadcastOptions
+        robotCode = robotCode or self.config.bot.robotCode
+        report = BroadcastReport()
+        start = time.monotonic()
+        users: List[str] = []
+        groups: List[str] = []
+        for target in targets:
+            if isinstance(target, Group):
+                key, targetType, bucket = str(target.openConversationId), "group", groups
+            elif isinstance(target, OpenConversationId) or (isinstance(target, str) and target.startswith('cid')):
+                key, targetType, bucket = str(target), "group", groups
+            else:
+                key, targetType, bucket = self._staffId2str(target), "user", users
+            if key not in report.results:
+                report.results[key] = BroadcastResult(key, targetType)
+                bucket.append(key)
+        if isinstance(msg, File) and not msg.mediaId:
+            msg = await self.upload_file(msg)
+        if isinstance(msg, (File, BaseElement)):
+            body = dict(msg.template)
+        else:
+            body = {'msgKey': "sampleText", 'msgParam': json.dumps({'content': str(msg)})}
+        body['robotCode'] = robotCode
+        limiter = TokenBucket(options.qps)
+        semaphore = asyncio.Semaphore(max(options.maxConcurrency, 1))
+
+        def fail(results: List[BroadcastResult], reason: str):
+            for r in results:
+                r.error = reason
+
+        async def post(url: str, extra: dict, results: List[BroadcastResult]):
+            backoff = Backoff(options.retryBaseDelay, options.retryMaxDelay)
+            while results:
+                for r in results:
+                    r.attempts += 1
+                payload = dict(body, **extra)
+                if "userIds" in extra:
+                    payload["userIds"] = [r.target for r in results]
+                try:
+                    async with semaphore:
+                        await limiter.acquire()
+                        report.requests += 1
+                        resp = await self.api_request.post(url, json=payload, rateLimitRetry=False)
+                        res = await resp.json()
+                    if resp.status == 429:
+                        raise APIRateLimitedError(res)
+                    if not resp.ok:
+                        raise err_reason[res.get('code', res.get('errcode', -1))](res)
+                except APIRateLimitedError as err:
+                    if backoff.attempts >= options.maxRetries:
+                        return fail(results, str(err))
+                    await asyncio.sleep(backoff.next())
+                    continue
+                except Exception as err:
+                    return fail(results, f"{err.__class__.__name__}: {err}")
+                invalid = set(res.get('invalidStaffIdList') or [])
+                limited = set(res.get('flowControlledStaffIdList') or [])
+                retry = []
+                for r in results:
+                    if r.target in invalid:
+                        r.error = "Invalid staffId"
+                    elif r.target in limited:
+                        retry.append(r)
+                    else:
+                        r.ok = True
+                        r.error = None
+                        r.processQueryKey = res.get('processQueryKey')
+                if retry and backoff.attempts >= options.maxRetries:
+                    return fail(retry, "Flow controlled")
+                if retry:
+                    await asyncio.sleep(backoff.next())
+                results = retry
+
+        size = max(1, min(options.userBatchSize, 20))
+        jobs = [
+            post("/v1.0/robot/oToMessages/batchSend", {"userIds": []},
+                 [report.results[k] for k in users[i:i + size]])
+            for i in range(0, len(users), size)
+        ]
+        jobs += [
+            post("/v1.0/robot/groupMessages/send", {"openConversationId": k}, [report.results[k]])
+            for k in groups
+        ]
+        await asyncio.gather(*jobs)
+        report.elapsed = time.monotonic() - start
+        logger.info(f"[Broadcast] {len(report.succeeded)}/{len(report)} succeeded, "
+                    f"{report.requests} requests in {report.elapsed:.2f}s")
+        return report
+
     async def send_ding(
             self,
             targets: List[Union[Member, str]],
@@ -557,9 +835,7 @@ class Dingtalk:
             dict: 卡片数据
 
         """
-        if outTrackId in self.cardInstanceCallBack:
-            return self.cardInstanceCallBack[outTrackId]
-        return None
+        return self.cardInstanceCallBack.get(outTrackId)
 
     async def send_card(
             self,
@@ -744,57 +1020,99 @@ class Dingtalk:
             "isError"   : False,
             "outTrackId": outTrackId,
         }
+
+        async def push(content: str, finalize: bool):
+            await self.api_request.jput("/v1.0/card/streaming", json=dict(
+                body, guid=str(uuid.uuid1()), content=content, isFinalize=finalize
+            ))
+
+        updater = self._streaming_updater(push, outTrackId)
+        errorText = None
+        callbacks = self.cardInstanceCallBack
+        stopEvent = callbacks.subscribe(outTrackId) if stopHandler or stopActionId else None
+
+        def should_stop() -> bool:
+            stopEvent.clear()
+            if stopHandler and stopHandler(callbacks.get(outTrackId)):
+                return True
+            return bool(stopActionId) and stopActionId in callbacks.actions(outTrackId)
+
+        chunks = card.streaming_string(length_limit=update_limit).__aiter__()
+        nextChunk: Optional[asyncio.Future] = None
+        stopWaiter: Optional[asyncio.Future] = None
         try:
-            async for content in card.streaming_string(length_limit=update_limit):
-                body["guid"] = str(uuid.uuid1())
-                body["content"] = content
-                res = await self.api_request.jput("/v1.0/card/streaming", json=body)
-                # logger.info(res)
-                cardCallBack = await self.get_card_data(outTrackId=outTrackId)
-                if cardCallBack:
-                    if stopHandler:
-                        if stopHandler(cardCallBack):
+            while True:
+                if nextChunk is None:
+                    nextChunk = asyncio.ensure_future(chunks.__anext__())
+                if stopEvent is not None:
+                    if stopWaiter is None:
+                        stopWaiter = asyncio.ensure_future(stopEvent.wait())
+                    await asyncio.wait({nextChunk, stopWaiter}, return_when=asyncio.FIRST_COMPLETED)
+                    if stopWaiter.done():
+                        stopWaiter = None
+                        if should_stop():
                             if stopAdditionalText:
-                                body["guid"] = str(uuid.uuid1())
-                                body["content"] = content + stopAdditionalText
-                                await self.api_request.jput("/v1.0/card/streaming", json=body)
+                                updater.update((updater.content or "") + stopAdditionalText)
                             break
-                    if stopActionId:
-                        if "value" in cardCallBack:
-                            actionIds = json.loads(cardCallBack["value"])["cardPrivateData"]["actionIds"]
-                            if stopActionId in actionIds:
-                                if stopAdditionalText:
-                                    body["guid"] = str(uuid.uuid1())
-                                    body["content"] = content + stopAdditionalText
-                                    await self.api_request.jput("/v1.0/card/streaming", json=body)
-                                break
-                    if len(content) > maxAnswerLength:
-                        body["guid"] = str(uuid.uuid1())
-                        body["content"] = content + f"[Stop for context limit {maxAnswerLength}]"
-                        await self.api_request.jput("/v1.0/card/streaming", json=body)
-                        break
+                        continue
+                try:
+                    content = await nextChunk
+                except StopAsyncIteration:
+                    break
+                finally:
+                    nextChunk = None
+                updater.update(content)
+                if len(content) > maxAnswerLength:
+                    updater.update(content + f"[Stop for context limit {maxAnswerLength}]")
+                    break
+        except asyncio.CancelledError:
+            await updater.close()
+            raise
         except Exception as err:
             logger.exception(err)
-            body["guid"] = str(uuid.uuid1())
-            body["content"] = "出错了，请稍后再试"
+            await updater.close()
             body["isError"] = True
-            await self.api_request.put("/v1.0/card/streaming", json=body)
-        body["guid"] = str(uuid.uuid1())
-        body["isFinalize"] = True
-        await self.api_request.put("/v1.0/card/streaming", json=body)
+            errorText = "出错了，请稍后再试"
+        finally:
+            if stopEvent is not None:
+                callbacks.unsubscribe(outTrackId)
+            for future in (nextChunk, stopWaiter):
+                if future is not None and not future.done():
+                    future.cancel()
+                    await asyncio.gather(future, return_exceptions=True)
+            try:
+                await chunks.aclose()
+            except Exception as err:
+                logger.debug(f"Failed to close the AI card generator -> {err.__class__.__name__}: {err}")
+        await updater.finish(errorText)
         resp = CardResponse()
         resp.outTrackId = outTrackId
         resp.card_data = card.data
         if isinstance(target, Group):
-            logger.info(f"[SEND][{target.name}({int(target)})] <- {repr(str(card.text))[1:-1]}", _inspect=['', '', ''])
+            logger.info(LazyMessage(lambda: f"[SEND][{target.name}({int(target)})] <- {repr(str(card.text))[1:-1]}"),
+                        _inspect=['', '', ''])
         elif isinstance(target, Member):
-            logger.info(f"[SEND][{target.name}({int(target)})] <- {repr(str(card.text))[1:-1]}", _inspect=['', '', ''])
+            logger.info(LazyMessage(lambda: f"[SEND][{target.name}({int(target)})] <- {repr(str(card.text))[1:-1]}"),
+                        _inspect=['', '', ''])
         elif isinstance(target, OpenConversationId):
-            logger.info(f"[SEND][{target.name}({int(target)})] <- {repr(str(card.text))[1:-1]}", _inspect=['', '', ''])
+            logger.info(LazyMessage(lambda: f"[SEND][{target.name}({int(target)})] <- {repr(str(card.text))[1:-1]}"),
+                        _inspect=['', '', ''])
         else:
-            logger.info(f"[SEND] <- {repr(str(card.text))[1:-1]}", _inspect=['', '', ''])
+            logger.info(LazyMessage(lambda: f"[SEND] <- {repr(str(card.text))[1:-1]}"), _inspect=['', '', ''])
         return resp
 
+    def _streaming_updater(self, send: Callable[[str, bool], Awaitable[Any]], name: str) -> StreamingUpdater:
+        options = self.config.aiCardStreaming
+        return StreamingUpdater(
+            send,
+            minInterval=options.minInterval,
+            maxInterval=options.maxInterval,
+            latencyFactor=options.latencyFactor,
+            flushChars=options.flushChars,
+            finalRetries=options.finalRetries,
+            name=name
+        )
+
     async def assistant_send_ai_card(
             self,
             event: AiAssistantMessage,
@@ -831,29 +1149,37 @@ class Dingtalk:
                 'options'   : {'componentTag': 'streamingComponent'}
             }
         }
+
+        async def push(content: str, finalize: bool):
+            cardData = dict(body["content"]["cardData"], value=content, isFinalize=finalize)
+            res = await self.api_request.jpost("/v1.0/aiInteraction/reply", json=gen(dict(
+                body, content=dict(body["content"], cardData=cardData)
+            )))
+            if is_debug:
+                logger.debug(res)
+
+        updater = self._streaming_updater(push, event.conversationToken)
         try:
             async for content in card.streaming_string(length_limit=update_limit):
-                body["content"]["cardData"]["value"] = content
-                res = await self.api_request.jpost("/v1.0/aiInteraction/reply", json=gen(body))
-                if is_debug:
-                    logger.debug(res)
+                updater.update(content)
                 if len(content) > maxAnswerLength:
-                    body["content"]["cardData"]["content"] = content + f"[Stop for context limit {maxAnswerLength}]"
-                    await self.api_request.jpost("/v1.0/aiInteraction/reply", json=gen(body))
+                    updater.update(content + f"[Stop for context limit {maxAnswerLength}]")
                     break
+        except asyncio.CancelledError:
+            await updater.close()
+            raise
         except Exception as err:
             logger.exception(err)
-            body["content"]["cardData"]["value"] = "出错了，请稍后再试"
+            await updater.close()
             body["content"]["cardData"]["isError"] = True
-            await self.api_request.jpost("/v1.0/aiInteraction/reply", json=gen(body))
+            await updater.finish("出错了，请稍后再试")
             return False
-        body["content"]["cardData"]["isFinalize"] = True
-        await self.api_request.jpost("/v1.0/aiInteraction/reply", json=gen(body))
+        await updater.finish()
         if event.sender.id:
-            logger.info(f"[SEND][{event.sender.name}({int(event.sender)})] <- {repr(str(card.text))[1:-1]}",
-                        _inspect=['', '', ''])
+            logger.info(LazyMessage(lambda: f"[SEND][{event.sender.name}({int(event.sender)})] <- "
+                                            f"{repr(str(card.text))[1:-1]}"), _inspect=['', '', ''])
         else:
-            logger.info(f"[SEND] <- {repr(str(card.text))[1:-1]}", _inspect=['', '', ''])
+            logger.info(LazyMessage(lambda: f"[SEND] <- {repr(str(card.text))[1:-1]}"), _inspect=['', '', ''])
         return True
 
     async def send_ai_message(
@@ -1032,15 +1358,14 @@ class Dingtalk:
             res['staff_id_nick_map'] = users_res.get('staff_id_nick_map')
             res['success'] = True
             if self.config.useDatabase:
-                if cache.value_exist("group_info", "openConversationId", openConversationId):
-                    cache.execute(
-                        f"UPDATE group_info SET name=?,info=?,timeStamp=? WHERE openConversationId=?",
-                        (res['title'], json.dumps(res), time.time(), openConversationId))
-                else:
-                    cache.execute(
-                        f"INSERT INTO group_info (id,chatId,openConversationId,name,info,timeStamp) VALUES (?,?,?,?,?,?)",
-                        ('', '', openConversationId, res['title'], json.dumps(res), time.time()))
-                cache.commit()
+                cache.upsert("group_info", "openConversationId", {
+                    "id"                : '',
+                    "chatId"            : '',
+                    "openConversationId": openConversationId,
+                    "name"              : res['title'],
+                    "info"              : json.dumps(res),
+                    "timeStamp"         : time.time()
+                }, update_columns=("name", "info", "timeStamp"))
         return res
 
     async def get_depts(self, deptId: Union[int, str] = 1, access_token: str = None):
@@ -1125,22 +1450,20 @@ class Dingtalk:
                                                     json={"language": language, "userid": user})
             res = res['result']
             if self.config.useDatabase:
-                if cache.value_exist("user_info", "staffId", user):
-                    cache.execute(
-                        f"UPDATE user_info SET name=?,staffId=?,unionId=?,info=?,timeStamp=? WHERE staffId=?",
-                        (res.get('name', ''), user, res.get('unionid', ''), json.dumps(res), time.time(),
-                         user))
-                else:
-                    cache.execute(
-                        f"INSERT INTO user_info (id,name,staffId,unionId,info,timeStamp) VALUES (?,?,?,?,?,?)",
-                        ('', '', user, res.get('unionid', ''), json.dumps(res), time.time()))
-                cache.commit()
+                cache.upsert("user_info", "staffId", {
+                    "id"       : '',
+                    "name"     : res.get('name', ''),
+                    "staffId"  : user,
+                    "unionId"  : res.get('unionid', ''),
+                    "info"     : json.dumps(res),
+                    "timeStamp": time.time()
+                }, update_columns=("name", "unionId", "info", "timeStamp"))
         return res
 
     async def unionId2staffId(self, unionId: Union[Member, str], using_cache: bool = None) -> str:
         t_unionId = unionId
         if isinstance(unionId, Member):
-            t_unionId = Member.unionId
+            t_unionId = unionId.unionId
         c = cache.execute("SELECT * FROM user_info WHERE unionId=?", (t_unionId,),
                           result=True) if self.config.useDatabase else []
         if len(c) > 0:
@@ -1156,20 +1479,19 @@ class Dingtalk:
                     "unionid": t_unionId
                 }
             )
-            t_unionId = res['result']['userid']
+            staffId = res['result']['userid']
             if self.config.useDatabase:
-                if cache.value_exist("user_info", "unionId", t_unionId):
-                    cache.execute(
-                        f"UPDATE user_info SET staffId=? WHERE unionId=?",
-                        (res['result']['userid'], t_unionId))
-                else:
-                    cache.execute(
-                        f"INSERT INTO user_info (id,name,staffId,unionId,info,timeStamp) VALUES (?,?,?,?,?,?)",
-                        ('', '', res['result']['userid'], t_unionId, '{}', time.time()))
-                cache.commit()
+                cache.upsert("user_info", "staffId", {
+                    "id"       : '',
+                    "name"     : '',
+                    "staffId"  : staffId,
+                    "unionId"  : t_unionId,
+                    "info"     : '{}',
+                    "timeStamp": time.time()
+                }, update_columns=("unionId",))
             if isinstance(unionId, Member):
-                unionId.unionId = t_unionId
-            return t_unionId
+                unionId.staffId = staffId
+            return staffId
 
     async def remove_user(self, userStaffId: Union[Member, str], access_token: str = None):
         """从组织中直接移除用户
@@ -1783,7 +2105,7 @@ class Dingtalk:
             dict: 执行结果
 
         """
-        access_token = access_token or self.access_token
+        access_token = access_token or await self.get_access_token()
         url = "https://api.dingtalk.com/v1.0/innerApi/robot/stream/away/template/update"
         logo = await self._file2mediaId(logo)
         card_data = {
@@ -1950,11 +2272,7 @@ class Dingtalk:
                 raise err_reason[res_json.get("errcode")](res_json)
             res.mediaId = res_json['media_id']
             if self.config.useDatabase:
-                cache.execute(
-                    "INSERT INTO file (sha256, mediaId) VALUES (?,?)",
-                    (file_hash, res.mediaId)
-                )
-                cache.commit()
+                cache.upsert("file", "sha256", {"sha256": file_hash, "mediaId": res.mediaId})
             else:
                 self.media_id_cache[file_hash] = res.mediaId
         else:
@@ -2028,16 +2346,25 @@ class Dingtalk:
 
     @property
     def access_token(self) -> str:
-        """当前企业的AccessToken, 会在调用时自动更新"""
+        """当前企业已缓存的AccessToken，由 `tokenManager` 在后台提前刷新
+
+        Notes:
+            不会发起请求。还未获取或已过期时抛出 ValueError，需要确保可用时请使用 `await get_access_token()`
+        """
         if self._access_token:
-            # return self._access_token.token
-            return self._access_token.safe()
-        else:
-            if self._access_token is None or not self._access_token.appKey or not self._access_token.appSecret:
-                self._access_token = get_token(self.config.bot.appKey, self.config.bot.appSecret)
-            else:
-                self._access_token.refresh()
             return self._access_token.token
+        raise ValueError("AccessToken is not fetched yet or has expired, use `await get_access_token()` instead")
+
+    async def get_access_token(self) -> str:
+        """获取当前企业的AccessToken，过期时异步刷新，同一个AppKey同时只会刷新一次
+
+        Returns:
+            str
+        """
+        if self._access_token is None:
+            self._access_token = self.tokenManager.register(
+                get_token(self.config.bot.appKey, self.config.bot.appSecret))
+        return (await self.tokenManager.get(self._access_token)).token
 
     @contextmanager
     def with_access_token(self, access_token: AccessToken):
@@ -2053,7 +2380,7 @@ class Dingtalk:
             None
 
         """
-        raw_access_token = copy.deepcopy(self._access_token)
+        raw_access_token = self._access_token
         self._access_token = access_token
         self.api_request.app = self
         self.oapi_request.app = self
@@ -2065,11 +2392,44 @@ class Dingtalk:
     @property
     def clientSession(self) -> ClientSession:
         """始终返回活动的ClientSession, 避免误操作造成关闭"""
-        if self._clientSession.closed:
+        if self._clientSession is None:
+            self._clientSession = self._new_client_session()
+        elif self._clientSession.closed:
             logger.warning(f"ClientSession 实例已经关闭, 正在重启")
-            self._clientSession = ClientSession()
+            self._clientSession = self._new_client_session()
         return self._clientSession
 
+    @staticmethod
+    async def _on_request_headers_sent(_, context, __):
+        """按顺序并行发送消息时，请求头发出后允许发送下一条消息"""
+        accepted = (context.trace_request_ctx or {}).get("sendAccepted")
+        if accepted is not None:
+            accepted.set()
+
+    def _new_client_session(self) -> ClientSession:
+        """按照配置创建带有连接池的ClientSession，并设置为全局共享的ClientSession"""
+        httpClient = self.config.httpClient
+        connector = TCPConnector(
+            limit=httpClient.limit,
+            limit_per_host=httpClient.limitPerHost,
+            keepalive_timeout=httpClient.keepaliveTimeout,
+            ttl_dns_cache=httpClient.dnsCacheTime
+        )
+        timeout = ClientTimeout(
+            total=httpClient.totalTimeout,
+            sock_connect=httpClient.connectTimeout,
+            sock_read=httpClient.readTimeout
+        )
+        traceConfig = TraceConfig()
+        traceConfig.on_request_headers_sent.append(self._on_request_headers_sent)
+        session = ClientSession(connector=connector, timeout=timeout, trace_configs=[traceConfig])
+        set_client_session(session, ClientTimeout(
+            total=None,
+            sock_connect=httpClient.connectTimeout,
+            sock_read=httpClient.streamReadTimeout
+        ))
+        return session
+
     channel = Channel.current()
     callbacks = []
 
@@ -2114,14 +2474,17 @@ class Dingtalk:
                 try:
                     userStaffId = data.get("senderStaffId")
                     if userStaffId:
-                        if cache.value_exist("user_info", "staffId", userStaffId):
-                            cache.execute("UPDATE user_info SET `name`=?, id=? WHERE staffId=?",
-                                          (member.name, member.id, member.staffId))
-                            cache.commit()
-                        else:
-                            cache.execute("INSERT INTO user_info VALUES (?,?,?,'','{}', ?)",
-                                          (member.id, member.name, member.staffId, time.time()))
-                            cache.commit()
+                        timeStamp = event_timestamp(data)
+                        cache.upsert("user_info", "staffId", {
+                            "id"       : member.id,
+                            "name"     : member.name,
+                            "staffId"  : member.staffId,
+                            "unionId"  : '',
+                            "info"     : '{}',
+                            "timeStamp": timeStamp
+                        }, update_columns=("name", "id", "timeStamp"), invalidate=cache.info_changed(
+                            "user_info", "staffId", member.staffId, {"name": member.name, "id": member.id},
+                            timeStamp=timeStamp), newer_only=True)
                 except Exception as err:
                     if is_debug:
                         logger.exception(err)
@@ -2173,12 +2536,11 @@ class Dingtalk:
                     message = MessageChain(mes)
                 message.trace_id = traceId
                 if group.name != "Unknown" and group.name:
-                    logger.info(
-                        f"[RECV][{group.name}({group.id})] {member.name}({member.id}) -> {repr(str(message))[1:-1]}",
-                                _inspect=['', '', ''])
+                    logger.info(LazyMessage(lambda: f"[RECV][{group.name}({group.id})] {member.name}({member.id}) -> "
+                                                    f"{repr(str(message))[1:-1]}"), _inspect=['', '', ''])
                 else:
-                    logger.info(f"[RECV][{member.name}({member.id})] -> {repr(str(message))[1:-1]}",
-                                _inspect=['', '', ''])
+                    logger.info(LazyMessage(lambda: f"[RECV][{member.name}({member.id})] -> "
+                                                    f"{repr(str(message))[1:-1]}"), _inspect=['', '', ''])
                 event = MessageEvent(data.get('msgtype'), data.get('msgId'), data.get('isInAtList'), message, group,
                                      member)
                 if traceId not in self.message_trace_id:
@@ -2280,7 +2642,7 @@ class Dingtalk:
                 "returns"   : ""
             }
         elif data.get("type", "") == "actionCallback":  # TODO 卡片事件创建
-            self.cardInstanceCallBack[data["outTrackId"]] = data
+            self.cardInstanceCallBack.publish(data)
             return {
                 "success"   : False,
                 "send_data" : [],
@@ -2335,6 +2697,26 @@ class Dingtalk:
                 "returns"   : ""
             }
 
+    @logger.catch
+    async def receive_data(self, request: web.Request):
+        """HTTP模式下接收回调的路由
+
+        Args:
+            request: 钉钉推送的回调请求
+
+        Returns:
+            web.Response
+        """
+        if "{" not in await request.text():
+            return web.Response(text="Invalid request body", status=400)
+        res = await self.bcc(await request.json())
+        if res:
+            if isinstance(res, dict):
+                return web.json_response(res)
+            else:
+                return web.Response(body=res)
+        return None
+
     @classmethod
     def get_sign(cls, secure_key: str = None):
         if secure_key is None:
@@ -2354,42 +2736,52 @@ class Dingtalk:
         return cache.get_api_counts()
 
     class _api_request:
+        host = DINGTALK_API
 
         def __init__(self, clientSession: ClientSession, app: "Dingtalk"):
             self.clientSession = clientSession
             self.app = app
 
-        @property
-        def access_token(self):
-            return self.app.access_token
-
-        async def get(self, urlPath, *, headers=None, **kwargs) -> ClientResponse:
-            headers = self._header_resolve(headers)
+        async def get_access_token(self) -> str:
+            return await self.app.get_access_token()
+
+        async def request(
+                self, method: str, urlPath: str, *, headers=None,
+                retryPolicy: Union[RetryPolicy, bool] = None, idempotent: bool = None, rateLimitRetry: bool = True,
+                **kwargs
+        ) -> ClientResponse:
+            """发送请求
+
+            Args:
+                method: 请求方法
+                urlPath: 接口路径或完整的地址
+                headers: 请求头
+                retryPolicy: 本次请求的重试策略，为False时不重试，为None时使用 `Config.retryPolicy`
+                idempotent: 请求是否幂等，为None时按重试策略判断
+                rateLimitRetry: 触发钉钉的限流时是否等待后重试，调用方自行处理限流时设为False
+                **kwargs: 传入 `ClientSession.request` 的参数
+
+            Returns:
+                ClientResponse
+            """
+            headers = await self._header_resolve(headers)
             await self.before_request(urlPath=urlPath, headers=headers, kwargs=kwargs)
-            resp = await self.clientSession.get(self._url_resolve(urlPath), headers=headers, **kwargs)
+            resp = await self._send(method, self._url_resolve(urlPath), retryPolicy, idempotent, rateLimitRetry,
+                                    headers=headers, **kwargs)
             await self.after_request(resp)
             return resp
 
+        async def get(self, urlPath, *, headers=None, **kwargs) -> ClientResponse:
+            return await self.request("GET", urlPath, headers=headers, **kwargs)
+
         async def post(self, urlPath, *, headers=None, **kwargs) -> ClientResponse:
-            headers = self._header_resolve(headers)
-            await self.before_request(urlPath=urlPath, headers=headers, kwargs=kwargs)
-            resp = await self.clientSession.post(self._url_resolve(urlPath), headers=headers, **kwargs)
-            await self.after_request(resp)
-            return resp
+            return await self.request("POST", urlPath, headers=headers, **kwargs)
 
         async def put(self, urlPath, *, headers=None, **kwargs) -> ClientResponse:
-            headers = self._header_resolve(headers)
-            await self.before_request(urlPath=urlPath, headers=headers, kwargs=kwargs)
-            resp = await self.clientSession.put(self._url_resolve(urlPath), headers=headers, **kwargs)
-            await self.after_request(resp)
-            return resp
+            return await self.request("PUT", urlPath, headers=headers, **kwargs)
 
         async def delete(self, urlPath, *, headers=None, **kwargs) -> ClientResponse:
-            headers = self._header_resolve(headers)
-            await self.before_request(urlPath=urlPath, headers=headers, kwargs=kwargs)
-            resp = await self.clientSession.delete(self._url_resolve(urlPath), headers=headers, **kwargs)
-            await self.after_request(resp)
-            return resp
+            return await self.request("DELETE", urlPath, headers=headers, **kwargs)
 
         async def jget(self, urlPath, *, headers=None, **kwargs) -> dict:
             resp = await self.get(urlPath=urlPath, headers=headers, **kwargs)
@@ -2407,18 +2799,87 @@ class Dingtalk:
             resp = await self.delete(urlPath=urlPath, headers=headers, **kwargs)
             return await resp.json()
 
-        @staticmethod
-        def _url_resolve(urlPath: str) -> str:
+        async def _send(
+                self, method: str, url: str, retryPolicy: Union[RetryPolicy, bool] = None, idempotent: bool = None,
+                rateLimitRetry: bool = True, **kwargs
+        ) -> ClientResponse:
+            """经过限流发送请求
+
+            Notes:
+                触发钉钉的限流时等待后重试。幂等的请求在超时、连接错误和5xx时按重试策略重试，
+                并在耗时过长时发出对冲请求
+            """
+            retrier: Retrier = self.app.retrier
+            appKey = self.app._access_token.appKey if self.app._access_token else None  # NOQA
+            parts = urllib.parse.urlsplit(url)
+            path = parts.path
+            data = kwargs.get("data")
+            resendable = data is None or isinstance(data, (bytes, str, dict))
+            policy = retrier.resolve(retryPolicy)
+            if not resendable or not retrier.is_idempotent(policy, method, kwargs, idempotent):
+                policy = None
+            start = time.perf_counter()
+            try:
+                resp = await self._send_with_retry(method, url, path, appKey, policy, resendable, rateLimitRetry,
+                                                   **kwargs)
+            except Exception as err:
+                if registry.enabled:
+                    API_RESPONSES.inc(path, err.__class__.__name__)
+                raise
+            if registry.enabled:
+                API_REQUEST_SECONDS.observe(time.perf_counter() - start, parts.netloc, path)
+                API_RESPONSES.inc(path, str(resp.status))
+            return resp
+
+        async def _send_with_retry(
+                self, method: str, url: str, path: str, appKey: Optional[str], policy: Optional[RetryPolicy],
+                resendable: bool, rateLimitRetry: bool = True, **kwargs
+        ) -> ClientResponse:
+            limiter: RateLimiter = self.app.rateLimiter
+            retrier: Retrier = self.app.retrier
+
+            def can_hedge() -> bool:
+                bucket = limiter.bucket(appKey, path) if limiter.options.enabled else None
+                return bucket is None or bucket.try_acquire()
+
+            limitedAttempt = 0
+            attempt = 0
+            while True:
+                await limiter.acquire(appKey, path)
+                try:
+                    resp = await retrier.send(
+                        lambda: self.clientSession.request(method, url, **kwargs), path, policy, can_hedge
+                    )
+                except (asyncio.TimeoutError, ClientConnectionError) as err:
+                    if policy is None or not policy.retryOnTimeout or not retrier.can_retry(policy, attempt):
+                        raise
+                    await retrier.wait(policy, attempt, path, err.__class__.__name__)
+                    attempt += 1
+                    continue
+                delay = await limiter.check(resp, limitedAttempt, resendable and rateLimitRetry)
+                if delay is not None:
+                    resp.release()
+                    limitedAttempt += 1
+                    await asyncio.sleep(delay)
+                    continue
+                if policy is not None and resp.status in policy.retryStatuses and retrier.can_retry(policy, attempt):
+                    resp.release()
+                    await retrier.wait(policy, attempt, path, f"HTTP {resp.status}")
+                    attempt += 1
+                    continue
+                return resp
+
+        def _url_resolve(self, urlPath: str) -> str:
             if "http" not in urlPath and not urlPath.startswith('/'):
                 urlPath = '/' + urlPath
-            url = ("https://api.dingtalk.com" + urlPath) if "https" not in urlPath else urlPath
+            url = (self.host + urlPath) if "https" not in urlPath else urlPath
             return url
 
-        def _header_resolve(self, headers: dict) -> dict:
+        async def _header_resolve(self, headers: dict) -> dict:
             if headers is None:
                 headers = {}
             if "x-acs-dingtalk-access-token" not in headers:
-                headers["x-acs-dingtalk-access-token"] = self.access_token
+                headers["x-acs-dingtalk-access-token"] = await self.app.get_access_token()
             return headers
 
         @staticmethod
@@ -2434,6 +2895,8 @@ class Dingtalk:
                     if response.headers.get("Content-Type", "").startswith("application/json"):
                         resp = await response.json()
                         err_code = resp.get("errcode", resp.get("code"))
+                        if err_code and registry.enabled:
+                            API_ERRORS.inc(response.url.path, str(err_code))
                         if err_code or not response.ok:
                             if self.app.config.raiseForApiError:
                                 raise err_reason[err_code](resp)
@@ -2446,39 +2909,31 @@ class Dingtalk:
             except Exception as e:
                 logger.exception(f"在处理 {response.url} 的返回时发生异常。返回体: {await response.text()}", e)
 
-    class _oapi_request:
-
-        def __init__(self, clientSession: ClientSession, app: "Dingtalk"):
-            self.clientSession = clientSession
-            self.app = app
-
-        @property
-        def access_token(self):
-            return self.app.access_token
+    class _oapi_request(_api_request):
+        host = DINGTALK_OAPI
 
-        async def get(self, urlPath: str, **kwargs) -> ClientResponse:
+        async def request(
+                self, method: str, urlPath: str, *,
+                retryPolicy: Union[RetryPolicy, bool] = None, idempotent: bool = None, rateLimitRetry: bool = True,
+                **kwargs
+        ) -> ClientResponse:
             await self.before_request(urlPath=urlPath, kwargs=kwargs)
-            resp = await self.clientSession.get(self._url_resolve(urlPath), **kwargs)
+            resp = await self._send(method, await self._url_resolve(urlPath), retryPolicy, idempotent, rateLimitRetry,
+                                    **kwargs)
             await self.after_request(resp)
             return resp
 
+        async def get(self, urlPath: str, **kwargs) -> ClientResponse:
+            return await self.request("GET", urlPath, **kwargs)
+
         async def post(self, urlPath, **kwargs) -> ClientResponse:
-            await self.before_request(urlPath=urlPath, kwargs=kwargs)
-            resp = await self.clientSession.post(self._url_resolve(urlPath), **kwargs)
-            await self.after_request(resp)
-            return resp
+            return await self.request("POST", urlPath, **kwargs)
 
         async def put(self, urlPath, **kwargs) -> ClientResponse:
-            await self.before_request(urlPath=urlPath, kwargs=kwargs)
-            resp = await self.clientSession.put(self._url_resolve(urlPath), **kwargs)
-            await self.after_request(resp)
-            return resp
+            return await self.request("PUT", urlPath, **kwargs)
 
         async def delete(self, urlPath, **kwargs) -> ClientResponse:
-            await self.before_request(urlPath=urlPath, kwargs=kwargs)
-            resp = await self.clientSession.delete(self._url_resolve(urlPath), **kwargs)
-            await self.after_request(resp)
-            return resp
+            return await self.request("DELETE", urlPath, **kwargs)
 
         async def jget(self, urlPath, **kwargs) -> dict:
             resp = await self.get(urlPath=urlPath, **kwargs)
@@ -2496,14 +2951,14 @@ class Dingtalk:
             resp = await self.delete(urlPath=urlPath, **kwargs)
             return await resp.json()
 
-        def _url_resolve(self, urlPath: str):
+        async def _url_resolve(self, urlPath: str):
             if "http" not in urlPath and not urlPath.startswith('/'):
                 urlPath = '/' + urlPath
-            url = ("https://oapi.dingtalk.com" + urlPath) if "https" not in urlPath else urlPath
+            url = (self.host + urlPath) if "https" not in urlPath else urlPath
             if '?' not in url:
-                url += f"?access_token={self.access_token}"
+                url += f"?access_token={await self.app.get_access_token()}"
             elif '?' in url and 'access_token' not in url:
-                url += f"&access_token={self.access_token}"
+                url += f"&access_token={await self.app.get_access_token()}"
             return url
 
         @staticmethod
@@ -2513,36 +2968,38 @@ class Dingtalk:
             except Exception as e:
                 logger.exception(f"在处理 {urlPath} 的请求时发生异常。请求参数: {kwargs}", e)
 
-        async def after_request(self, response: ClientResponse):
-            try:
-                try:
-                    if response.headers.get("Content-Type", "").startswith("application/json"):
-                        resp = await response.json()
-                        err_code = resp.get("errcode", resp.get("code"))
-                        if err_code or not response.ok:
-                            if self.app.config.raiseForApiError:
-                                raise err_reason[err_code](resp)
-                    if response.ok:
-                        cache.add_openapi_count()
-                except json.JSONDecodeError:
-                    pass
-            except DingtalkAPIError as err:
-                raise err
-            except Exception as e:
-                logger.exception(f"在处理 {response.url} 的返回时发生异常。返回体: {await response.text()}", e)
-
-    def start(self, port: int = None, routes: List[web.RouteDef] = None, host: str = None):
+    def start(self, port: int = None, routes: List[web.RouteDef] = None, host: str = None, workers: int = None):
         """
 
+        Notes:
+            `workers` 大于1时会fork出多个子进程，每个子进程负责一部分Stream (进程数多于Stream数时为同一应用建立额外的连接)，
+            HTTP服务只在第一个子进程中运行。所有进程共用WAL模式的数据库缓存，任意进程调用 `stop` 时所有进程都会停止。
+            Stream消息的去重只在各个进程内进行，同一条消息被推送到不同进程的连接时不会被识别为重复。
+            运行指标会合并所有进程的值后导出，各进程的 `InfoCache` 缓存时间会被缩短以减少读取到其他进程写入前的旧数据。
+            仅支持可以fork的平台
+
         Args:
             port: 启动端口
             routes: 路由列表
             host: 入口地址 (如果要使用认证登陆则需要填写)
+            workers: 处理Stream的进程数，为None或1时在当前进程中运行
 
         Returns:
             None
 
         """
+        if workers and workers > 1 and self.worker is None:
+            if not fork_supported():
+                logger.warning("Multi-process mode requires fork, running in a single process")
+            elif not self.config.stream:
+                logger.warning("Multi-process mode requires at least one Stream, running in a single process")
+            else:
+                self.workerSupervisor = WorkerSupervisor(self, workers)
+                try:
+                    self.workerSupervisor.run(port=port, routes=routes, host=host)
+                finally:
+                    logger.info(i18n.DingraiaExitedText)
+                return
         try:
             asyncio.run(self._start(port=port, routes=routes, host=host))
         except KeyboardInterrupt:
@@ -2552,6 +3009,8 @@ class Dingtalk:
 
     async def _start(self, port: int = None, routes: List[web.RouteDef] = None, host: str = None):
         self.running_status = "Starting"
+        if self.stallMonitor is not None:
+            self.stallMonitor.start(asyncio.get_running_loop())
         self.http_routes += [
             web.get("/login/checkStatus", self.check_login_status),
             web.get("/oauth_login", self.oauth_login)
@@ -2573,12 +3032,14 @@ class Dingtalk:
                 raise ValueError(f"路由列表中存在非web.RouteDef类型对象: {repr(r)}")
         Channel().set_channel()
         Saya().set_channel()
-        self._clientSession = ClientSession()
-        self._start_topic()
+        self._clientSession = self._new_client_session()
+        if self.worker is None or self.worker.index == 0:
+            self._start_topic()
         logger.info(i18n.DingraiaPreparingLoadingText)
         if isinstance(self.config, Config):
             if self.config.bot:
-                self._access_token = get_token(self.config.bot.appKey, self.config.bot.appSecret)
+                self._access_token = self.tokenManager.register(
+                    get_token(self.config.bot.appKey, self.config.bot.appSecret))
             if self.config.stream:
                 self._running_mode.append("Stream")
                 logger.info(
@@ -2592,68 +3053,96 @@ class Dingtalk:
         async def default_page(_) -> web.Response:
             return web.Response(text=HTTP_DEFAULT_PAGE, content_type='text/html')
 
-        @logger.catch
-        async def receive_data(request: web.Request):
-            if "{" not in await request.text():
-                return web.Response(text="Invalid request body", status=400)
-            res = await self.bcc(await request.json())
-            if res:
-                if isinstance(res, dict):
-                    return web.json_response(res)
-                else:
-                    return web.Response(body=res)
-            return None
-
         all_routes = [
-                         web.post('/', receive_data),
+                         web.post('/', self.receive_data),
                          web.get('/', default_page)
                      ] + routes + self.http_routes
+        if self.config.metrics.enabled and self.config.metrics.path:
+            all_routes.append(web.get(self.config.metrics.path, self.metrics_page))
         self._check_route_conflict(all_routes)
         if port:
             urlLogger = logger.switch_logger(2)
             self._running_mode.append("HTTP")
 
+            accessLog = self.config.accessLog if isinstance(self.config, Config) else AccessLog()
+            uaPolicy = 'all' if is_debug else accessLog.uaPolicy
+            console = accessLog.console
+            sampleRate = accessLog.sampleRate
+            if self.accessLogWriter is not None:
+                await asyncio.get_running_loop().run_in_executor(None, self.accessLogWriter.close)
+                self.accessLogWriter = None
+            if accessLog.file:
+                self.accessLogWriter = AccessLogWriter(accessLog.file, accessLog.flushInterval, accessLog.maxQueue)
+                self.accessLogWriter.start()
+            writer = self.accessLogWriter
+
+            def write_access_log(request: web.Request, clientIp: str, ua: str, status: int, size: Optional[int],
+                                 handle_time: Optional[float], error: str = None):
+                writer.write({
+                    "time"    : time.time(),
+                    "ip"      : clientIp,
+                    "method"  : request.method,
+                    "path"    : request.path,
+                    "query"   : request.query_string,
+                    "version" : f"{request.version.major}.{request.version.minor}",
+                    "status"  : status,
+                    "size"    : size,
+                    "ua"      : ua,
+                    "duration": handle_time,
+                    "error"   : error,
+                })
+
             async def access_logger(_, handler):
                 async def server_log(request: web.Request):
                     clientIp = request.headers.get("CF-Connecting-IP", request.headers.get("X-Real-IP", request.remote))
                     ua = request.headers.get('User-Agent', '-')
                     http_version = f"HTTP/{request.version.major}.{request.version.minor}"
                     req_path = (request.path + "?" + request.query_string) if request.query_string else request.path
-                    if is_debug:
-                        check_ua = await self.ua_checker(ua, 'all')
-                    else:
-                        # check_ua = await self.ua_checker(ua, 'dingtalk-user')
-                        check_ua = await self.ua_checker(ua, 'all')
+                    check_ua = check_ua_policy(ua, uaPolicy)
                     if check_ua is not None:
-                        urlLogger.warning(
-                            f"{clientIp} {request.method} {req_path} {http_version} "
-                            f"{check_ua.status} {repr(ua)} Denied")
+                        if console:
+                            urlLogger.warning(lambda: f"{clientIp} {request.method} {req_path} {http_version} "
+                                                      f"{check_ua.status} {repr(ua)} Denied")
+                        if writer is not None:
+                            write_access_log(request, clientIp, ua, check_ua.status, None, None, "Denied")
                         return check_ua
                     handle_start_time = time.perf_counter()
                     try:
                         response = await handler(request)
                         handle_time = time.perf_counter() - handle_start_time
                         if isinstance(response, web.Response):
+                            size = (request.content_length or 0) + (response.content_length or 0)
                             if response.status < 400:
-                                urlLogger.info(
-                                    f"{clientIp} {request.method} {response.status} {req_path} {http_version} "
-                                    f"{(request.content_length or 0) + (response.content_length or 0)} "
-                                    f"{repr(ua)} {format_time(handle_time)}")
-                            else:
+                                if sampleRate < 1 and random.random() >= sampleRate:
+                                    return response
+                                if console:
+                                    urlLogger.info(
+                                        lambda: f"{clientIp} {request.method} {response.status} {req_path} "
+                                                f"{http_version} {size} {repr(ua)} {format_time(handle_time)}")
+                            elif console:
                                 urlLogger.error(
-                                    f"{clientIp} {request.method} {response.status} {req_path} {http_version} "
-                                    f"{(request.content_length or 0) + (response.content_length or 0)} "
-                                    f"{repr(ua)} {format_time(handle_time)}")
+                                    lambda: f"{clientIp} {request.method} {response.status} {req_path} {http_version} "
+                                            f"{size} {repr(ua)} {format_time(handle_time)}")
+                            if writer is not None:
+                                write_access_log(request, clientIp, ua, response.status, size, handle_time)
                             return response
-                        urlLogger.error(
-                            f"{clientIp} {request.method} 500 {req_path} {http_version} "
-                            f"Invalid response type: {type(response).__name__} {repr(ua)} {format_time(handle_time)}")
+                        if console:
+                            urlLogger.error(
+                                f"{clientIp} {request.method} 500 {req_path} {http_version} "
+                                f"Invalid response type: {type(response).__name__} {repr(ua)} {format_time(handle_time)}")
+                        if writer is not None:
+                            write_access_log(request, clientIp, ua, 500, None, handle_time,
+                                             f"Invalid response type: {type(response).__name__}")
                         return web.Response(text=HTTP_INVALID_RESPONSE_PAGE, content_type='text/html', status=500)
                     except web.HTTPException as http_err:
                         handle_time = time.perf_counter() - handle_start_time
-                        urlLogger.error(
-                            f"{clientIp} {request.method} {req_path} {http_version} "
-                            f"{http_err.status_code} {http_err.reason} \"{ua}\" {format_time(handle_time)}")
+                        if console:
+                            urlLogger.error(
+                                f"{clientIp} {request.method} {req_path} {http_version} "
+                                f"{http_err.status_code} {http_err.reason} \"{ua}\" {format_time(handle_time)}")
+                        if writer is not None:
+                            write_access_log(request, clientIp, ua, http_err.status_code, None, handle_time,
+                                             http_err.reason)
                         if http_err.status_code == 404:
                             return web.Response(text=HTTP_404_PAGE, content_type='text/html', status=404)
                         elif http_err.status_code == 405:
@@ -2663,9 +3152,13 @@ class Dingtalk:
                         return web.Response(status=http_err.status_code)
                     except Exception as err:
                         handle_time = time.perf_counter() - handle_start_time
-                        urlLogger.exception(
-                            f"{clientIp} {request.method} 500 {req_path} {http_version} "
-                            f"{err.__class__.__name__}: {err} {repr(ua)} {format_time(handle_time)}")
+                        if console:
+                            urlLogger.exception(
+                                f"{clientIp} {request.method} 500 {req_path} {http_version} "
+                                f"{err.__class__.__name__}: {err} {repr(ua)} {format_time(handle_time)}")
+                        if writer is not None:
+                            write_access_log(request, clientIp, ua, 500, None, handle_time,
+                                             f"{err.__class__.__name__}: {err}")
                         return web.Response(text=HTTP_500_PAGE, content_type='text/html')
 
                 return server_log
@@ -2699,6 +3192,8 @@ class Dingtalk:
                 signal.signal(signal.SIGINT, lambda sig, frame: self.stop_for_signal())
         await channel.radio(LoadComplete, self, async_await=True)
         self.running_status = "Running"
+        if self.worker is not None:
+            self.create_task(self.worker.run(self), name="WorkerReporter", show_info=False)
         logger.info(i18n.DingraiaLoadCompleteText)
         if not self.loop.is_running():
             self.loop.run_forever()
@@ -2723,10 +3218,11 @@ class Dingtalk:
             if not self.app._loop:
                 self.app._loop = asyncio.new_event_loop()
                 asyncio.set_event_loop(self.app._loop)
-            self.app._clientSession = ClientSession(loop=self.app._loop)
+            self.app._clientSession = self.app._new_client_session()
             if self.app.config:
                 if self.app.config.bot:
-                    self.app._access_token = get_token(self.app.config.bot.appKey, self.app.config.bot.appSecret)
+                    self.app._access_token = self.app.tokenManager.register(
+                        get_token(self.app.config.bot.appKey, self.app.config.bot.appSecret))
             self.app.api_request = self.app._api_request(self.app.clientSession, self.app)
             self.app.oapi_request = self.app._oapi_request(self.app.clientSession, self.app)
 
@@ -2838,14 +3334,12 @@ class Dingtalk:
                     http_body = await response.json()
                 except json.JSONDecodeError as err:
                     logger.error(f"{err.__class__.__name__}: {err} Body: {await response.text()}")
-                    await asyncio.sleep(5)
                     return None
             except Exception as err:
                 if is_debug:
                     logger.exception(f"{err.__class__.__name__}: {err}", err)
                 else:
                     logger.error(f"{err.__class__.__name__}: {err}")
-                await asyncio.sleep(5)
                 return None
             if not response.ok:
                 logger.error(f"[{task_name}] Open connection failed, Reason: {response.reason}, Response: {http_body}")
@@ -2856,62 +3350,42 @@ class Dingtalk:
 
                     return False
                 return None
-            accessToken = AccessToken(AppKey=stream.AppKey, AppSecret=stream.AppSecret)
-            accessToken.refresh(True)
-            self._access_token_dict[stream.AppKey] = accessToken
+            accessToken = self.tokenManager.register(AccessToken(AppKey=stream.AppKey, AppSecret=stream.AppSecret))
+            await self.tokenManager.get(accessToken)
             return http_body
 
+        deduplicator = self.stream_checker.get(stream.AppKey)
+        if deduplicator is None:
+            deduplicator = self.stream_checker[stream.AppKey] = EventDeduplicator(
+                maxSize=self.config.streamOptions.dedupSize,
+                ttl=self.config.streamOptions.dedupTTL
+            )
+
         async def route_message(
-                json_message,
+                frame: StreamFrame,
                 websocket: websockets.ClientConnection,
-                task_name: str
+                task_name: str,
+                dispatcher: StreamDispatcher = None
         ):
 
-            async def response(message: dict):
-                if 'data' in message:
-                    if "requestLine" in json.loads(message['data']) and "headers" in json.loads(message['data']):
-                        message = {
-                            'code'   : 200,
-                            'headers': headers,
-                            'message': '',
-                            'data'   : json.dumps({"response": {
-                                'body'      : json.dumps({}),
-                                'headers'   : {'Content-Type': 'application/json'},
-                                'statusLine': {'code': 200, 'reasonPhrase': 'OK'}
-                            }}),
-                        }
-                    else:
-                        message = {
-                            'code'   : 200,
-                            'headers': headers,
-                            'message': 'OK',
-                            'data': message['data'],
-                        }
-                else:
-                    message = {
-                        'code'   : 400,
-                        'headers': headers,
-                        'message': 'Invalid request',
-                        'data'   : {'success': False, 'reason': 'Access denied'},
-                    }
-                await websocket.send(json.dumps(message))
+            async def response():
+                await websocket.send(frame.ack())
+                STREAM_ACK_SECONDS.observe(time.perf_counter() - frame.receivedAt, task_name)
 
             result = ''
             try:
-                msg_type = json_message.get('type', '')
-                headers = json_message.get('headers', {})
-                data = json.loads(json_message.get('data', "{}"))
+                msg_type = frame.type
+                headers = frame.headers
+                STREAM_FRAMES.inc(task_name, msg_type)
                 topic = headers.get('topic', '')
-                if task_name not in self.stream_checker:
-                    self.stream_checker[task_name] = collections.deque([], 50)
-                    self.stream_checker[task_name].append(headers.get('eventId', str(time.time())))
-                elif headers.get('eventId', str(time.time())) in self.stream_checker[task_name]:
-                    if is_debug:
-                        logger.warning(f"Same Callback. ID:{headers.get('eventId', str(time.time()))}")
-
-                    return result
-                else:
-                    self.stream_checker[task_name].append(headers.get('eventId', str(time.time())))
+                if msg_type != 'SYSTEM':
+                    eventId = headers.get('eventId') or headers.get('messageId')
+                    if deduplicator.seen(eventId):
+                        if is_debug:
+                            logger.warning(f"Same Callback. ID:{eventId}")
+                        await response()
+                        return result
+                    self.stream_received[task_name] = self.stream_received.get(task_name, 0) + 1
                 if msg_type == 'SYSTEM':
                     if topic == 'disconnect':
                         result = 'disconnect'
@@ -2920,101 +3394,181 @@ class Dingtalk:
                     else:
                         logger.info(f"[{task_name}] [System] {topic}")
                     headers['topic'] = "pong"
-                    await response(json_message)
+                    await response()
                 else:
                     if is_debug:
-                        logger.debug(f"[{task_name}] " + json.dumps(json_message, indent=4, ensure_ascii=False))
+                        logger.debug(f"[{task_name}] " + json.dumps(frame.message, indent=4, ensure_ascii=False))
+                    data = frame.data
                     if 'eventType' in headers:
                         data['EventType'] = headers['eventType']
                     data['corpId'] = headers.get('eventCorpId')
-                    await self.bcc(data)
-                    await response(json_message)
+                    if dispatcher is not None:
+                        if dispatcher.closed:
+                            return result
+                        await response()
+                        await dispatcher.submit(conversation_key(data), self.bcc, data)
+                    else:
+                        await self.bcc(data)
+                        await response()
             except Exception as err:
                 logger.exception(f"[{task_name}] Error happened while handing the message", err)
             return result
 
-        async def main_stream(task_name: str):
-            while not exit_signal:
+        async def request_connection(task_name: str):
+            if not self.stream_connect:
+                return await open_connection(task_name)
+            key = self.config.bot.appKey
+            secret = self.config.bot.appSecret
+            if self.stream_connect.SignHandler:
                 try:
-                    if not self.stream_connect:
-                        connection = await open_connection(task_name)
-                    else:
-                        key = self.config.bot.appKey
-                        secret = self.config.bot.appSecret
-                        if self.stream_connect.SignHandler:
-                            try:
-                                if inspect.iscoroutinefunction(self.stream_connect.SignHandler):
-                                    if isinstance(self.stream_connect.SignHandler, str):
-                                        connection = {"endpoint": "Pass", "ticket": "Pass"}
-                                        # 你问我为什么要加上这句看起来没什么用的代码？因为我的IDE抽风识别不了这是异步函数一直报Warning
-                                    else:
-                                        connection = await self.stream_connect.SignHandler(key, secret)
-                                elif inspect.isfunction(self.stream_connect.SignHandler):
-                                    connection = self.stream_connect.SignHandler(key, secret)
-                                elif isinstance(self.stream_connect.SignHandler, str):
-                                    if "http" not in self.stream_connect.SignHandler:
-                                        raise ValueError(f"Incorrect signer url, consider use None to skip sign")
-                                    connection = await open_connection(task_name, self.stream_connect.SignHandler)
-                                else:
-                                    raise ValueError(f"Incorrect signer param, consider use None to skip sign")
-                            except:  # NOQA
-                                logger.exception("Error while signing the connection")
-                                logger.warning("Please restart the program to retry.")
-                                return
-                        else:
+                    if inspect.iscoroutinefunction(self.stream_connect.SignHandler):
+                        if isinstance(self.stream_connect.SignHandler, str):
                             connection = {"endpoint": "Pass", "ticket": "Pass"}
-                except Exception as err:
+                            # 你问我为什么要加上这句看起来没什么用的代码？因为我的IDE抽风识别不了这是异步函数一直报Warning
+                        else:
+                            connection = await self.stream_connect.SignHandler(key, secret)
+                    elif inspect.isfunction(self.stream_connect.SignHandler):
+                        connection = self.stream_connect.SignHandler(key, secret)
+                    elif isinstance(self.stream_connect.SignHandler, str):
+                        if "http" not in self.stream_connect.SignHandler:
+                            raise ValueError(f"Incorrect signer url, consider use None to skip sign")
+                        connection = await open_connection(task_name, self.stream_connect.SignHandler)
+                    else:
+                        raise ValueError(f"Incorrect signer param, consider use None to skip sign")
+                except:  # NOQA
+                    logger.exception("Error while signing the connection")
+                    logger.warning("Please restart the program to retry.")
+                    return False
+            else:
+                connection = {"endpoint": "Pass", "ticket": "Pass"}
+            return connection
+
+        async def connect_websocket(task_name: str) -> Union[websockets.ClientConnection, None, bool]:
+            """建立Stream连接，返回None时需要重试，返回False时停止"""
+            try:
+                connection = await request_connection(task_name)
+            except Exception as err:
+                logger.exception(err)
+                connection = None
+            if not connection:
+                if connection is None:
+                    logger.error(f'[{task_name}] Open websocket connection failed')
+                    return None
+                logger.error(f'[{task_name}] Request connection failed!')
+                return False
+            uri = '%s?ticket=%s' % (connection['endpoint'], urllib.parse.quote_plus(connection['ticket']))
+            headers = {'User-Agent': f'Dingraia/{VERSION} (+https://github.com/MeiHuaGuangShuo/Dingraia)'}
+            if self.stream_connect:
+                if self.stream_connect.StreamUrl:
+                    uri = self.stream_connect.StreamUrl
+                if self.stream_connect.ExtraHeaders:
+                    headers.update(self.stream_connect.ExtraHeaders)
+            if "?" not in uri:
+                uri = f"{uri}?ticket={urllib.parse.quote_plus(connection['ticket'])}"
+            else:
+                if "ticket" not in uri:
+                    uri = f"{uri}&ticket={urllib.parse.quote_plus(connection['ticket'])}"
+            try:
+                websocket = await websockets.connect(uri, additional_headers=headers)
+            except Exception as err:
+                if is_debug:
                     logger.exception(err)
-                    connection = None
-
-                if not connection:
-                    if connection is None:
-                        logger.error(f'[{task_name}] Open websocket connection failed')
-                        logger.warning(f"[{task_name}] Websocket Connection will be reconnected after 5 seconds")
-                        time.sleep(5)
-                        logger.warning(f"[{task_name}] Reconnecting...")
+                else:
+                    logger.error(f"{err.__class__.__name__}: {err}")
+                return None
+            logger.success(i18n.WebsocketConnectedText.format(task_name=task_name))
+            return websocket
+
+        async def receive(websocket: websockets.ClientConnection, task_name: str, dispatcher: StreamDispatcher = None):
+            """读取消息直到连接关闭，服务端要求断开时返回 `disconnect`"""
+            async for raw_message in websocket:
+                if await route_message(StreamFrame.decode(raw_message), websocket, task_name, dispatcher) == "disconnect":
+                    return "disconnect"
+            return ""
+
+        async def drain(websocket: websockets.ClientConnection, task_name: str, dispatcher: StreamDispatcher,
+                        timeout: float):
+            """新连接建立后，旧连接继续接收消息，直到服务端关闭或超时"""
+
+            async def _drain():
+                async for raw_message in websocket:
+                    await route_message(StreamFrame.decode(raw_message), websocket, task_name, dispatcher)
+
+            try:
+                await asyncio.wait_for(_drain(), timeout)
+            except asyncio.TimeoutError:
+                logger.warning(f"[{task_name}] The old connection was not closed by the server in {timeout}s")
+            except asyncio.CancelledError:
+                raise
+            except Exception as err:
+                logger.debug(f"[{task_name}] The old connection was closed -> {err.__class__.__name__}: {err}")
+            finally:
+                await websocket.close()
+
+        async def main_stream(task_name: str):
+            dispatcher = None
+            streamOptions = self.config.streamOptions
+            if streamOptions.maxConcurrency > 0:
+                dispatcher = StreamDispatcher(
+                    maxConcurrency=streamOptions.maxConcurrency,
+                    keepConversationOrder=streamOptions.keepConversationOrder,
+                    name=task_name
+                )
+                self.stream_dispatchers[task_name] = dispatcher
+            backoff = Backoff(
+                baseDelay=streamOptions.reconnectBaseDelay,
+                maxDelay=streamOptions.reconnectMaxDelay,
+                factor=streamOptions.reconnectFactor,
+                jitter=streamOptions.reconnectJitter
+            )
+            draining: Set[asyncio.Task] = set()
+            websocket = None
+            connected = False
+            try:
+                while not exit_signal:
+                    websocket = await connect_websocket(task_name)
+                    if websocket is False:
+                        return
+                    if websocket is None:
+                        delay = backoff.next()
+                        logger.warning(i18n.WebsocketRetryText.format(task_name=task_name, sec=f"{delay:.1f}"))
+                        await asyncio.sleep(delay)
                         continue
-                    if not connection:
-                        logger.error(f'[{task_name}] Request connection failed!')
-                    return
-                uri = '%s?ticket=%s' % (connection['endpoint'], urllib.parse.quote_plus(connection['ticket']))
-                headers = {'User-Agent': f'Dingraia/{VERSION} (+https://github.com/MeiHuaGuangShuo/Dingraia)'}
-                if self.stream_connect:
-                    if self.stream_connect.StreamUrl:
-                        uri = self.stream_connect.StreamUrl
-                    if self.stream_connect.ExtraHeaders:
-                        headers.update(self.stream_connect.ExtraHeaders)
-                if connection:
-                    if "?" not in uri:
-                        uri = f"{uri}?ticket={urllib.parse.quote_plus(connection['ticket'])}"
-                    else:
-                        if "ticket" not in uri:
-                            uri = f"{uri}&ticket={urllib.parse.quote_plus(connection['ticket'])}"
-                try:
-                    async with websockets.connect(uri, additional_headers=headers) as websocket:
-                        logger.success(i18n.WebsocketConnectedText.format(task_name=task_name))
-                        try:
-                            async for raw_message in websocket:
-                                json_message = json.loads(raw_message)
-                                route_result = await route_message(json_message, websocket, task_name)
-                                if route_result == "disconnect":
-                                    break
-                        except asyncio.CancelledError:
-                            logger.warning(i18n.WebsocketClosingText.format(task_name=task_name))
-                            await websocket.close()
-                            break
-                        except Exception as err:
-                            logger.error(f"{err.__class__.__name__}: {err}")
-                            logger.warning(i18n.WebsocketRetryText.format(task_name=task_name, sec=5))
-                            await asyncio.sleep(5)
-                except Exception as err:
-                    if is_debug:
-                        logger.exception(err)
-                    else:
+                    backoff.reset()
+                    if connected:
+                        STREAM_RECONNECTS.inc(task_name)
+                    connected = True
+                    try:
+                        result = await receive(websocket, task_name, dispatcher)
+                    except Exception as err:
                         logger.error(f"{err.__class__.__name__}: {err}")
-                    logger.warning(i18n.WebsocketRetryText.format(task_name=task_name, sec=5))
-                    await asyncio.sleep(5)
-
+                        await websocket.close()
+                        websocket = None
+                        delay = backoff.next()
+                        logger.warning(i18n.WebsocketRetryText.format(task_name=task_name, sec=f"{delay:.1f}"))
+                        await asyncio.sleep(delay)
+                        continue
+                    if result == "disconnect" and streamOptions.standbyOnDisconnect:
+                        logger.info(f"[{task_name}] Opening a standby connection, "
+                                    f"the old one keeps receiving until the server closes it")
+                        task = asyncio.create_task(
+                            drain(websocket, task_name, dispatcher, streamOptions.standbyDrainTimeout),
+                            name=f"{task_name} Drain"
+                        )
+                        draining.add(task)
+                        task.add_done_callback(draining.discard)
+                    else:
+                        await websocket.close()
+                    websocket = None
+            except asyncio.CancelledError:
+                logger.warning(i18n.WebsocketClosingText.format(task_name=task_name))
+            finally:
+                if websocket:
+                    await websocket.close()
+                for task in list(draining):
+                    task.cancel()
+                if draining:
+                    await asyncio.gather(*draining, return_exceptions=True)
             logger.info(i18n.WebSocketClosedText.format(task_name=task_name))
 
         try:
@@ -3076,8 +3630,17 @@ class Dingtalk:
 
     async def stop(self):
         logger.info(i18n.StoppingDingraiaText)
-        channel.onStop = True
+        if self.worker is not None:
+            self.worker.stopEvent.set()
         channelTimeout = time.time() + self.config.waitRadioMessageFinishedTimeout
+        for dispatcher in self.stream_dispatchers.values():
+            dispatcher.close()
+        for task_name, dispatcher in self.stream_dispatchers.items():
+            if dispatcher.pending:
+                remain = await dispatcher.drain(max(channelTimeout - time.time(), 0))
+                if remain:
+                    logger.warning(f"[{task_name}] {remain} stream message(s) were not handled before stopping")
+        channel.onStop = True
         if channel.pendingRadios:
             lastNotFinishedTasks = 0
             logger.info(i18n.WaitRadioMessageFinishedText.format(timeout=self.config.waitRadioMessageFinishedTimeout))
@@ -3092,10 +3655,25 @@ class Dingtalk:
                 await asyncio.sleep(0.5)
             else:
                 logger.warning("Wait timeout, stopped.")
+        if self.profiler is not None and self.config.profiler.dumpOnStop:
+            self.profiler.dump()
+        if cache.writeBehind:
+            await self.loop.run_in_executor(None, cache.flush)
+        await self.tokenManager.stop()
         if isinstance(self._clientSession, ClientSession) and not self._clientSession.closed:
             await self._clientSession.close()
+        set_client_session(None)
         if hasattr(self, '_runner'):
             await self._runner.cleanup()
+        if self.accessLogWriter is not None:
+            await self.loop.run_in_executor(None, self.accessLogWriter.close)
+            self.accessLogWriter = None
+        if self.stallMonitor is not None:
+            self.stallMonitor.stop()
+        STREAM_INFLIGHT.remove_function(self._stream_inflight)
+        if self._metricsAcquired:
+            registry.release()
+            self._metricsAcquired = False
         cancel_timeout = 3.0
         tasks = self.async_tasks
         names = ', '.join([x.get_name() for x in self.async_tasks])
@@ -3116,11 +3694,13 @@ class Dingtalk:
         tasks = [t for t in self.async_tasks if not t.done()]
         for task in tasks:
             task.cancel()
-        done, pending = await asyncio.wait(
-            tasks,
-            timeout=cancel_timeout,
-            return_when=asyncio.ALL_COMPLETED
-        )
+        pending = set()
+        if tasks:
+            done, pending = await asyncio.wait(
+                tasks,
+                timeout=cancel_timeout,
+                return_when=asyncio.ALL_COMPLETED
+            )
         if pending:
             logger.warning(f"强制清理 {len(pending)} 个未及时终止的任务")
             for task in pending:
@@ -3130,6 +3710,8 @@ class Dingtalk:
                 except asyncio.CancelledError:
                     pass
         logger.success(i18n.AllAsyncTasksCancelledSuccessText)
+        if self.worker is not None:
+            self.worker.report(self)
 
     async def coroutine_watcher(self, function, *args, **kwargs):
         stop = False
@@ -3177,39 +3759,26 @@ class Dingtalk:
                         stop = True
                         break
 
+    @property
+    def profiler(self) -> Optional[HandlerProfiler]:
+        """监听函数的耗时统计，未启用时为None"""
+        return Channel.profiler
+
+    def _stream_inflight(self) -> Dict[tuple, int]:
+        return {(name,): dispatcher.pending for name, dispatcher in self.stream_dispatchers.items()}
+
+    async def metrics_page(self, _) -> web.Response:
+        """以Prometheus文本格式导出运行指标，多进程模式下合并其他进程最近发送的指标"""
+        others = self.worker.peerMetrics.values() if self.worker is not None else ()
+        return web.Response(text=self.metrics.render(others), content_type="text/plain", charset="utf-8",
+                            headers={"Cache-Control": "no-store"})
+
     @staticmethod
     async def ua_checker(
             ua: str,
             allow: str = Literal['user', 'dingtalk', 'dingtalk-user', 'all']
     ) -> Union[None, web.Response]:
-        bot_agent = [
-            "PycURL",
-            "HttpClient",
-            "Googlebot",
-            "MJ12bot",
-            "AhrefsBot",
-            "Nessus",
-            "Acunetix",
-            "sqlmap",
-            "HackTool",
-            "Darknet",
-            "http",
-            "python",
-            "WindowsPowerShell",
-            "curl"
-        ]
-        if allow == 'user':
-            if 'Mozilla' not in ua:
-                return web.Response(status=400)
-        elif allow == "dingtalk-user":
-            if "com.alibaba.android.rimet" not in ua and "AliApp" not in ua:
-                return web.Response(status=400)
-        elif allow == "dingtalk":
-            if list(filter(lambda x: x in ua, bot_agent)):
-                return web.Response(status=400)
-            if ua == "-":
-                return web.Response(status=400)
-        return None
+        return check_ua_policy(ua, allow)
 
     def is_send_message(self, traceId: TraceId) -> bool:
         return self.is_message_handled(traceId=traceId, event="send_messages")
@@ -3256,29 +3825,24 @@ class Dingtalk:
                 target = Member(staffId=s_t)
         if isinstance(target, OpenConversationId):
             target = target.openConversationId
+            if not force_to_update:
+                cached = self._get_cached_info(("group_info", "openConversationId", target))
+                if cached is not None:
+                    return cached
             res = cache.execute(f"SELECT * FROM `group_info` WHERE `openConversationId`=?", (target,), result=True)
             if not res and force_to_update:
                 res = ((await self.get_group(target, using_cache=False)), time.time())
             if res:
                 if res[0]:
-                    main_info = res[0][4]
-                    if main_info:
-                        main_info = json.loads(main_info)
-                    else:
-                        main_info = {}
-                    main_info["dingraia_cache"] = {
-                        "id"                : res[0][0],
-                        "chatId"            : res[0][1],
-                        "openConversationId": res[0][2],
-                        "name"              : res[0][3],
-                        "timeStamp"         : res[0][5],
-                        "strfTimeStamp": datetime.datetime.fromtimestamp(res[0][5]).strftime('%Y-%m-%d %H:%M:%S')
-                    }
-                    return main_info, res[0][5]
+                    return self._cache_info_row("group_info", res[0])
             return {}, 0
         elif isinstance(target, Group):
             if target.id:
                 target = target.id
+                if not force_to_update:
+                    cached = self._get_cached_info(("group_info", "id", str(target)))
+                    if cached is not None:
+                        return cached
                 res = cache.execute(f"SELECT * FROM `group_info` WHERE `id`=?", (target,), result=True)
                 if not res:
                     if force_to_update:
@@ -3287,6 +3851,11 @@ class Dingtalk:
                     if force_to_update:
                         res[0][4] = await self.get_group(res[0])
             elif target.openConversationId:
+                if not force_to_update:
+                    cached = self._get_cached_info(
+                        ("group_info", "openConversationId", str(target.openConversationId)))
+                    if cached is not None:
+                        return cached
                 res = cache.execute(
                     f"SELECT * FROM `group_info` WHERE `openConversationId`=?", (str(target.openConversationId),),
                     result=True)
@@ -3294,52 +3863,96 @@ class Dingtalk:
                 raise ValueError(f"Empty group id: {target}")
             if res:
                 if res[0]:
-                    main_info = json.loads(res[0][4])
-                    main_info["dingraia_cache"] = {
-                        "id"                : res[0][0],
-                        "chatId"            : res[0][1],
-                        "openConversationId": res[0][2],
-                        "name"              : res[0][3],
-                        "timeStamp"         : res[0][5],
-                        "strfTimeStamp": datetime.datetime.fromtimestamp(res[0][5]).strftime('%Y-%m-%d %H:%M:%S')
-                    }
-                    return main_info, res[0][5]
+                    return self._cache_info_row("group_info", res[0])
             return {}, 0
         elif isinstance(target, Member):
             if target.staffId or target.staffid:
                 target = target.staffId or target.staffid
                 target = str(target)
-                if force_to_update:
-                    await self.get_user(target, using_cache=False)
-                res = cache.execute(f"SELECT * FROM `user_info` WHERE `staffId`=?", (target,), result=True)
+                infoKey = ("user_info", "staffId", target)
+                command = f"SELECT * FROM `user_info` WHERE `staffId`=?"
             elif target.id:
                 target = target.id
-                if force_to_update:
-                    await self.get_user(target, using_cache=False)
-                res = cache.execute(f"SELECT * FROM `user_info` WHERE `id`=?", (target,), result=True)
+                infoKey = ("user_info", "id", str(target))
+                command = f"SELECT * FROM `user_info` WHERE `id`=?"
             elif target.unionId:
                 target = str(target.unionId)
-                if force_to_update:
-                    await self.get_user(target, using_cache=False)
-                res = cache.execute(f"SELECT * FROM `user_info` WHERE `unionId`=?", (target,), result=True)
+                infoKey = ("user_info", "unionId", target)
+                command = f"SELECT * FROM `user_info` WHERE `unionId`=?"
             else:
                 raise ValueError(f"Empty staffId or id: {target}")
+            if force_to_update:
+                await self.get_user(target, using_cache=False)
+            else:
+                cached = self._get_cached_info(infoKey)
+                if cached is not None:
+                    return cached
+            res = cache.execute(command, (target,), result=True)
             if res:
                 if res[0]:
-                    main_info = json.loads(res[0][4])
-                    main_info["dingraia_cache"] = {
-                        "id"           : res[0][0],
-                        "name"         : res[0][1],
-                        "staffId"      : res[0][2],
-                        "unionId"      : res[0][3],
-                        "timeStamp"    : res[0][5],
-                        "strfTimeStamp": datetime.datetime.fromtimestamp(res[0][5]).strftime('%Y-%m-%d %H:%M:%S')
-                    }
-                    return main_info, res[0][5]
+                    return self._cache_info_row("user_info", res[0])
             return {}, 0
         else:
             raise ValueError(f"Invalid target type: {type(target)}")
 
+    @staticmethod
+    def _get_cached_info(key: tuple) -> Optional[Tuple[dict, float]]:
+        cached = cache.infoCache.get(key)
+        if cached is None:
+            return None
+        main_info, timeStamp = cached
+        main_info = main_info.copy()
+        main_info["dingraia_cache"] = main_info["dingraia_cache"].copy()
+        return main_info, timeStamp
+
+    @staticmethod
+    def _cache_info_row(table: str, row: tuple) -> Tuple[dict, float]:
+        """将 group_info / user_info 的一行转换为 (信息, 时间戳) 并放入内存缓存"""
+        main_info = json.loads(row[4]) if row[4] else {}
+        if table == "group_info":
+            main_info["dingraia_cache"] = {
+                "id"                : row[0],
+                "chatId"            : row[1],
+                "openConversationId": row[2],
+                "name"              : row[3],
+            }
+            keys = [(table, "openConversationId", str(row[2]))]
+        else:
+            main_info["dingraia_cache"] = {
+                "id"     : row[0],
+                "name"   : row[1],
+                "staffId": row[2],
+                "unionId": row[3],
+            }
+            keys = [(table, "staffId", str(row[2])), (table, "unionId", str(row[3]))]
+        main_info["dingraia_cache"]["timeStamp"] = row[5]
+        main_info["dingraia_cache"]["strfTimeStamp"] = datetime.datetime.fromtimestamp(row[5]).strftime(
+            '%Y-%m-%d %H:%M:%S')
+        keys.append((table, "id", str(row[0])))
+        cache.infoCache.set([k for k in keys if k[2]], (main_info, row[5]))
+        main_info = main_info.copy()
+        main_info["dingraia_cache"] = main_info["dingraia_cache"].copy()
+        return main_info, row[5]
+
+    def get_worker_stats(self) -> dict:
+        """获取统计数据。多进程模式下在父进程中返回所有子进程汇总的数据
+
+        Returns:
+            包含每个进程数据的 `workers` 和汇总的 `total`
+        """
+        if self.workerSupervisor is not None:
+            return self.workerSupervisor.stats()
+        stats = worker_stats(self, self.worker.index if self.worker is not None else 0)
+        return {"workers": {stats["index"]: stats}, "total": stats}
+
+    def get_info_cache_stats(self) -> dict:
+        """获取 get_info 内存缓存的命中统计
+
+        Returns:
+            包含 size, maxSize, hits, misses, evictions, hitRate 的字典
+        """
+        return cache.infoCache.stats()
+
     def _add_message_times(self, target: Union[TraceId, OpenConversationId, Group, Member], no_raise: bool = False):
         return self._add_traceId_event_times(target=target, event="send_messages", no_raise=no_raise)
 
@@ -0,0 +1,129 @@
+import json
+import queue
+import re
+import threading
+from typing import Optional
+
+from aiohttp import web
+
+from .log import logger
+
+BOT_AGENTS = (
+    "PycURL",
+    "HttpClient",
+    "Googlebot",
+    "MJ12bot",
+    "AhrefsBot",
+    "Nessus",
+    "Acunetix",
+    "sqlmap",
+    "HackTool",
+    "Darknet",
+    "http",
+    "python",
+    "WindowsPowerShell",
+    "curl"
+)
+"""`dingtalk` 策略下拒绝的User-Agent关键字"""
+_BOT_AGENT_PATTERN = re.compile("|".join(re.escape(agent) for agent in BOT_AGENTS))
+_DINGTALK_USER_PATTERN = re.compile(r"com\.alibaba\.android\.rimet|AliApp")
+
+
+def check_ua(ua: str, allow: str = "all") -> Optional[web.Response]:
+    """检查User-Agent，不允许时返回400响应
+
+    Args:
+        ua: User-Agent，缺失时为 `-`
+        allow: 检查策略，`user` 只允许浏览器，`dingtalk-user` 只允许钉钉客户端，`dingtalk` 拒绝常见的脚本和扫描器，
+            `all` 不检查
+
+    Returns:
+        允许时返回None
+    """
+    if allow == 'all':
+        return None
+    if allow == 'user':
+        if 'Mozilla' not in ua:
+            return web.Response(status=400)
+    elif allow == "dingtalk-user":
+        if _DINGTALK_USER_PATTERN.search(ua) is None:
+            return web.Response(status=400)
+    elif allow == "dingtalk":
+        if ua == "-" or _BOT_AGENT_PATTERN.search(ua) is not None:
+            return web.Response(status=400)
+    return None
+
+
+class AccessLogWriter:
+
+    def __init__(self, path: str, flushInterval: float = 1, maxQueue: int = 10000):
+        """JSON Lines访问日志的后台写入器
+
+        Notes:
+            `write` 只把记录放入队列，序列化和写文件都在后台线程中进行，每隔 `flushInterval` 秒取出队列中的全部记录一起写入
+
+        Args:
+            path: 文件路径，以追加模式打开
+            flushInterval: 写入文件的最长间隔，单位为秒
+            maxQueue: 队列的最大长度，队列已满时丢弃新的记录
+        """
+        self.path = path
+        self.flushInterval = flushInterval
+        self._queue: "queue.Queue[dict]" = queue.Queue(maxQueue)
+        self.written: int = 0
+        self.dropped: int = 0
+        """队列已满时丢弃的记录数"""
+        self._thread: Optional[threading.Thread] = None
+        self._closing = threading.Event()
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="Dingraia.AccessLog", daemon=True)
+            self._thread.start()
+
+    def write(self, record: dict):
+        """记录一次请求，不阻塞"""
+        try:
+            self._queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+    def _run(self):
+        with open(self.path, "a", encoding="utf-8") as f:
+            while True:
+                closing = self._closing.is_set()
+                records = []
+                while True:
+                    try:
+                        records.append(self._queue.get_nowait())
+                    except queue.Empty:
+                        break
+                if records:
+                    self._write(f, records)
+                if closing:
+                    break
+                self._closing.wait(self.flushInterval)
+
+    def _write(self, f, records: list):
+        lines = []
+        for record in records:
+            try:
+                lines.append(json.dumps(record, ensure_ascii=False, separators=(",", ":")))
+            except (TypeError, ValueError) as err:
+                logger.warning(f"Cannot serialize access log record -> {err.__class__.__name__}: {err}")
+        if not lines:
+            return
+        try:
+            f.write("\n".join(lines) + "\n")
+            f.flush()
+            self.written += len(lines)
+        except OSError as err:
+            logger.error(f"Cannot write access log to {self.path} -> {err.__class__.__name__}: {err}")
+
+    def close(self, timeout: float = 5):
+        """写出队列中剩余的记录并停止后台线程"""
+        if self._thread is None:
+            return
+        self._closing.set()
+        self._thread.join(timeout)
+        self._thread = None
@@ -6,12 +6,11 @@ import random
 import re
 from typing import Any, AsyncGenerator, Dict, List, Literal, Optional, Union
 
-import aiohttp
-
 from ..cache import cache
 from ..log import logger
 from ..model import Group, Member
 from ..tools import streamProcessor
+from ..verify import client_session, streaming_timeout
 
 
 class APIKeys:
@@ -266,7 +265,7 @@ class OpenAI(aiAPI):
             self.messages().append({"role": "system", "content": self.systemPrompt})
 
     async def getAvailableModels(self) -> dict[str, str]:
-        async with aiohttp.ClientSession() as session:
+        async with client_session() as session:
             async with session.get(
                     self.baseUrl + "/models",
                     headers={"Authorization": f"Bearer {self.apiKey.getKey()}"}
@@ -296,11 +295,12 @@ class OpenAI(aiAPI):
             payload = self.ChatPayloadBase(user).copy()
             payload["model"] = model
             preWriteAssistantMessage = {"role": "assistant", "content": "{Not complete yet, ignore this message}"}
-            async with aiohttp.ClientSession() as session:
+            async with client_session() as session:
                 async with session.post(
                         self.baseUrl + "/chat/completions",
                         headers={"Authorization": f"Bearer {currKey}"},
-                        json=payload
+                        json=payload,
+                        timeout=streaming_timeout()
                 ) as response:
                     self.messages(user).append(preWriteAssistantMessage)
                     if response.status != 200:
@@ -4,7 +4,7 @@ DeepSeek API
 from typing import Union
 
 from dingraia.aiAPI import APIKeys, OpenAI
-import aiohttp
+from dingraia.verify import client_session
 
 DeepSeek_Chat = "deepseek-chat"
 DeepSeek_R1 = "deepseek-reasoner"
@@ -21,7 +21,7 @@ class DeepSeek(OpenAI):
         super().__init__(apiKey, systemPrompt, maxContextLength, baseUrl="https://api.deepseek.com")
 
     async def getAccountBalance(self) -> tuple[float, float, float, str]:
-        async with aiohttp.ClientSession() as session:
+        async with client_session() as session:
             async with session.get(
                     f"https://api.deepseek.com/user/balance",
                     headers={"Authorization": f"Bearer {self.apiKey.getKey()}"}
@@ -5,7 +5,7 @@ from dingraia.model import Group, Member
 from dingraia.tools import streamProcessor
 from dingraia.aiAPI import aiAPI
 from dingraia.log import logger
-import aiohttp
+from dingraia.verify import client_session, streaming_timeout
 
 LLama_3_2 = "llama3.2"
 DeepSeek_R1_1_5_B = "deepseek-r1:1.5b"
@@ -46,10 +46,11 @@ class Ollama(aiAPI):
             self.messages(user=user).append(userMessage)
             payload = self.ChatPayloadBase(user=user).copy()
             payload["model"] = model
-            async with aiohttp.ClientSession() as session:
+            async with client_session() as session:
                 async with session.post(
                         self.url + "/api/chat",
-                        json=payload
+                        json=payload,
+                        timeout=streaming_timeout()
                 ) as response:
                     if response.status != 200:
                         logger.error(
@@ -1,10 +1,9 @@
 import asyncio
 from typing import Any, AsyncGenerator, Union
 
-import aiohttp
-
 from dingraia.aiAPI import APIKeys, OpenAI
 from dingraia.model import Member
+from dingraia.verify import client_session
 
 DeepSeek_R1 = "deepseek-ai/DeepSeek-R1"
 DeepSeek_V3 = "deepseek-ai/DeepSeek-V3"
@@ -92,7 +91,7 @@ class SiliconFlow(OpenAI):
             if len(self.apiKey.getAllKey()) != 1:
                 raise TypeError("APIKey must be specified when there are multiple/no APIKeys.")
             apiKey = self.apiKey.getAllKey()[0]
-        async with aiohttp.ClientSession() as session:
+        async with client_session() as session:
             async with session.get(
                     "https://api.siliconflow.cn/v1/user/info",
                     headers={"Authorization": f"Bearer {apiKey}"}
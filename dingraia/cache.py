@@ -1,14 +1,149 @@
+import atexit
 import datetime
 import inspect
 import sqlite3
+import threading
+import time
+from collections import OrderedDict
 from pathlib import Path
-from typing import Optional, Union
+from typing import Any, Dict, Hashable, Iterable, List, Optional, Tuple, Union
 
 from .exceptions import *
 from .log import logger
+from .metrics import CACHE_QUERY_SECONDS, registry as metrics
+
+
+class InfoCache:
+
+    def __init__(self, maxSize: int = 1024, ttl: float = 300):
+        """带有过期时间的LRU对象缓存，同一个对象可以通过多个键访问，任意一个键失效时整个对象失效
+
+        Args:
+            maxSize: 最多缓存的对象数量，为0时不缓存
+            ttl: 对象的缓存时间，单位为秒
+        """
+        self.maxSize = maxSize
+        self.ttl = ttl
+        self.hits: int = 0
+        self.misses: int = 0
+        self.evictions: int = 0
+        self._entries: "OrderedDict[int, Tuple[float, Any, Tuple[Hashable, ...]]]" = OrderedDict()
+        self._keys: Dict[Hashable, int] = {}
+        self._nextId: int = 0
+        self._lock = threading.Lock()
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        """获取缓存的对象，不存在或已过期时返回None"""
+        with self._lock:
+            entryId = self._keys.get(key)
+            if entryId is not None:
+                expire, value, _ = self._entries[entryId]
+                if expire > time.monotonic():
+                    self._entries.move_to_end(entryId)
+                    self.hits += 1
+                    return value
+                self._remove(entryId)
+            self.misses += 1
+            return None
+
+    def set(self, keys: Iterable[Hashable], value: Any):
+        """缓存一个对象
+
+        Args:
+            keys: 对象的所有键，原先使用这些键的对象会失效
+            value: 对象
+
+        Returns:
+            None
+        """
+        if self.maxSize <= 0:
+            return
+        keys = tuple(keys)
+        with self._lock:
+            for key in keys:
+                entryId = self._keys.get(key)
+                if entryId is not None:
+                    self._remove(entryId)
+            entryId = self._nextId
+            self._nextId += 1
+            self._entries[entryId] = (time.monotonic() + self.ttl, value, keys)
+            for key in keys:
+                self._keys[key] = entryId
+            while len(self._entries) > self.maxSize:
+                self._remove(next(iter(self._entries)))
+                self.evictions += 1
+
+    def peek(self, key: Hashable) -> Optional[Any]:
+        """获取缓存的对象，但不计入命中统计也不更新使用顺序"""
+        with self._lock:
+            entryId = self._keys.get(key)
+            if entryId is None:
+                return None
+            expire, value, _ = self._entries[entryId]
+            return value if expire > time.monotonic() else None
+
+    def replace(self, key: Hashable, value: Any) -> bool:
+        """替换键对应的对象，保留原有的键和过期时间
+
+        Returns:
+            对象不存在或已过期时返回False
+        """
+        with self._lock:
+            entryId = self._keys.get(key)
+            if entryId is None:
+                return False
+            expire, _, keys = self._entries[entryId]
+            if expire <= time.monotonic():
+                return False
+            self._entries[entryId] = (expire, value, keys)
+            return True
+
+    def invalidate(self, key: Hashable):
+        """使键对应的对象失效"""
+        with self._lock:
+            entryId = self._keys.get(key)
+            if entryId is not None:
+                self._remove(entryId)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._keys.clear()
+
+    def stats(self) -> dict:
+        """缓存的命中统计"""
+        total = self.hits + self.misses
+        return {
+            "size"     : len(self._entries),
+            "maxSize"  : self.maxSize,
+            "hits"     : self.hits,
+            "misses"   : self.misses,
+            "evictions": self.evictions,
+            "hitRate"  : self.hits / total if total else 0.0
+        }
+
+    def _remove(self, entryId: int):
+        _, _, keys = self._entries.pop(entryId)
+        for key in keys:
+            if self._keys.get(key) == entryId:
+                del self._keys[key]
 
 
 class Cache:
+    SCHEMA_VERSION = 1
+    """数据库结构版本，保存在 PRAGMA user_version 中"""
+
+    indexes = (
+        # (索引名, 表名, 列, 是否唯一, 部分索引条件)
+        ("idx_user_info_staffId", "user_info", ("staffId",), True, "staffId != ''"),
+        ("idx_user_info_unionId", "user_info", ("unionId",), True, "unionId != ''"),
+        ("idx_user_info_id", "user_info", ("id",), False, None),
+        ("idx_group_info_openConversationId", "group_info", ("openConversationId",), True, None),
+        ("idx_group_info_id", "group_info", ("id",), False, None),
+        ("idx_webhooks_openConversationId", "webhooks", ("openConversationId",), True, None),
+        ("idx_file_sha256", "file", ("sha256",), True, None),
+        ("idx_counts_type", "counts", ("type",), True, None),
+    )
 
     def __init__(self):
         self.db: Optional[sqlite3.Connection] = None
@@ -16,35 +151,280 @@ class Cache:
         self.cursor: Optional[sqlite3.Cursor] = None
         self.enable: bool = True
         self.raiseOnExecuteError: bool = False
+        self.writeBehind: bool = False
+        """是否启用延迟写入，启用后写入操作进入队列并由后台线程批量提交"""
+        self.maxBatchSize: int = 256
+        """延迟写入时，等待的写入达到此数量会立即提交"""
+        self.flushInterval: float = 0.5
+        """延迟写入时，最长的提交间隔，单位为秒"""
+        self._lock = threading.RLock()
+        self._writeCondition = threading.Condition()
+        self._pendingWrites: "OrderedDict[Hashable, List[Tuple[str, tuple]]]" = OrderedDict()
+        self._pendingCounts: Dict[str, int] = {}
+        self._pendingInvalidations: set = set()
+        self._pendingTimeStamps: Dict[Hashable, float] = {}
+        self._writerThread: Optional[threading.Thread] = None
+        self._writerStop: bool = False
+        self._atexitRegistered: bool = False
+        self._forkWriteBehind: bool = False
+        self._heldWarned: bool = False
+        self.busyTimeout: float = 5
+        """其他连接(线程或进程)写入时等待锁的时间，单位为秒"""
+        self.wal: bool = False
+        """是否使用WAL模式和 synchronous=NORMAL，多进程共用数据库时由 `enable_wal` 开启"""
+        self.infoCache: InfoCache = InfoCache()
+        """group_info 与 user_info 的内存缓存，键为 (表名, 列名, 值)"""
 
     def connect(self, databaseName: str = "Dingraia_cache.db", **kwargs):
         self.db_name = databaseName
         self.db = sqlite3.connect(databaseName, **kwargs)
         self.cursor = self.db.cursor()
+        self._configure_connection()
         self.init_tables()
 
+    def _configure_connection(self):
+        try:
+            self.cursor.execute(f"PRAGMA busy_timeout={int(self.busyTimeout * 1000)}")
+            if self.wal:
+                self.cursor.execute("PRAGMA journal_mode=WAL")
+                self.cursor.execute("PRAGMA synchronous=NORMAL")
+        except sqlite3.Error as err:
+            logger.warning(f"Failed to configure the database connection -> {err.__class__.__name__}: {err}")
+
+    def enable_wal(self):
+        """使用WAL模式，读取不会阻塞写入，多个进程可以共用同一个数据库
+
+        Notes:
+            WAL模式会保存在数据库文件中，并且 synchronous=NORMAL 在断电时可能丢失最后提交的事务，因此只在多进程模式下开启
+        """
+        self.wal = True
+        if self.is_connected():
+            self._configure_connection()
+
+    def prepare_fork(self):
+        """在创建子进程前提交所有写入并断开连接，子进程与父进程都需要调用 `reconnect` 重新连接
+
+        Notes:
+            SQLite连接、锁和后台写入线程都不能跨进程使用
+        """
+        self._forkWriteBehind = self.writeBehind
+        databaseName = self.db_name
+        if self.is_connected():
+            self.close()
+        self.db_name = databaseName
+
+    def reconnect(self, keepPending: bool = True):
+        """在 `prepare_fork` 之后重新连接数据库，并恢复延迟写入
+
+        Args:
+            keepPending: 是否在重新连接后提交断开期间保留的写入，子进程中应为False，避免与父进程重复写入
+        """
+        pending, counts, invalidations = self._pendingWrites, self._pendingCounts, self._pendingInvalidations
+        timeStamps = self._pendingTimeStamps
+        self._lock = threading.RLock()
+        self._writeCondition = threading.Condition()
+        self._pendingWrites = OrderedDict()
+        self._pendingCounts = {}
+        self._pendingInvalidations = set()
+        self._pendingTimeStamps = {}
+        self._writerThread = None
+        self._writerStop = False
+        self.infoCache = InfoCache(maxSize=self.infoCache.maxSize, ttl=self.infoCache.ttl)
+        if self.db_name and not self.is_connected():
+            self.connect(self.db_name, check_same_thread=False)
+        if self._forkWriteBehind:
+            self.enable_write_behind()
+        if keepPending and (pending or counts):
+            self._requeue(pending, counts, invalidations, timeStamps)
+            self.flush()
+
     def change_database(self, databaseName):
+        writeBehind = self.writeBehind
         self.close()
         self.enable = True
-        self.connect(databaseName=databaseName)
+        self.connect(databaseName=databaseName, check_same_thread=False)
+        if writeBehind:
+            self.enable_write_behind()
 
     def execute(self, command: str, params=tuple(), *, result: bool = False, noErrorOutput: bool = False):
         if self.enable:
-            try:
-                cur = self.cursor.execute(command, params)
-            except Exception as err:
-                if not noErrorOutput:
-                    logger.error(f"{err.__class__.__name__}: {err} command: {command}, params: {params}",
-                                 _inspect=inspect.currentframe())
-                if self.raiseOnExecuteError:
-                    raise err
-                return None
-            if result:
-                return self.cursor.fetchall()
-            return cur
+            with self._lock:
+                start = time.perf_counter()
+                try:
+                    cur = self.cursor.execute(command, params)
+                except Exception as err:
+                    if not noErrorOutput:
+                        logger.error(f"{err.__class__.__name__}: {err} command: {command}, params: {params}",
+                                     _inspect=inspect.currentframe())
+                    if self.raiseOnExecuteError:
+                        raise err
+                    return None
+                finally:
+                    if metrics.enabled:
+                        CACHE_QUERY_SECONDS.observe(time.perf_counter() - start, command.split(None, 1)[0].upper())
+                if result:
+                    return self.cursor.fetchall()
+                return cur
         else:
             return []
 
+    def write(
+            self, command: str, params=tuple(), *, key: Hashable = None,
+            invalidate: Iterable[Tuple[str, str, Any]] = ()
+    ):
+        """执行一条写入语句，启用延迟写入时进入写入队列
+
+        Args:
+            command: SQL语句
+            params: 参数
+            key: 合并键，延迟写入时相同键的同一组语句只会保留最后一次的参数
+            invalidate: 写入后需要失效的内存缓存，由 (表名, 列名, 值) 组成
+
+        Returns:
+            None
+        """
+        self.write_many([(command, params)], key=key, invalidate=invalidate)
+
+    def write_many(
+            self, statements: Iterable[Tuple[str, tuple]], *, key: Hashable = None,
+            invalidate: Iterable[Tuple[str, str, Any]] = (), timeStamp: float = None
+    ):
+        """在同一个事务中执行一组写入语句，启用延迟写入时进入写入队列
+
+        Args:
+            statements: 由 (SQL语句, 参数) 组成的列表
+            key: 合并键，延迟写入时相同键的同一组语句只会保留最后一次的参数
+            invalidate: 写入后需要失效的内存缓存，由 (表名, 列名, 值) 组成
+            timeStamp: 数据的时间戳，合并时队列中已有更新的数据则丢弃本次写入
+
+        Returns:
+            None
+        """
+        if not self.enable:
+            return
+        statements = [(command, tuple(params)) for command, params in statements]
+        invalidate = [(table, column, str(value)) for table, column, value in invalidate]
+        for infoKey in invalidate:
+            self.infoCache.invalidate(infoKey)
+        if not self.writeBehind:
+            with self._lock:
+                for command, params in statements:
+                    self.execute(command, params)
+                self.commit()
+            return
+        if key is None:
+            key = object()
+        else:
+            key = (key, tuple(command for command, _ in statements))
+        with self._writeCondition:
+            if timeStamp is not None:
+                if key in self._pendingWrites and self._pendingTimeStamps.get(key, timeStamp) > timeStamp:
+                    return
+                self._pendingTimeStamps[key] = timeStamp
+            self._pendingWrites.pop(key, None)
+            self._pendingWrites[key] = statements
+            # 提交前读取到的旧数据可能被重新缓存，提交后需要再次失效
+            self._pendingInvalidations.update(invalidate)
+            if len(self._pendingWrites) >= self.maxBatchSize:
+                self._writeCondition.notify()
+
+    def flush(self):
+        """立即在一个事务中提交所有等待中的写入"""
+        with self._writeCondition:
+            pending = self._pendingWrites
+            counts = self._pendingCounts
+            invalidations = self._pendingInvalidations
+            timeStamps = self._pendingTimeStamps
+            self._pendingWrites = OrderedDict()
+            self._pendingCounts = {}
+            self._pendingInvalidations = set()
+            self._pendingTimeStamps = {}
+        if not pending and not counts:
+            return
+        if not self.enable or not self.is_connected():
+            self._requeue(pending, counts, invalidations, timeStamps)
+            if not self._heldWarned:
+                self._heldWarned = True
+                logger.warning(f"Cache is disabled or not connected, {len(pending) + len(counts)} pending write(s) "
+                               f"are kept until it is connected again")
+            return
+        self._heldWarned = False
+        with self._lock:
+            for statements in pending.values():
+                for command, params in statements:
+                    self.execute(command, params)
+            for countType, times in counts.items():
+                self.execute(*self._build_count(countType, times))
+            self.commit()
+        for infoKey in invalidations:
+            self.infoCache.invalidate(infoKey)
+
+    def _requeue(self, pending: "OrderedDict[Hashable, List[Tuple[str, tuple]]]", counts: Dict[str, int],
+                 invalidations: set, timeStamps: Dict[Hashable, float]):
+        """把未能提交的写入放回队列，排在之后加入的写入前面"""
+        with self._writeCondition:
+            for key, statements in self._pendingWrites.items():
+                timeStamp = self._pendingTimeStamps.get(key)
+                if key in pending and timeStamp is not None and timeStamps.get(key, timeStamp) > timeStamp:
+                    continue
+                pending.pop(key, None)
+                pending[key] = statements
+                if timeStamp is not None:
+                    timeStamps[key] = timeStamp
+            self._pendingWrites = pending
+            self._pendingTimeStamps = timeStamps
+            for countType, times in self._pendingCounts.items():
+                counts[countType] = counts.get(countType, 0) + times
+            self._pendingCounts = counts
+            self._pendingInvalidations = invalidations | self._pendingInvalidations
+
+    def enable_write_behind(self, maxBatchSize: int = None, flushInterval: float = None):
+        """启用延迟写入，写入操作会按键合并，并由后台线程按数量或时间批量提交
+
+        Args:
+            maxBatchSize: 等待的写入达到此数量时立即提交
+            flushInterval: 最长的提交间隔，单位为秒
+
+        Returns:
+            None
+        """
+        if maxBatchSize is not None:
+            self.maxBatchSize = maxBatchSize
+        if flushInterval is not None:
+            self.flushInterval = flushInterval
+        self.writeBehind = True
+        if self._writerThread is None or not self._writerThread.is_alive():
+            self._writerStop = False
+            self._writerThread = threading.Thread(target=self._writer, name="Dingraia-CacheWriter", daemon=True)
+            self._writerThread.start()
+        if not self._atexitRegistered:
+            atexit.register(self.disable_write_behind)
+            self._atexitRegistered = True
+
+    def disable_write_behind(self):
+        """停止延迟写入，提交所有等待中的写入并停止后台线程"""
+        self.writeBehind = False
+        if self._writerThread is not None:
+            with self._writeCondition:
+                self._writerStop = True
+                self._writeCondition.notify()
+            self._writerThread.join()
+            self._writerThread = None
+        self.flush()
+
+    def _writer(self):
+        while True:
+            with self._writeCondition:
+                if not self._writerStop and len(self._pendingWrites) < self.maxBatchSize:
+                    self._writeCondition.wait(self.flushInterval)
+                stop = self._writerStop
+            try:
+                self.flush()
+            except Exception as err:
+                logger.error(f"Error while flushing the cache -> {err.__class__.__name__}: {err}")
+            if stop:
+                return
+
     def get_tables(self):
         res = self.execute("SELECT name FROM sqlite_master WHERE type='table' AND name NOT LIKE 'sqlite_%';",
                            result=True)
@@ -156,6 +536,178 @@ class Cache:
                     self.create_table(t, v)
             else:
                 self.create_table(t, v)
+        self.migrate_schema()
+
+    def get_indexes(self) -> List[str]:
+        res = self.execute("SELECT name FROM sqlite_master WHERE type='index' AND name NOT LIKE 'sqlite_%';",
+                           result=True)
+        return [x[0] for x in res or []]
+
+    def migrate_schema(self):
+        """为缓存表建立索引。建立唯一索引前会清理重复的行，仅保留最新写入的一行"""
+        if not self.enable:
+            return
+        existed = self.get_indexes()
+        backup = False
+        for name, table, columns, unique, where in self.indexes:
+            if name in existed:
+                continue
+            columns_sql = ", ".join(f"`{c}`" for c in columns)
+            where_sql = f" WHERE {where}" if where else ""
+            if unique:
+                duplicated = self.execute(
+                    f"SELECT COUNT(*) FROM `{table}` WHERE rowid NOT IN "
+                    f"(SELECT MAX(rowid) FROM `{table}`{where_sql} GROUP BY {columns_sql})"
+                    f"{' AND ' + where if where else ''};", result=True)
+                if duplicated and duplicated[0][0]:
+                    if not backup:
+                        self.backup_database()
+                        backup = True
+                    logger.warning(f"Database migrate: remove {duplicated[0][0]} duplicated row(s) "
+                                   f"of '{table}' by ({', '.join(columns)})")
+                    self.execute(
+                        f"DELETE FROM `{table}` WHERE rowid NOT IN "
+                        f"(SELECT MAX(rowid) FROM `{table}`{where_sql} GROUP BY {columns_sql})"
+                        f"{' AND ' + where if where else ''};")
+            self.execute(f"CREATE {'UNIQUE ' if unique else ''}INDEX IF NOT EXISTS `{name}` "
+                         f"ON `{table}` ({columns_sql}){where_sql};")
+        self.execute(f"PRAGMA user_version = {self.SCHEMA_VERSION};")
+        self.commit()
+
+    def build_upsert(
+            self,
+            table: str,
+            key_columns: Union[str, Iterable[str]],
+            values: Dict[str, Any],
+            *,
+            update_columns: Union[Iterable[str], Dict[str, str]] = None,
+            newer_only: bool = False
+    ) -> Tuple[str, tuple]:
+        """生成 INSERT ... ON CONFLICT DO UPDATE 语句
+
+        Args:
+            table: 表名
+            key_columns: 用于判断冲突的列，必须存在对应的唯一索引
+            values: 列名与值的字典，插入时使用全部的值
+            update_columns: 冲突时更新的列，默认为除 key_columns 外的所有列。
+                也可以是列名与SQL表达式的字典，表达式中可以使用 excluded.`列名` 引用插入的值
+            newer_only: 只在插入的 timeStamp 不早于已有的行时更新，避免较旧的数据覆盖较新的数据
+
+        Returns:
+            (SQL语句, 参数)
+        """
+        if isinstance(key_columns, str):
+            key_columns = (key_columns,)
+        key_columns = tuple(key_columns)
+        if update_columns is None:
+            update_columns = [c for c in values if c not in key_columns]
+        if not isinstance(update_columns, dict):
+            update_columns = {c: f"excluded.`{c}`" for c in update_columns}
+        where = None
+        for _, index_table, columns, unique, index_where in self.indexes:
+            if unique and index_table == table and columns == key_columns:
+                where = index_where
+                break
+        command = (f"INSERT INTO `{table}` ({', '.join(f'`{c}`' for c in values)}) "
+                   f"VALUES ({', '.join('?' * len(values))}) "
+                   f"ON CONFLICT({', '.join(f'`{c}`' for c in key_columns)})"
+                   f"{' WHERE ' + where if where else ''} ")
+        if update_columns:
+            command += "DO UPDATE SET " + ", ".join(f"`{c}`={e}" for c, e in update_columns.items())
+            if newer_only:
+                command += f" WHERE `{table}`.`timeStamp` IS NULL OR excluded.`timeStamp`>=`{table}`.`timeStamp`"
+        else:
+            command += "DO NOTHING"
+        return command, tuple(values.values())
+
+    def upsert(
+            self,
+            table: str,
+            key_columns: Union[str, Iterable[str]],
+            values: Dict[str, Any],
+            *,
+            update_columns: Union[Iterable[str], Dict[str, str]] = None,
+            invalidate: bool = True,
+            newer_only: bool = False
+    ):
+        """插入一行数据，唯一键冲突时更新已有的行。启用延迟写入时按表和键合并
+
+        Notes:
+            表上的其他唯一索引(如 user_info 的 unionId)与其他行冲突时，会先删除那些行，与 INSERT OR REPLACE 相同
+
+        Args:
+            table: 表名
+            key_columns: 用于判断冲突的列，必须存在对应的唯一索引
+            values: 列名与值的字典，插入时使用全部的值
+            update_columns: 冲突时更新的列，默认为除 key_columns 外的所有列
+            invalidate: 是否使这一行在内存缓存中失效
+            newer_only: 只在 values 中的 timeStamp 不早于已有的行和队列中的写入时更新
+
+        Returns:
+            None
+        """
+        if isinstance(key_columns, str):
+            key_columns = (key_columns,)
+        statements = self._build_conflict_cleanup(table, key_columns, values)
+        statements.append(self.build_upsert(table, key_columns, values, update_columns=update_columns,
+                                            newer_only=newer_only))
+        invalidate_columns = key_columns + tuple(c for c, _ in self._other_unique_columns(table, key_columns, values))
+        self.write_many(statements, key=(table,) + tuple(values[c] for c in key_columns),
+                        invalidate=[(table, c, values[c]) for c in invalidate_columns] if invalidate else (),
+                        timeStamp=values["timeStamp"] if newer_only else None)
+
+    def _other_unique_columns(
+            self, table: str, key_columns: Tuple[str, ...], values: Dict[str, Any]
+    ) -> List[Tuple[str, Optional[str]]]:
+        """表上除 key_columns 外的单列唯一索引，返回 (列名, 部分索引条件)"""
+        return [
+            (columns[0], where) for _, index_table, columns, unique, where in self.indexes
+            if unique and index_table == table and len(columns) == 1
+            and columns[0] in values and columns[0] not in key_columns
+        ]
+
+    def _build_conflict_cleanup(
+            self, table: str, key_columns: Tuple[str, ...], values: Dict[str, Any]
+    ) -> List[Tuple[str, tuple]]:
+        statements = []
+        key_sql = " AND ".join(f"`{c}`=?" for c in key_columns)
+        for column, where in self._other_unique_columns(table, key_columns, values):
+            statements.append((
+                f"DELETE FROM `{table}` WHERE `{column}`=?{' AND ' + where if where else ''} AND NOT ({key_sql})",
+                (values[column],) + tuple(values[c] for c in key_columns)
+            ))
+        return statements
+
+    def info_changed(
+            self, table: str, column: str, value: Any, fields: Dict[str, Any], timeStamp: float = None
+    ) -> bool:
+        """判断要写入的字段是否与内存缓存中的不同。没有缓存时视为不同
+
+        Args:
+            table: 表名
+            column: 用于查找的列
+            value: 用于查找的值
+            fields: 要写入的列与值
+            timeStamp: 本次写入的时间戳，字段相同时用它更新内存缓存中的时间戳
+
+        Returns:
+            bool
+        """
+        key = (table, column, str(value))
+        cached = self.infoCache.peek(key)
+        if cached is None:
+            return True
+        main_info = cached[0]
+        info = main_info.get("dingraia_cache", {})
+        if any(str(info.get(k)) != str(v) for k, v in fields.items()):
+            return True
+        if timeStamp is not None:
+            main_info = main_info.copy()
+            main_info["dingraia_cache"] = dict(info, timeStamp=timeStamp)
+            main_info["dingraia_cache"]["strfTimeStamp"] = datetime.datetime.fromtimestamp(timeStamp).strftime(
+                '%Y-%m-%d %H:%M:%S')
+            self.infoCache.replace(key, (main_info, timeStamp))
+        return False
 
     def check_and_restore(self):
         if not self.is_connected():
@@ -180,7 +732,7 @@ class Cache:
         return True
 
     def value_exist(self, table, column, value) -> bool:
-        return bool(self.execute(f"SELECT * FROM `{table}` WHERE {column}=?", (value,), result=True))
+        return bool(self.execute(f"SELECT 1 FROM `{table}` WHERE {column}=? LIMIT 1", (value,), result=True))
     
     def add_value(self, table, column, name, index, add: int = 1):
         if self.value_exist(table, column, name):
@@ -191,22 +743,28 @@ class Cache:
 
     def add_openapi_count(self, times: int = 1):
         current_month = datetime.datetime.now().strftime('openApi_%Y_%m')
-        if self.value_exist('counts', 'type', current_month):
-            self.execute(f"UPDATE `counts` SET count=count+{times} WHERE type='{current_month}';")
-        else:
-            self.execute(f"INSERT INTO `counts` (type, count) VALUES ('{current_month}', {times});")
-        self.commit()
+        if self.writeBehind:
+            with self._writeCondition:
+                self._pendingCounts[current_month] = self._pendingCounts.get(current_month, 0) + times
+            return
+        self.write(*self._build_count(current_month, times))
+
+    def _build_count(self, countType: str, times: int) -> Tuple[str, tuple]:
+        return self.build_upsert("counts", "type", {"type": countType, "count": times},
+                                 update_columns={"count": "`count`+excluded.`count`"})
 
     def get_api_counts(self):
         current_month = datetime.datetime.now().strftime('openApi_%Y_%m')
         res = self.execute(f"SELECT * FROM `counts` WHERE type='{current_month}'", result=True)
+        pending = self._pendingCounts.get(current_month, 0)
         if res:
-            return res[0][1]
-        return 0
+            return res[0][1] + pending
+        return pending
 
     def commit(self):
         if self.enable:
-            self.db.commit()
+            with self._lock:
+                self.db.commit()
 
     def is_connected(self) -> bool:
         return self.db is not None and self.cursor is not None
@@ -221,6 +779,9 @@ class Cache:
             raise SQLError("Database is not connected!")
 
     def close(self):
+        if self.writeBehind:
+            self.disable_write_behind()
+        self.infoCache.clear()
         self.cursor.close()
         self.db.close()
         self.db = None
@@ -17,14 +17,14 @@ def callback_handler(app: "dingraia.DingTalk.Dingtalk", event_body: dict, raw_bo
                 event = ChatKick()
             elif event_body.EventType == 'chat_update_title':
                 event = GroupNameChange()
-                if cache.value_exist("group_info", "openConversationId", str(event_body.openConversationId)):
-                    cache.execute("UPDATE group_info SET name=? WHERE openConversationId=?",
-                                  (event_body.Title, str(event_body.openConversationId)))
-                else:
-                    cache.execute(
-                        "INSERT INTO group_info (`id`,`chatId`,`openConversationId`,`name`,`info`,`timeStamp`) VALUES "
-                        "(?,?,?,?,?,?)", ('', '', event_body.openConversationId, event_body.Title, '{}', time.time()))
-                    cache.commit()
+                cache.upsert("group_info", "openConversationId", {
+                    "id"                : '',
+                    "chatId"            : '',
+                    "openConversationId": str(event_body.openConversationId),
+                    "name"              : event_body.Title,
+                    "info"              : '{}',
+                    "timeStamp"         : time.time()
+                }, update_columns=("name",))
             elif event_body.EventType == 'chat_disband':
                 event = GroupDisband()
             event.time = event_body.Timestamp
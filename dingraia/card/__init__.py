@@ -1,8 +1,7 @@
 from typing import AsyncGenerator, Callable, Generator, Iterator, List, Literal, Iterable, Optional, Protocol, Union
 
-import aiohttp
-
 from ..tools import asyncGenerator2list, streamProcessor
+from ..verify import client_session
 import json as _json
 
 
@@ -181,7 +180,7 @@ class AICard(BaseCard):
             timeout: Optional[float] = None
     ):
         async def get_answer():
-            async with aiohttp.ClientSession() as session:
+            async with client_session() as session:
                 async with session.post(post_url, json=json, headers=headers, timeout=timeout) as response:
                     response.raise_for_status()
                     async for text in streamProcessor(response, data_handler):
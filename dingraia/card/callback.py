@@ -0,0 +1,128 @@
+import asyncio
+import collections
+import json
+import time
+from typing import Dict, Optional, Set, Tuple
+
+from ..log import logger
+
+
+class CardCallbackHub:
+
+    def __init__(self, ttl: float = 3600, maxSize: int = 4096):
+        """卡片回调数据的存储与订阅
+
+        Notes:
+            每个outTrackId只保留最新的一次回调，超过 `ttl` 秒或超过 `maxSize` 条后淘汰最旧的记录。
+            回调中的 `actionIds` 在收到时解析一次，订阅了outTrackId的协程会通过 `asyncio.Event` 立即收到通知
+
+        Args:
+            ttl: 回调数据的保留时间，单位为秒，为0时不限制
+            maxSize: 最多保留的回调数，为0时不限制
+        """
+        self.ttl = ttl
+        self.maxSize = maxSize
+        self._data: "collections.OrderedDict[str, Tuple[float, dict, Set[str]]]" = collections.OrderedDict()
+        self._events: Dict[str, asyncio.Event] = {}
+
+    def publish(self, data: dict):
+        """记录一次卡片回调并通知订阅者
+
+        Args:
+            data: 钉钉推送的actionCallback数据，需要包含outTrackId
+        """
+        outTrackId = data["outTrackId"]
+        actionIds: Set[str] = set()
+        value = data.get("value")
+        if value:
+            try:
+                actionIds = set(json.loads(value).get("cardPrivateData", {}).get("actionIds") or [])
+            except (ValueError, TypeError, AttributeError) as err:
+                logger.debug(f"Cannot parse card callback value of {outTrackId} -> {err.__class__.__name__}: {err}")
+        now = time.monotonic()
+        self._data[outTrackId] = (now, data, actionIds)
+        self._data.move_to_end(outTrackId)
+        self._expire(now)
+        event = self._events.get(outTrackId)
+        if event is not None:
+            event.set()
+
+    def get(self, outTrackId: str, default=None) -> Optional[dict]:
+        """获取最新的回调数据"""
+        self._expire(time.monotonic())
+        record = self._data.get(outTrackId)
+        return record[1] if record is not None else default
+
+    def actions(self, outTrackId: str) -> Set[str]:
+        """最新回调中的actionIds"""
+        self._expire(time.monotonic())
+        record = self._data.get(outTrackId)
+        return record[2] if record is not None else set()
+
+    def subscribe(self, outTrackId: str) -> asyncio.Event:
+        """订阅卡片的回调，收到回调时返回的Event会被设置，处理后需要调用 `clear`
+
+        Args:
+            outTrackId: 卡片的追溯ID
+
+        Returns:
+            asyncio.Event
+        """
+        event = self._events.get(outTrackId)
+        if event is None:
+            event = self._events[outTrackId] = asyncio.Event()
+        return event
+
+    def unsubscribe(self, outTrackId: str):
+        self._events.pop(outTrackId, None)
+
+    async def wait(self, outTrackId: str, timeout: float = None) -> Optional[dict]:
+        """等待卡片的下一次回调
+
+        Args:
+            outTrackId: 卡片的追溯ID
+            timeout: 超时时间，单位为秒
+
+        Returns:
+            回调数据，超时返回None
+        """
+        subscribed = outTrackId in self._events
+        event = self.subscribe(outTrackId)
+        event.clear()
+        try:
+            await asyncio.wait_for(event.wait(), timeout)
+        except asyncio.TimeoutError:
+            return None
+        finally:
+            if not subscribed:
+                self.unsubscribe(outTrackId)
+        return self.get(outTrackId)
+
+    def _expire(self, now: float):
+        data = self._data
+        if self.ttl:
+            deadline = now - self.ttl
+            while data:
+                outTrackId, (at, _, _) = next(iter(data.items()))
+                if at >= deadline:
+                    break
+                del data[outTrackId]
+        if self.maxSize:
+            while len(data) > self.maxSize:
+                data.popitem(last=False)
+
+    def __getitem__(self, outTrackId: str) -> dict:
+        record = self.get(outTrackId)
+        if record is None:
+            raise KeyError(outTrackId)
+        return record
+
+    def __setitem__(self, outTrackId: str, data: dict):
+        self.publish(dict(data, outTrackId=outTrackId))
+
+    def __contains__(self, outTrackId: str) -> bool:
+        return self.get(outTrackId) is not None
+
+    def __len__(self) -> int:
+        self._expire(time.monotonic())
+        return len(self._data)
@@ -0,0 +1,145 @@
+import asyncio
+import time
+from typing import Any, Awaitable, Callable, Optional
+
+from ..log import logger
+
+
+class StreamingUpdater:
+
+    def __init__(
+            self,
+            send: Callable[[str, bool], Awaitable[Any]],
+            *,
+            minInterval: float = 0.3,
+            maxInterval: float = 2,
+            latencyFactor: float = 2,
+            flushChars: int = 0,
+            finalRetries: int = 2,
+            name: str = "",
+    ):
+        """合并AI卡片的流式更新
+
+        Notes:
+            每次 `update` 只记录最新的完整内容，后台按节奏发送：距上次发送至少间隔 `latencyFactor` 倍的接口平均延迟
+            (限制在 `minInterval` 和 `maxInterval` 之间)，新增字数达到 `flushChars` 时提前发送。
+            同一张卡片同时最多只有一个更新请求，发送期间的多次更新会被合并为一次。
+            `finish` 会等待正在进行的请求，再带上最终内容发送结束请求，失败时重试
+
+        Args:
+            send: 发送内容的函数，参数为完整内容和是否为最终内容
+            minInterval: 两次更新之间最短的间隔，单位为秒
+            maxInterval: 两次更新之间最长的间隔，单位为秒
+            latencyFactor: 更新间隔相对于接口平均延迟的倍数
+            flushChars: 新增字数达到此值时不等待间隔直接发送，为0时只按时间发送
+            finalRetries: 最终内容发送失败时的重试次数
+            name: 名称，用于日志
+        """
+        self.send = send
+        self.minInterval = minInterval
+        self.maxInterval = maxInterval
+        self.latencyFactor = latencyFactor
+        self.flushChars = flushChars
+        self.finalRetries = finalRetries
+        self.name = name
+        self.latency: Optional[float] = None
+        """更新请求的平均延迟(指数加权)，单位为秒"""
+        self.chunks: int = 0
+        """收到的更新次数"""
+        self.updates: int = 0
+        """实际发送的请求数，包括最终内容"""
+        self._latest: Optional[str] = None
+        self._sent: Optional[str] = None
+        self._lastSendAt: float = 0
+        self._event = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+        self._closing: bool = False
+
+    @property
+    def interval(self) -> float:
+        """当前的更新间隔"""
+        latency = self.latency or 0
+        return min(max(latency * self.latencyFactor, self.minInterval), self.maxInterval)
+
+    @property
+    def content(self) -> Optional[str]:
+        """最新的内容"""
+        return self._latest
+
+    def update(self, content: str):
+        """记录最新的完整内容，不等待发送"""
+        if self._closing:
+            return
+        self.chunks += 1
+        self._latest = content
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+        self._event.set()
+
+    def _size_due(self) -> bool:
+        return bool(self.flushChars) and len(self._latest or "") - len(self._sent or "") >= self.flushChars
+
+    async def _run(self):
+        while not self._closing:
+            await self._event.wait()
+            self._event.clear()
+            while self._latest != self._sent and not self._closing:
+                remaining = self._lastSendAt + self.interval - time.monotonic()
+                if remaining <= 0 or self._size_due():
+                    break
+                self._event.clear()
+                try:
+                    await asyncio.wait_for(self._event.wait(), remaining)
+                except asyncio.TimeoutError:
+                    break
+            if self._closing or self._latest == self._sent:
+                continue
+            try:
+                await self._send(self._latest, False)
+            except Exception as err:
+                logger.warning(f"[{self.name}] Streaming update failed -> {err.__class__.__name__}: {err}")
+
+    async def _send(self, content: str, final: bool):
+        start = time.monotonic()
+        self._lastSendAt = start
+        self.updates += 1
+        try:
+            await self.send(content, final)
+        finally:
+            latency = time.monotonic() - start
+            self.latency = latency if self.latency is None else self.latency * 0.7 + latency * 0.3
+        self._sent = content
+
+    async def _stop(self):
+        self._closing = True
+        self._event.set()
+        if self._task is not None:
+            await self._task
+
+    async def finish(self, content: str = None) -> bool:
+        """等待正在进行的更新，然后发送最终内容
+
+        Args:
+            content: 最终内容，为None时使用最新的内容
+
+        Returns:
+            最终内容是否发送成功
+        """
+        await self._stop()
+        if content is not None:
+            self._latest = content
+        content = self._latest or ""
+        for attempt in range(self.finalRetries + 1):
+            try:
+                await self._send(content, True)
+                return True
+            except Exception as err:
+                logger.warning(f"[{self.name}] Final streaming update failed ({attempt + 1}/{self.finalRetries + 1}) "
+                               f"-> {err.__class__.__name__}: {err}")
+                if attempt < self.finalRetries:
+                    await asyncio.sleep(self.interval)
+        return False
+
+    async def close(self):
+        """停止发送，不发送最终内容"""
+        await self._stop()
@@ -1,11 +1,11 @@
-from typing import Any, Awaitable, Callable, Coroutine, Dict, List, Optional, Union
+from typing import Any, Awaitable, Callable, Coroutine, Dict, List, Optional, Tuple, Union
 
 from aiohttp.web import Request
 from aiohttp.web_response import StreamResponse
 
 from .element import AppKey, AppSecret, EndPoint, Ticket
 from .i18n import i18n
-from .log import logger
+from .log import logger, set_level
 from .message.chain import MessageChain
 
 
@@ -86,11 +86,130 @@ class DataCacheTime:
             userInfoCacheTime: int = None,
             groupInfoCacheTime: int = None,
             userUnionIdConventCacheTime: int = 410281690,
+            objectCacheTime: float = 300,
+            objectCacheSize: int = 1024,
     ):
+        """数据缓存时间配置
+
+        Args:
+            dataCacheTime: 默认的数据缓存时间，单位为秒
+            userInfoCacheTime: 用户信息的缓存时间
+            groupInfoCacheTime: 群信息的缓存时间
+            userUnionIdConventCacheTime: unionId转换为staffId结果的缓存时间
+            objectCacheTime: 数据库读取结果在内存中的缓存时间，写入数据库时会自动失效
+            objectCacheSize: 内存中最多缓存的对象数量，为0时不使用内存缓存
+        """
         self.dataCacheTime = dataCacheTime
         self.userInfoCacheTime = userInfoCacheTime or dataCacheTime
         self.groupInfoCacheTime = groupInfoCacheTime or dataCacheTime
         self.userUnionIdConventCacheTime = userUnionIdConventCacheTime
+        self.objectCacheTime = objectCacheTime
+        self.objectCacheSize = objectCacheSize
+
+
+class CacheWriteBehind:
+
+    def __init__(
+            self,
+            *,
+            maxBatchSize: int = 256,
+            flushInterval: float = 0.5,
+    ):
+        """数据库延迟写入配置，启用后写入会按键合并，由后台线程在一个事务中批量提交
+
+        Notes:
+            延迟写入期间的数据可能不会立即被读取到，停止时会自动提交所有等待中的写入
+
+        Args:
+            maxBatchSize: 等待的写入达到此数量时立即提交
+            flushInterval: 最长的提交间隔，单位为秒
+        """
+        self.maxBatchSize = maxBatchSize
+        self.flushInterval = flushInterval
+
+
+class StreamOptions:
+
+    def __init__(
+            self,
+            *,
+            maxConcurrency: int = 0,
+            keepConversationOrder: bool = True,
+            reconnectBaseDelay: float = 1,
+            reconnectMaxDelay: float = 60,
+            reconnectFactor: float = 2,
+            reconnectJitter: float = 0.5,
+            standbyOnDisconnect: bool = True,
+            standbyDrainTimeout: float = 30,
+            dedupSize: int = 4096,
+            dedupTTL: float = 600,
+    ):
+        """Stream消息处理配置
+
+        Notes:
+            默认按接收顺序逐条处理，处理完成后才回复确认，进程崩溃或处理失败时钉钉会重新推送。
+            `maxConcurrency` 大于0时启用并发处理：接收到消息后会立即回复确认，再交给后台处理，慢的回调不会阻塞后续消息，
+            但确认后如果进程崩溃，正在处理的消息不会被重新推送。同时处理的消息达到上限时会暂停读取，直到有消息处理完成。
+            连接失败时按指数退避重连，连接成功后重置等待时间
+
+        Args:
+            maxConcurrency: 并发处理时同时处理的最大消息数，为0(默认)时按接收顺序逐条处理并在处理完成后回复确认
+            keepConversationOrder: 是否保证同一会话的消息按接收顺序处理
+            reconnectBaseDelay: 第一次重连前的等待时间，单位为秒
+            reconnectMaxDelay: 重连前最长的等待时间，单位为秒
+            reconnectFactor: 每次重连失败后等待时间的倍数
+            reconnectJitter: 等待时间随机减少的最大比例，在0到1之间
+            standbyOnDisconnect: 服务端要求断开时，是否立即建立新连接，旧连接继续接收消息直到服务端关闭
+            standbyDrainTimeout: 建立新连接后，旧连接最多继续接收消息的时间，单位为秒
+            dedupSize: 用于检测重复推送的消息记录数，同一AppKey的所有Stream连接共用
+            dedupTTL: 消息记录的保留时间，单位为秒
+        """
+        self.maxConcurrency = maxConcurrency
+        self.keepConversationOrder = keepConversationOrder
+        self.reconnectBaseDelay = reconnectBaseDelay
+        self.reconnectMaxDelay = reconnectMaxDelay
+        self.reconnectFactor = reconnectFactor
+        self.reconnectJitter = reconnectJitter
+        self.standbyOnDisconnect = standbyOnDisconnect
+        self.standbyDrainTimeout = standbyDrainTimeout
+        self.dedupSize = dedupSize
+        self.dedupTTL = dedupTTL
+
+
+class HttpClient:
+
+    def __init__(
+            self,
+            *,
+            limit: int = 100,
+            limitPerHost: int = 30,
+            keepaliveTimeout: float = 30,
+            dnsCacheTime: Optional[int] = 300,
+            totalTimeout: Optional[float] = 300,
+            connectTimeout: Optional[float] = 10,
+            readTimeout: Optional[float] = 60,
+            streamReadTimeout: Optional[float] = 120,
+    ):
+        """共享的HTTP连接池配置，框架发出的所有请求(包括Webhook回复和AI接口)都会复用连接
+
+        Args:
+            limit: 最大连接数，为0时不限制
+            limitPerHost: 每个主机的最大连接数，为0时不限制
+            keepaliveTimeout: 空闲连接的保持时间，单位为秒
+            dnsCacheTime: DNS解析结果的缓存时间，为None时永久缓存
+            totalTimeout: 单次请求的总超时时间，为None时不限制
+            connectTimeout: 建立连接的超时时间
+            readTimeout: 读取数据的超时时间
+            streamReadTimeout: 流式的AI接口两次收到数据之间的最长间隔，这类请求不受 `totalTimeout` 限制
+        """
+        self.limit = limit
+        self.limitPerHost = limitPerHost
+        self.keepaliveTimeout = keepaliveTimeout
+        self.dnsCacheTime = dnsCacheTime
+        self.totalTimeout = totalTimeout
+        self.connectTimeout = connectTimeout
+        self.readTimeout = readTimeout
+        self.streamReadTimeout = streamReadTimeout
 
 
 class FailedMessage:
@@ -114,14 +233,278 @@ class AdvancedSendMessage:
     def __init__(
             self,
             *,
-            aiAssistantMessageSupport: bool = False
+            aiAssistantMessageSupport: bool = False,
+            concurrentSend: bool = False,
+            maxConcurrentUploads: int = 4,
+            keepSendOrder: bool = True,
+            batchRecall: bool = False
     ):
         """
 
         Args:
             aiAssistantMessageSupport: 支持在send_message函数发送AI助理消息
+            concurrentSend: send_message发送多条消息时，先并行上传所有文件，再依次发送
+            maxConcurrentUploads: 并行上传的最大文件数
+            keepSendOrder: 并行模式下是否按顺序发送，上一条消息的请求发出后即开始发送下一条，不等待响应。
+                为False时同时发送所有消息，到达顺序不确定
+            batchRecall: recall_message撤回多条消息时，将同一会话的消息合并为一次请求
         """
         self.aiAssistantMessageSupport = aiAssistantMessageSupport
+        self.concurrentSend = concurrentSend
+        self.maxConcurrentUploads = maxConcurrentUploads
+        self.keepSendOrder = keepSendOrder
+        self.batchRecall = batchRecall
+
+
+class RateLimit:
+
+    def __init__(
+            self,
+            *,
+            enabled: bool = False,
+            pathQps: float = 20,
+            appQps: float = 0,
+            paths: Dict[str, float] = None,
+            burst: float = None,
+            maxRetries: int = 3,
+            retryBaseDelay: float = 1,
+            retryMaxDelay: float = 30,
+    ):
+        """API请求的客户端限流配置
+
+        Notes:
+            启用后每个应用的每个接口使用独立的令牌桶，超出限额的请求会排队等待，按先来后到的顺序发出。
+            无论是否启用，钉钉返回限流错误(HTTP 429, 90002, 90018, QpsLimit)时，都会按 `Retry-After` 或指数退避等待后自动重试，
+            重试次数用尽后按 `raiseForApiError` 的设置处理
+
+        Args:
+            enabled: 是否在客户端限流
+            pathQps: 每个应用调用单个接口的默认QPS，为0时不限制
+            appQps: 每个应用调用所有接口的总QPS，为0时不限制
+            paths: 单独设置QPS的接口路径，如 `{"/v1.0/robot/groupMessages/send": 10}`
+            burst: 令牌桶容量，即允许的突发请求数，默认与QPS相同
+            maxRetries: 触发限流后的最大重试次数，为0时不重试
+            retryBaseDelay: 没有 `Retry-After` 时第一次重试前的等待时间，单位为秒
+            retryMaxDelay: 重试前最长的等待时间，单位为秒
+        """
+        self.enabled = enabled
+        self.pathQps = pathQps
+        self.appQps = appQps
+        self.paths = paths or {}
+        self.burst = burst
+        self.maxRetries = maxRetries
+        self.retryBaseDelay = retryBaseDelay
+        self.retryMaxDelay = retryMaxDelay
+
+
+class RetryPolicy:
+
+    def __init__(
+            self,
+            *,
+            maxRetries: int = 2,
+            baseDelay: float = 0.2,
+            maxDelay: float = 5,
+            jitter: float = 0.5,
+            retryStatuses: Tuple[int, ...] = (500, 502, 503, 504),
+            retryOnTimeout: bool = True,
+            idempotentMethods: Tuple[str, ...] = ("GET", "HEAD"),
+            dedupKeys: Tuple[str, ...] = (),
+            hedgePercentile: Optional[float] = None,
+            hedgeMinSamples: int = 50,
+            hedgeMinDelay: float = 0.05,
+    ):
+        """API请求的重试与对冲策略
+
+        Notes:
+            只有幂等的请求会重试或对冲：`idempotentMethods` 中的请求，以及JSON请求体中带有 `dedupKeys` 之一的请求。
+            钉钉的PUT和DELETE接口(如更新卡片)重复发送可能产生重复的副作用，默认只有GET和HEAD视为幂等，
+            确认接口会按请求体中的键去重时才应加入 `dedupKeys`，也可以在单次请求中传入 `idempotent=True`。
+            对冲是指请求耗时超过同一接口最近延迟的 `hedgePercentile` 分位数时，再发出一个相同的请求，使用先返回的结果
+
+        Args:
+            maxRetries: 最大重试次数，为0时不重试
+            baseDelay: 第一次重试前的等待时间，单位为秒
+            maxDelay: 重试前最长的等待时间，单位为秒
+            jitter: 等待时间随机减少的最大比例，在0到1之间
+            retryStatuses: 需要重试的HTTP状态码
+            retryOnTimeout: 是否在超时或连接错误时重试
+            idempotentMethods: 视为幂等的请求方法
+            dedupKeys: 请求体中带有这些键时视为幂等，默认为空
+            hedgePercentile: 触发对冲的延迟分位数，如95，为None时不对冲
+            hedgeMinSamples: 接口的延迟样本数达到此值后才会对冲
+            hedgeMinDelay: 对冲前最短的等待时间，单位为秒
+        """
+        self.maxRetries = maxRetries
+        self.baseDelay = baseDelay
+        self.maxDelay = maxDelay
+        self.jitter = jitter
+        self.retryStatuses = retryStatuses
+        self.retryOnTimeout = retryOnTimeout
+        self.idempotentMethods = idempotentMethods
+        self.dedupKeys = dedupKeys
+        self.hedgePercentile = hedgePercentile
+        self.hedgeMinSamples = hedgeMinSamples
+        self.hedgeMinDelay = hedgeMinDelay
+
+
+class AICardStreaming:
+
+    def __init__(
+            self,
+            *,
+            minInterval: float = 0.3,
+            maxInterval: float = 2,
+            latencyFactor: float = 2,
+            flushChars: int = 0,
+            finalRetries: int = 2,
+    ):
+        """AI卡片流式更新的节奏
+
+        Notes:
+            生成的内容会被合并后再更新到卡片，两次更新的间隔为接口平均延迟的 `latencyFactor` 倍，
+            限制在 `minInterval` 和 `maxInterval` 之间。同一张卡片同时最多只有一个更新请求
+
+        Args:
+            minInterval: 两次更新之间最短的间隔，单位为秒，为0时只受接口延迟限制
+            maxInterval: 两次更新之间最长的间隔，单位为秒
+            latencyFactor: 更新间隔相对于接口平均延迟的倍数
+            flushChars: 新增字数达到此值时不等待间隔直接更新，为0时只按时间更新
+            finalRetries: 最终内容发送失败时的重试次数
+        """
+        self.minInterval = minInterval
+        self.maxInterval = maxInterval
+        self.latencyFactor = latencyFactor
+        self.flushChars = flushChars
+        self.finalRetries = finalRetries
+
+
+class BroadcastOptions:
+
+    def __init__(
+            self,
+            *,
+            qps: float = 20,
+            userBatchSize: int = 20,
+            maxConcurrency: int = 16,
+            maxRetries: int = 3,
+            retryBaseDelay: float = 1,
+            retryMaxDelay: float = 30,
+    ):
+        """Dingtalk.broadcast 的配置
+
+        Args:
+            qps: 每秒最多发起的请求数，用户和群共用
+            userBatchSize: 每次请求最多包含的用户数，钉钉限制为20
+            maxConcurrency: 同时进行的最大请求数
+            maxRetries: 触发限流后的最大重试次数
+            retryBaseDelay: 第一次重试前的等待时间，单位为秒
+            retryMaxDelay: 重试前最长的等待时间，单位为秒
+        """
+        self.qps = qps
+        self.userBatchSize = userBatchSize
+        self.maxConcurrency = maxConcurrency
+        self.maxRetries = maxRetries
+        self.retryBaseDelay = retryBaseDelay
+        self.retryMaxDelay = retryMaxDelay
+
+
+class AccessLog:
+
+    def __init__(
+            self,
+            *,
+            console: bool = True,
+            file: Optional[str] = None,
+            sampleRate: float = 1,
+            uaPolicy: str = "all",
+            flushInterval: float = 1,
+            maxQueue: int = 10000,
+    ):
+        """HTTP服务的访问日志
+
+        Notes:
+            `file` 不为None时以JSON Lines格式写入文件，每行一个请求，由后台线程批量写出，不阻塞事件循环；
+            队列中超过 `maxQueue` 条时丢弃新的记录。`sampleRate` 只作用于状态码小于400的请求，错误和被拒绝的请求总会记录
+
+        Args:
+            console: 是否在控制台输出访问日志
+            file: JSON Lines访问日志的文件路径，为None时不写入文件
+            sampleRate: 成功请求的采样比例，在0到1之间
+            uaPolicy: User-Agent检查策略，可选 `all`、`user`、`dingtalk`、`dingtalk-user`，`all` 时不检查
+            flushInterval: 写入文件的最长间隔，单位为秒
+            maxQueue: 等待写入的最大记录数
+        """
+        self.console = console
+        self.file = file
+        self.sampleRate = sampleRate
+        self.uaPolicy = uaPolicy
+        self.flushInterval = flushInterval
+        self.maxQueue = maxQueue
+
+
+class Metrics:
+
+    def __init__(self, *, enabled: bool = True, path: Optional[str] = "/metrics"):
+        """运行指标
+
+        Notes:
+            启用后记录监听函数耗时、API请求延迟与状态码、Stream帧数与确认延迟、数据库查询耗时和发送消息耗时等指标，
+            可以通过 `dingraia.metrics.registry` 获取，或者在HTTP服务的 `path` 上以Prometheus文本格式导出
+
+        Args:
+            enabled: 是否记录指标
+            path: 导出指标的HTTP路径，为None时不添加路由，只有在指定了端口启动HTTP服务时有效
+        """
+        self.enabled = enabled
+        self.path = path
+
+
+class Profiler:
+
+    def __init__(self, *, enabled: bool = True, blockThreshold: float = 0.1, dumpOnStop: bool = True, top: int = 20):
+        """监听函数的耗时统计
+
+        Notes:
+            启用后统计每个监听函数的总耗时、占用事件循环的时间(两次await之间连续运行的时间)和线程池中的运行时间，
+            单次占用事件循环超过 `blockThreshold` 时输出警告。统计数据可以通过 `app.profiler` 获取
+
+        Args:
+            enabled: 是否启用
+            blockThreshold: 单次占用事件循环超过此时间时输出警告，单位为秒，为0时不检测
+            dumpOnStop: 停止时是否在日志中输出统计表格
+            top: 输出的监听函数数量
+        """
+        self.enabled = enabled
+        self.blockThreshold = blockThreshold
+        self.dumpOnStop = dumpOnStop
+        self.top = top
+
+
+class StallWatchdog:
+
+    def __init__(
+            self, *, enabled: bool = True, threshold: float = 1, interval: float = 0.1, captureStack: bool = True,
+            stackLimit: int = 30
+    ):
+        """事件循环卡顿监控
+
+        Notes:
+            后台线程定时向事件循环发送心跳，心跳超过 `threshold` 秒未被执行时输出事件循环线程的调用栈和正在运行的任务，
+            用于定位阻塞事件循环的同步调用。计数可以通过 `app.stallMonitor.snapshot()` 获取
+
+        Args:
+            enabled: 是否启用
+            threshold: 判定为卡顿的延迟，单位为秒
+            interval: 心跳的间隔，单位为秒
+            captureStack: 是否抓取调用栈
+            stackLimit: 调用栈最多保留的帧数
+        """
+        self.enabled = enabled
+        self.threshold = threshold
+        self.interval = interval
+        self.captureStack = captureStack
+        self.stackLimit = stackLimit
 
 
 class Config:
@@ -136,6 +519,7 @@ class Config:
             autoBotConfig: bool = True,
             useDatabase: bool = True,
             dataCacheTime: DataCacheTime = None,
+            cacheWriteBehind: CacheWriteBehind = None,
             waitRadioMessageFinishedTimeout: int = 10,
             webRequestHandlers: List[Middleware] = None,
             raiseForApiError: bool = True,
@@ -143,6 +527,18 @@ class Config:
             sendMessageOnFailed: Optional[FailedMessage] = None,
             getUserOnAssistantMessage: bool = True,
             language: str = None,
+            tokenRefreshAhead: int = 300,
+            httpClient: HttpClient = None,
+            streamOptions: StreamOptions = None,
+            broadcastOptions: BroadcastOptions = None,
+            rateLimit: RateLimit = None,
+            retryPolicy: RetryPolicy = None,
+            aiCardStreaming: AICardStreaming = None,
+            logLevel: Union[str, int] = None,
+            accessLog: AccessLog = None,
+            metrics: Metrics = None,
+            profiler: Profiler = None,
+            stallWatchdog: StallWatchdog = None,
     ):
         """初始化Config
         
@@ -155,6 +551,7 @@ class Config:
             stream:
             autoBotConfig: 是否自动替换Bot的值
             useDatabase: 是否使用数据库，不使用数据库可能会导致异常
+            cacheWriteBehind: 数据库延迟写入配置，为None时每次写入立即提交
             raiseForApiError: 是否在请求API失败时主动抛出异常
             advancedSendMessage: 更强大/方便的send_message，可以方便的使用一些功能
             sendMessageOnFailed: 是否在发送失败时发送替代信息
@@ -162,16 +559,40 @@ class Config:
             waitRadioMessageFinishedTimeout: 停止时等待广播消息处理完成的超时时间
             webRequestHandlers: 自定义请求处理器
             language: 语言
+            tokenRefreshAhead: 在AccessToken过期前多少秒由后台任务主动刷新
+            httpClient: 共享的HTTP连接池配置
+            streamOptions: Stream消息处理配置
+            broadcastOptions: 批量发送消息的配置
+            rateLimit: API请求的客户端限流配置
+            retryPolicy: API请求的重试与对冲策略
+            aiCardStreaming: AI卡片流式更新的节奏
+            logLevel: 日志的最低输出等级，如 `INFO`，为None时输出全部日志
+            accessLog: HTTP服务的访问日志配置
+            metrics: 运行指标的配置，为None时不记录
+            profiler: 监听函数耗时统计的配置，为None时不统计
+            stallWatchdog: 事件循环卡顿监控的配置，为None时不监控
         """
         self.raiseForApiError = raiseForApiError
         self.useDatabase = useDatabase
         self.dataCacheTime = dataCacheTime or DataCacheTime()
+        self.cacheWriteBehind = cacheWriteBehind
         self.waitRadioMessageFinishedTimeout = waitRadioMessageFinishedTimeout
         self.event_callback = event_callback
         self.customStreamConnect = customStreamConnect
         self.advancedSendMessage = advancedSendMessage or AdvancedSendMessage()
         self.sendMessageOnFailed = sendMessageOnFailed or FailedMessage()
         self.getUserOnAssistantMessage = getUserOnAssistantMessage
+        self.tokenRefreshAhead = tokenRefreshAhead
+        self.httpClient = httpClient or HttpClient()
+        self.streamOptions = streamOptions or StreamOptions()
+        self.broadcastOptions = broadcastOptions or BroadcastOptions()
+        self.rateLimit = rateLimit or RateLimit()
+        self.retryPolicy = retryPolicy or RetryPolicy()
+        self.aiCardStreaming = aiCardStreaming or AICardStreaming()
+        self.accessLog = accessLog or AccessLog()
+        self.metrics = metrics or Metrics(enabled=False)
+        self.profiler = profiler or Profiler(enabled=False)
+        self.stallWatchdog = stallWatchdog or StallWatchdog(enabled=False)
         self.bot: Optional[Bot] = bot
         self.stream: Optional[List[Stream]] = stream
         self.webRequestHandlers = webRequestHandlers or []
@@ -182,6 +603,8 @@ class Config:
             self.stream = []
         if language:
             i18n.setLang(language)
+        if logLevel is not None:
+            set_level(logLevel)
         if not useDatabase:
             logger.warning(i18n.DisableDatabaseWarningText)
         if len(self.stream) == 1 and autoBotConfig:
@@ -1,3 +1,5 @@
 from contextvars import ContextVar
 
 DingTalk_instance = ContextVar("DingTalk")
+send_accepted = ContextVar("send_accepted", default=None)
+"""按顺序并行发送消息时，当前消息的请求头发出后设置的 `asyncio.Event`"""
@@ -2,9 +2,13 @@ import json
 import time
 import urllib.request
 from collections import OrderedDict
-from typing import Any, Literal, Optional, Union
+from typing import Any, Literal, Optional, TYPE_CHECKING, Union
 
 from .exceptions import DingtalkAPIError
+from .vars import DINGTALK_OAPI
+
+if TYPE_CHECKING:
+    import aiohttp
 
 
 class OpenConversationId:
@@ -46,6 +50,9 @@ class AccessToken:
 
     expired: int = 0
 
+    TOKEN_URL: str = DINGTALK_OAPI + "/gettoken"
+    """获取AccessToken的地址，可替换为本地的测试服务"""
+
     def __init__(
             self,
             accessToken: str = None,
@@ -72,7 +79,7 @@ class AccessToken:
                 return self
         if not self.appKey or not self.appSecret:
             raise ValueError
-        url = f"https://oapi.dingtalk.com/gettoken?appkey={self.appKey}&appsecret={self.appSecret}"
+        url = f"{self.TOKEN_URL}?appkey={self.appKey}&appsecret={self.appSecret}"
         with urllib.request.urlopen(url) as response:
             if response.status != 200:
                 raise DingtalkAPIError(response.read().decode('utf-8'))
@@ -81,6 +88,33 @@ class AccessToken:
         self.expired = res['expires_in'] if res['expires_in'] > 1600000000 else int(time.time()) + res['expires_in']
         return self
 
+    async def async_refresh(self, session: "aiohttp.ClientSession", force=False) -> "AccessToken":
+        """使用异步请求刷新AccessToken，不会阻塞事件循环
+
+        Args:
+            session: 用于请求的ClientSession
+            force: 是否在未过期时也刷新
+
+        Returns:
+            AccessToken
+        """
+        if not force:
+            if self.ok:
+                return self
+        if not self.appKey or not self.appSecret:
+            raise ValueError
+        async with session.get(
+                self.TOKEN_URL, params={"appkey": self.appKey, "appsecret": self.appSecret}
+        ) as response:
+            if response.status != 200:
+                raise DingtalkAPIError(await response.text())
+            res = await response.json(content_type=None)
+        if res.get('errcode'):
+            raise DingtalkAPIError(res)
+        self.token = res['access_token']
+        self.expired = res['expires_in'] if res['expires_in'] > 1600000000 else int(time.time()) + res['expires_in']
+        return self
+
     def safe(self):
         if self:
             return self.token
@@ -131,6 +165,61 @@ class Response:
         return f"<Response [{self.ok}]>"
 
 
+class BroadcastResult:
+
+    def __init__(self, target: str, targetType: str):
+        """Dingtalk.broadcast 中单个目标的发送结果
+
+        Args:
+            target: 用户的staffId或群的openConversationId
+            targetType: `user` 或 `group`
+        """
+        self.target = target
+        self.targetType = targetType
+        self.ok: bool = False
+        self.processQueryKey: Optional[str] = None
+        """用于撤回消息，同一批次的用户相同"""
+        self.error: Optional[str] = None
+        self.attempts: int = 0
+
+    def __bool__(self) -> bool:
+        return self.ok
+
+    def __repr__(self):
+        return f"<BroadcastResult {self.targetType}:{self.target} [{self.ok}]>"
+
+
+class BroadcastReport:
+
+    def __init__(self):
+        self.results: "OrderedDict[str, BroadcastResult]" = OrderedDict()
+        """目标与发送结果，顺序与传入的目标相同"""
+        self.requests: int = 0
+        """实际发起的请求数，包括重试"""
+        self.elapsed: float = 0
+
+    @property
+    def succeeded(self) -> list:
+        return [r for r in self.results.values() if r.ok]
+
+    @property
+    def failed(self) -> list:
+        return [r for r in self.results.values() if not r.ok]
+
+    def __getitem__(self, target) -> BroadcastResult:
+        return self.results[str(target)]
+
+    def __len__(self) -> int:
+        return len(self.results)
+
+    def __bool__(self) -> bool:
+        return all(r.ok for r in self.results.values())
+
+    def __repr__(self):
+        return (f"<BroadcastReport {len(self.succeeded)}/{len(self.results)} succeeded, "
+                f"{self.requests} requests in {self.elapsed:.2f}s>")
+
+
 class FixedSizeDict(OrderedDict):
     def __init__(self, *args, max_size=50, **kwargs):
         super().__init__(*args, **kwargs)
@@ -148,6 +148,8 @@ err_code_map = {
     60121                                               : UserNotFoundError,
     90002                                               : APIRateLimitedError,
     90018                                               : APIRateLimitedError,
+    "Forbidden.AccessDenied.QpsLimitForApi"             : APIRateLimitedError,
+    "Forbidden.AccessDenied.QpsLimitForAppkeyAndApi"    : APIRateLimitedError,
     400002                                              : WrongParameterError,
     430104: NSFWMessageError,
 }
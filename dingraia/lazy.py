@@ -15,7 +15,8 @@ from .message.chain import MessageChain  # NOQA
 from .message.element import *  # NOQA
 from .model import *  # NOQA
 from .saya import *  # NOQA
-from .saya.builtins.broadcast import ListenerSchema  # NOQA
+from .saya.builtins.broadcast import Command, ListenerSchema  # NOQA
+from .saya.builtins.broadcast.filters import GroupFilter, PrefixFilter, RegexFilter, SenderFilter  # NOQA
 from .tools import *  # NOQA
 from .util.async_exec import cpu_bound, io_bound  # NOQA
 
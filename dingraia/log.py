@@ -1,24 +1,17 @@
 """
 
 """
-from typing import Union
+from typing import Any, Callable, Dict, List, Optional, Union
 import re
 from loguru import logger as _logger
+from loguru._defaults import LOGURU_FORMAT
 from loguru._logger import Logger
 from loguru._logger import Core as _Core
-import inspect
 import sys
 from copy import copy
 from .i18n import i18n
 
 
-def logger_filter(record):
-    name = record['extra'].get("name")
-    if name is None:
-        return True
-    return not name.startswith("_logger")
-
-
 def logger_formatter(record):
     level = str(record['level'].name)
     message = "<level>{time:YYYY-MM-DD HH:mm:ss:SSS}</level> " + \
@@ -27,37 +20,81 @@ def logger_formatter(record):
     return message
 
 
+LOGGER_FORMATS = {
+    # 2024-08-24 04:00:00 | INFO    | module:function:line Hello, world!
+    "_logger_1": "<green>{time:YYYY-MM-DD HH:mm:ss:SSS}</green> "
+                 "<red>|</red> <level>{level: <8}</level> "
+                 "<red>|</red> <level>{message}</level>\n{exception}",
+    # [2024-08-24 04:00:00] INFO     Hello, world!
+    "_logger_3": "<blue>[{time:YYYY-MM-DD HH:mm:ss:SSS} <level>{level: >8}</level>]</blue> "
+                 " "
+                 "{message}\n{exception}",
+    # INFO     : Hello, world!
+    "_logger_4": "<level>{level: <8}</level>: "
+                 "<level>{message}</level>\n{exception}",
+}
+"""各个logger的输出格式，_logger_2 (2024-08-24 04:00:00 I/function:line Hello, world!) 的格式与等级有关，
+由 `logger_formatter` 生成"""
+_DEFAULT_FORMAT = LOGURU_FORMAT + "\n{exception}"
+_levelFormats: Dict[str, str] = {}
+
+
+def route_format(record) -> str:
+    """根据logger的名称选择输出格式，所有logger共用同一个sink"""
+    name = record['extra'].get("name")
+    fmt = LOGGER_FORMATS.get(name)
+    if fmt is not None:
+        return fmt
+    if name == "_logger_2":
+        level = record['level'].name
+        fmt = _levelFormats.get(level)
+        if fmt is None:
+            fmt = _levelFormats[level] = logger_formatter(record)
+        return fmt
+    return _DEFAULT_FORMAT
+
+
 _logger = _logger.opt(colors=True)
 _logger.remove()
-_logger.add(sys.stdout,
-            # 2024-08-24 04:00:00 | INFO    | module:function:line Hello, world!
-            filter=logger_filter,
-            enqueue=True)
-_logger.add(sys.stdout,
-            format="<green>{time:YYYY-MM-DD HH:mm:ss:SSS}</green> "
-                   "<red>|</red> <level>{level: <8}</level> "
-                   "<red>|</red> <level>{message}</level>",
-            # 2024-08-24 04:00:00 | INFO    | module:function:line Hello, world!
-            filter=lambda record: record['extra'].get("name") == "_logger_1",
-            enqueue=True)
-_logger.add(sys.stdout,
-            format=logger_formatter,
-            # 2024-08-24 04:00:00 I/function:line Hello, world!
-            filter=lambda record: record['extra'].get("name") == "_logger_2",
-            enqueue=True)
-_logger.add(sys.stdout,
-            format="<blue>[{time:YYYY-MM-DD HH:mm:ss:SSS} <level>{level: >8}</level>]</blue> "
-                   " "
-                   "{message}",
-            # [2024-08-24 04:00:00] INFO     Hello, world!
-            filter=lambda record: record['extra'].get("name") == "_logger_3",
-            enqueue=True)
-_logger.add(sys.stdout,
-            format="<level>{level: <8}</level>: "
-                   "<level>{message}</level>",
-            # INFO     : Hello, world!
-            filter=lambda record: record['extra'].get("name") == "_logger_4",
-            enqueue=True)
+_sinkId: Optional[int] = None
+_minLevel: int = 0
+"""sink的最低输出等级，在添加sink时记录"""
+_sinkOptions = {"sink": sys.stdout, "level": "DEBUG", "enqueue": True, "colorize": None}
+
+
+def configure_logging(*, sink=None, level: Union[str, int] = None, enqueue: bool = None, colorize: bool = None):
+    """配置框架的日志输出，未传入的参数保持不变
+
+    Notes:
+        所有logger共用一个sink，按名称选择格式。`enqueue` 为True时由后台线程写出，调用线程只需要将记录放入队列，
+        但每条记录都需要序列化；为False时在调用线程中直接写出，单进程下开销更小
+
+    Args:
+        sink: 输出目标，默认为标准输出
+        level: 最低输出等级，低于此等级的日志在格式化之前就会被忽略
+        enqueue: 是否通过队列由后台线程写出
+        colorize: 是否输出颜色，为None时自动判断
+
+    Returns:
+        None
+    """
+    global _sinkId, _minLevel
+    for key, value in (("sink", sink), ("level", level), ("enqueue", enqueue), ("colorize", colorize)):
+        if value is not None:
+            _sinkOptions[key] = value
+    if _sinkId is not None:
+        _logger.remove(_sinkId)
+    _sinkId = _logger.add(format=route_format, **_sinkOptions)
+    level = _sinkOptions["level"]
+    _minLevel = level if isinstance(level, int) else _logger.level(level).no
+
+
+def set_level(level: Union[str, int]):
+    """设置最低输出等级，如 `DEBUG`、`INFO`、`WARNING`"""
+    configure_logging(level=level)
+
+
+configure_logging()
 _raw_logger = _logger.bind(name="logger")
 _logger_1 = _logger.bind(name="_logger_1")
 _logger_2 = _logger.bind(name="_logger_2")
@@ -66,6 +103,28 @@ _logger_4 = _logger.bind(name="_logger_4")
 logger_list = [_logger_1, _logger_2, _logger_3, _logger_4]
 
 
+_MARKUP_PATTERN = re.compile(r'<[^<>\s]+>')
+
+
+class LazyMessage:
+    __slots__ = ("func",)
+
+    def __init__(self, func: Callable[[], Any]):
+        """在确认需要输出后才生成的日志消息，如 `logger.debug(LazyMessage(lambda: f"data -> {data}"))`
+
+        Args:
+            func: 生成消息的函数
+        """
+        self.func = func
+
+    def __str__(self):
+        return str(self.func())
+
+
+def _escape_markup(match: re.Match) -> str:
+    return match.group(0).replace('<', '\\<')
+
+
 class _Logger(Logger):
     color_enable_sign = "<-Dingraia-Color-Enable->"
 
@@ -115,18 +174,16 @@ class _Logger(Logger):
         func_name = caller_frame.f_code.co_name if caller_frame.f_code.co_name != "<module>" else "__main__"
         return [module_name.replace("<", "\\<"), func_name.replace("<", "\\<"), line]
 
-    def generate_message(self, lies: list, _message: str):
-        pat = r'<[^<>\s]+>'
-        index = self.current_logger_index()
+    def generate_message(self, lies: Optional[list], _message: str, index: int = None):
+        if index is None:
+            index = self.current_logger_index()
         _message = str(_message)
         if _message.startswith(self.color_enable_sign):
             _message = _message.replace(self.color_enable_sign, "")
-        else:
+        elif "<" in _message:
             _message = _message.replace("<>", "\\<>")
-            _message = re.sub(pat, lambda match: match.group(0).replace('<', '\\<'), _message)
-        if index == -1:
-            _message = _message
-        elif index == 0:
+            _message = _MARKUP_PATTERN.sub(_escape_markup, _message)
+        if index == 0:
             m_n = f"<cyan>{lies[0]}</>" if lies[0] else ""
             f_n = f"<cyan>{lies[1]}</>" if lies[1] else ""
             l_n = f"<cyan>{lies[2]}</>" if lies[2] else ""
@@ -139,48 +196,47 @@ class _Logger(Logger):
             _inspect = '<red>:</>'.join([x for x in [f_n, l_n] if x])
             _message = (_inspect + (" - " if _inspect else "") +
                         str(_message))
-        elif index == 2:
-            _message = _message
-        elif index == 3:
-            _message = _message
         return _message
 
+    def _log(self, method: str, levelno: int, __message, args, kwargs, _inspect):
+        """先判断等级，再按需获取调用位置和生成消息"""
+        if levelno < _minLevel:
+            return
+        if isinstance(__message, LazyMessage):
+            __message = __message.func()
+        index = self.current_logger_index()
+        lies = None
+        if index in (0, 1):
+            lies = self._get_caller(_inspect or sys._getframe(1))  # NOQA
+        __message = self.generate_message(lies=lies, _message=__message, index=index)
+        getattr(self.logger, method)(__message, *args, **kwargs)
+
     def trace(self, __message, *args, _inspect=None, **kwargs):
-        lies = self._get_caller(_inspect or inspect.currentframe())
-        __message = self.generate_message(lies=lies, _message=__message)
-        self.logger.trace(__message, *args, **kwargs)
+        self._log("trace", 5, __message, args, kwargs, _inspect)
 
     def debug(self, __message, *args, _inspect=None, **kwargs):
-        lies = self._get_caller(_inspect or inspect.currentframe())
-        __message = self.generate_message(lies=lies, _message=__message)
-        self.logger.debug(__message, *args, **kwargs)
+        self._log("debug", 10, __message, args, kwargs, _inspect)
 
     def info(self, __message, *args, _inspect=None, **kwargs):
-        lies = self._get_caller(_inspect or inspect.currentframe())
-        __message = self.generate_message(lies=lies, _message=__message)
-        self.logger.info(__message, *args, **kwargs)
+        self._log("info", 20, __message, args, kwargs, _inspect)
 
     def success(self, __message, *args, _inspect=None, **kwargs):
-        lies = self._get_caller(_inspect or inspect.currentframe())
-        __message = self.generate_message(lies=lies, _message=__message)
-        self.logger.success(__message, *args, **kwargs)
+        self._log("success", 25, __message, args, kwargs, _inspect)
 
     def warning(self, __message, *args, _inspect=None, **kwargs):
-        lies = self._get_caller(_inspect or inspect.currentframe())
-        __message = self.generate_message(lies=lies, _message=__message)
-        self.logger.warning(__message, *args, **kwargs)
+        self._log("warning", 30, __message, args, kwargs, _inspect)
 
     def error(self, __message, *args, _inspect=None, **kwargs):
-        lies = self._get_caller(_inspect or inspect.currentframe())
-        __message = self.generate_message(lies=lies, _message=__message)
-        self.logger.error(__message, *args, **kwargs)
+        self._log("error", 40, __message, args, kwargs, _inspect)
 
     def critical(self, __message, *args, _inspect=None, **kwargs):
-        lies = self._get_caller(_inspect or inspect.currentframe())
-        __message = self.generate_message(lies=lies, _message=__message)
-        self.logger.critical(__message, *args, **kwargs)
+        self._log("critical", 50, __message, args, kwargs, _inspect)
 
     def exception(self, __message, *args, **kwargs):
+        if 40 < _minLevel:
+            return
+        if isinstance(__message, LazyMessage):
+            __message = __message.func()
         _raw_logger.exception(__message, *args, **kwargs)
 
     def catch(
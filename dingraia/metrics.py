@@ -0,0 +1,409 @@
+import bisect
+import functools
+import math
+import threading
+import time
+import weakref
+from typing import Callable, Dict, Iterable, List, Optional, Tuple, Union
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+"""默认的直方图分桶，单位为秒"""
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_value(value: float) -> str:
+    if value == math.inf:
+        return "+Inf"
+    if value == -math.inf:
+        return "-Inf"
+    if isinstance(value, float) and value.is_integer() and abs(value) < 1e15:
+        return str(int(value))
+    return repr(value) if isinstance(value, float) else str(value)
+
+
+class _Metric:
+    type = ""
+
+    def __init__(self, registry: "MetricsRegistry", name: str, description: str, labelNames: Tuple[str, ...] = (),
+                 maxSeries: int = 1000):
+        self.registry = registry
+        self.name = name
+        self.description = description
+        self.labelNames = tuple(labelNames)
+        self.maxSeries = maxSeries
+        """最多记录的标签组合数，超出后新的组合合并到所有标签值为 `other` 的序列中"""
+        self._lock = threading.Lock()
+        self._overflow = ("other",) * len(self.labelNames)
+
+    def _key(self, series: dict, labels: tuple) -> tuple:
+        if len(labels) != len(self.labelNames):
+            raise ValueError(f"Metric {self.name} expects labels {self.labelNames}, got {labels}")
+        if labels in series or len(series) < self.maxSeries:
+            return labels
+        return self._overflow
+
+    def _labels(self, labels: tuple, extra: str = "") -> str:
+        pairs = [f'{name}="{_escape(str(value))}"' for name, value in zip(self.labelNames, labels)]
+        if extra:
+            pairs.append(extra)
+        return "{" + ",".join(pairs) + "}" if pairs else ""
+
+    def dump(self) -> dict:
+        """可以跨进程传递的原始数据，用于 `merge`"""
+        raise NotImplementedError
+
+    def merge(self, dumps: Iterable[dict]) -> dict:
+        """合并多个 `dump` 的结果"""
+        raise NotImplementedError
+
+    def render(self, others: Iterable[dict] = ()) -> List[str]:
+        """导出为Prometheus文本格式的样本
+
+        Args:
+            others: 其他进程中同名指标 `dump` 的结果，与当前进程的值合并后导出
+        """
+        return self._render(self.merge([self.dump(), *others]))
+
+    def _render(self, data: dict) -> List[str]:
+        return [f"{self.name}{self._labels(labels)} {_format_value(value)}" for labels, value in data.items()]
+
+    def snapshot(self) -> dict:
+        raise NotImplementedError
+
+
+class Counter(_Metric):
+    type = "counter"
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._values: Dict[tuple, float] = {}
+
+    def inc(self, *labels, amount: float = 1):
+        """增加计数，标签值按 `labelNames` 的顺序传入"""
+        if not self.registry.enabled:
+            return
+        with self._lock:
+            key = self._key(self._values, labels)
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def get(self, *labels) -> float:
+        return self._values.get(labels, 0)
+
+    def dump(self) -> dict:
+        return self.snapshot()
+
+    def merge(self, dumps: Iterable[dict]) -> dict:
+        result = {}
+        for dump in dumps:
+            for labels, value in dump.items():
+                result[labels] = result.get(labels, 0) + value
+        return result
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return dict(self._values)
+
+
+class Gauge(_Metric):
+    type = "gauge"
+
+    def __init__(self, *args, aggregate: str = "sum", **kwargs):
+        super().__init__(*args, **kwargs)
+        if aggregate not in ("sum", "max"):
+            raise ValueError(f"Unknown aggregate {aggregate!r}, expected 'sum' or 'max'")
+        self.aggregate = aggregate
+        """合并多个进程的值时相加(sum)还是取最大值(max)"""
+        self._values: Dict[tuple, float] = {}
+        self._function: Optional[Callable[[], Union[float, Dict[tuple, float]]]] = None
+        self._functions: List[Callable[[], Optional[Callable]]] = []
+        """`add_function` 添加的函数，绑定方法以弱引用保存"""
+
+    def set(self, value: float, *labels):
+        if not self.registry.enabled:
+            return
+        with self._lock:
+            self._values[self._key(self._values, labels)] = value
+
+    def inc(self, *labels, amount: float = 1):
+        if not self.registry.enabled:
+            return
+        with self._lock:
+            key = self._key(self._values, labels)
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, *labels, amount: float = 1):
+        self.inc(*labels, amount=-amount)
+
+    def set_function(self, function: Optional[Callable[[], Union[float, Dict[tuple, float]]]]):
+        """在导出时调用函数获取当前值，函数返回数值，或者 {标签值元组: 数值}"""
+        self._function = function
+
+    def add_function(self, function: Callable[[], Union[float, Dict[tuple, float]]]):
+        """添加一个在导出时调用的函数，多个函数的值按标签相加。用于多个实例共用同一个指标
+
+        Notes:
+            绑定方法以弱引用保存，实例被回收后自动移除
+        """
+        ref = weakref.WeakMethod(function) if hasattr(function, "__self__") else (lambda: function)
+        with self._lock:
+            self._functions.append(ref)
+
+    def remove_function(self, function: Callable[[], Union[float, Dict[tuple, float]]]):
+        """移除 `add_function` 添加的函数"""
+        with self._lock:
+            self._functions = [ref for ref in self._functions if ref() is not None and ref() != function]
+
+    @staticmethod
+    def _merge(result: Dict[tuple, float], value: Union[float, Dict[tuple, float]]):
+        if not isinstance(value, dict):
+            value = {(): value}
+        for labels, v in value.items():
+            result[labels] = result.get(labels, 0) + v
+
+    def _collect(self) -> Dict[tuple, float]:
+        if self._function is None and not self._functions:
+            with self._lock:
+                return dict(self._values)
+        result = {}
+        if self._function is not None:
+            self._merge(result, self._function())
+        with self._lock:
+            functions = [ref() for ref in self._functions]
+            if None in functions:
+                self._functions = [ref for ref in self._functions if ref() is not None]
+        for function in functions:
+            if function is not None:
+                self._merge(result, function())
+        return result
+
+    def dump(self) -> dict:
+        return self._collect()
+
+    def merge(self, dumps: Iterable[dict]) -> dict:
+        result = {}
+        for dump in dumps:
+            for labels, value in dump.items():
+                if labels not in result:
+                    result[labels] = value
+                elif self.aggregate == "max":
+                    result[labels] = max(result[labels], value)
+                else:
+                    result[labels] += value
+        return result
+
+    def snapshot(self) -> dict:
+        return self._collect()
+
+
+class Histogram(_Metric):
+    type = "histogram"
+
+    def __init__(self, *args, buckets: Tuple[float, ...] = DEFAULT_BUCKETS, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.buckets = tuple(sorted(buckets))
+        self._series: Dict[tuple, list] = {}
+        """标签值 -> [各分桶的计数(不累计), 总和, 总数]"""
+
+    def observe(self, value: float, *labels):
+        """记录一个观测值，标签值按 `labelNames` 的顺序传入"""
+        if not self.registry.enabled:
+            return
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            key = self._key(self._series, labels)
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            series[0][index] += 1
+            series[1] += value
+            series[2] += 1
+
+    def time(self, *labels) -> "_Timer":
+        """计时的上下文管理器，退出时记录耗时"""
+        return _Timer(self, labels)
+
+    def dump(self) -> dict:
+        with self._lock:
+            return {labels: (list(counts), total, count) for labels, (counts, total, count) in self._series.items()}
+
+    def merge(self, dumps: Iterable[dict]) -> dict:
+        result = {}
+        for dump in dumps:
+            for labels, (counts, total, count) in dump.items():
+                merged = result.get(labels)
+                if merged is None:
+                    result[labels] = (list(counts), total, count)
+                else:
+                    result[labels] = ([a + b for a, b in zip(merged[0], counts)], merged[1] + total, merged[2] + count)
+        return result
+
+    def _render(self, data: dict) -> List[str]:
+        lines = []
+        for labels, (counts, total, count) in data.items():
+            cumulative = 0
+            for bound, bucketCount in zip(self.buckets + (math.inf,), counts):
+                cumulative += bucketCount
+                le = f'le="{_format_value(bound)}"'
+                lines.append(f"{self.name}_bucket{self._labels(labels, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{self._labels(labels)} {_format_value(total)}")
+            lines.append(f"{self.name}_count{self._labels(labels)} {count}")
+        return lines
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {
+                labels: {"count": count, "sum": total, "buckets": dict(zip(self.buckets + (math.inf,), counts))}
+                for labels, (counts, total, count) in self._series.items()
+            }
+
+
+class _Timer:
+    __slots__ = ("histogram", "labels", "start")
+
+    def __init__(self, histogram: Histogram, labels: tuple):
+        self.histogram = histogram
+        self.labels = labels
+        self.start = 0.0
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.histogram.observe(time.perf_counter() - self.start, *self.labels)
+        return False
+
+
+class MetricsRegistry:
+
+    def __init__(self, enabled: bool = False):
+        """指标的注册表
+
+        Notes:
+            未启用时所有指标的记录方法都会直接返回，开销只有一次属性判断。
+            同名的指标只会创建一次，重复获取时返回已有的对象
+
+        Args:
+            enabled: 是否记录指标
+        """
+        self.enabled = enabled
+        self._metrics: Dict[str, _Metric] = {}
+        self._lock = threading.Lock()
+        self._users: int = 0
+
+    def acquire(self):
+        """登记一个需要指标的使用者(如启用了指标的应用)并启用记录"""
+        with self._lock:
+            self._users += 1
+            self.enabled = True
+
+    def release(self):
+        """注销一个使用者，所有使用者都注销后停止记录"""
+        with self._lock:
+            self._users = max(self._users - 1, 0)
+            if not self._users:
+                self.enabled = False
+
+    def _get(self, cls, name: str, description: str, labelNames: Tuple[str, ...], **kwargs):
+        with self._lock:
+            metric = self._metrics.get(name)
+            if metric is None:
+                metric = self._metrics[name] = cls(self, name, description, labelNames, **kwargs)
+            elif not isinstance(metric, cls):
+                raise ValueError(f"Metric {name} is already registered as a {metric.type}")
+            return metric
+
+    def counter(self, name: str, description: str, labelNames: Tuple[str, ...] = (), **kwargs) -> Counter:
+        return self._get(Counter, name, description, labelNames, **kwargs)
+
+    def gauge(self, name: str, description: str, labelNames: Tuple[str, ...] = (), **kwargs) -> Gauge:
+        return self._get(Gauge, name, description, labelNames, **kwargs)
+
+    def histogram(self, name: str, description: str, labelNames: Tuple[str, ...] = (), **kwargs) -> Histogram:
+        return self._get(Histogram, name, description, labelNames, **kwargs)
+
+    def get(self, name: str) -> Optional[_Metric]:
+        return self._metrics.get(name)
+
+    def dump(self) -> Dict[str, dict]:
+        """所有指标可以跨进程传递的原始数据，在另一个进程中传给 `render` 合并导出"""
+        return {name: metric.dump() for name, metric in list(self._metrics.items())}
+
+    def render(self, others: Iterable[Dict[str, dict]] = ()) -> str:
+        """以Prometheus文本格式导出所有指标
+
+        Args:
+            others: 其他进程中 `dump` 的结果，同名指标的值会合并。计数器与直方图相加，仪表按其 `aggregate` 合并
+        """
+        others = list(others)
+        lines = []
+        for metric in list(self._metrics.values()):
+            try:
+                samples = metric.render([other[metric.name] for other in others if metric.name in other])
+            except Exception as err:
+                lines.append(f"# {metric.name} failed to collect: {err.__class__.__name__}")
+                continue
+            lines.append(f"# HELP {metric.name} {_escape(metric.description)}")
+            lines.append(f"# TYPE {metric.name} {metric.type}")
+            lines.extend(samples)
+        return "\n".join(lines) + "\n"
+
+    def snapshot(self) -> Dict[str, dict]:
+        """所有指标的当前值，{指标名: {标签值元组: 值}}"""
+        return {name: metric.snapshot() for name, metric in list(self._metrics.items())}
+
+
+registry = MetricsRegistry()
+"""框架使用的全局注册表"""
+
+
+def timed(histogram: Histogram, *labels):
+    """记录异步函数每次调用耗时的装饰器"""
+
+    def wrapper(func):
+        @functools.wraps(func)
+        async def inner(*args, **kwargs):
+            if not histogram.registry.enabled:
+                return await func(*args, **kwargs)
+            start = time.perf_counter()
+            try:
+                return await func(*args, **kwargs)
+            finally:
+                histogram.observe(time.perf_counter() - start, *labels)
+
+        return inner
+
+    return wrapper
+
+
+RADIO_EVENTS = registry.counter("dingraia_radio_events_total", "Events broadcast by Channel.radio", ("event",))
+LISTENER_SECONDS = registry.histogram(
+    "dingraia_listener_seconds", "Time from dispatch to completion of each listener", ("listener",)
+)
+PENDING_RADIOS = registry.gauge("dingraia_pending_radios", "Broadcasts whose listeners are still running")
+API_REQUEST_SECONDS = registry.histogram(
+    "dingraia_api_request_seconds", "API request latency including retries", ("host", "path")
+)
+API_RESPONSES = registry.counter("dingraia_api_responses_total", "API responses by status", ("path", "status"))
+API_ERRORS = registry.counter("dingraia_api_errors_total", "API error codes returned in response bodies",
+                              ("path", "code"))
+STREAM_FRAMES = registry.counter("dingraia_stream_frames_total", "Stream frames received", ("stream", "type"))
+STREAM_RECONNECTS = registry.counter("dingraia_stream_reconnects_total", "Stream reconnections", ("stream",))
+STREAM_ACK_SECONDS = registry.histogram(
+    "dingraia_stream_ack_seconds", "Time from receiving a Stream frame to sending its ACK", ("stream",),
+    buckets=(0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1)
+)
+STREAM_INFLIGHT = registry.gauge("dingraia_stream_inflight", "Stream messages being handled or queued", ("stream",))
+CACHE_QUERY_SECONDS = registry.histogram(
+    "dingraia_cache_query_seconds", "Cache.execute query time", ("statement",),
+    buckets=(0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.5)
+)
+SEND_MESSAGE_SECONDS = registry.histogram("dingraia_send_message_seconds", "End-to-end send_message time")
+LOOP_STALLS = registry.counter("dingraia_loop_stalls_total", "Event loop stalls longer than the watchdog threshold")
+LOOP_STALL_SECONDS = registry.histogram(
+    "dingraia_loop_stall_seconds", "Duration of event loop stalls", buckets=(0.5, 1, 2, 5, 10, 30, 60)
+)
+LOOP_LAG = registry.gauge("dingraia_loop_lag_seconds", "Current event loop heartbeat lag", aggregate="max")
@@ -6,6 +6,14 @@ from ..cache import cache
 from ..element import OpenConversationId, TraceId
 
 
+def event_timestamp(origin: dict) -> float:
+    """消息的创建时间(createAt)，单位为秒，没有时使用当前时间"""
+    createAt = origin.get("createAt")
+    if isinstance(createAt, (int, float)) and createAt > 0:
+        return createAt / 1000 if createAt > 2600000000 else createAt
+    return time.time()
+
+
 class Webhook:
     url: str
 
@@ -75,26 +83,32 @@ class Group:
         self.member: Optional[Member] = None
         """可能会存在的实际对象，在单聊内有效"""
         if origin is not None:
-            self.update_cache()  # 为了防止特殊实例化数据覆盖缓存，只在有源请求才更新缓存
+            self.update_cache(event_timestamp(origin))  # 为了防止特殊实例化数据覆盖缓存，只在有源请求才更新缓存
 
-    def update_cache(self):
+    def update_cache(self, timeStamp: float = None):
         if self.openConversationId is not None and self.id:
-            if cache.value_exist("group_info", "openConversationId", str(self.openConversationId)):
-                cache.execute("UPDATE group_info SET `id`=?,`chatId`=?,`name`=?,timeStamp=? WHERE "
-                              "`openConversationId`=?",
-                              (self.id, self.origin_id, self.name, time.time(), str(self.openConversationId)))
-            else:
-                cache.execute("INSERT INTO group_info (`id`,`chatId`,`openConversationId`,`name`,`info`,`timeStamp`) "
-                              "VALUES (?,?,?,?,?,?)", (self.id, self.origin_id, str(self.openConversationId),
-                                                       self.name, "{}", time.time()))
-            if cache.value_exist("webhooks", "openConversationId", str(self.openConversationId)):
-                cache.execute("UPDATE webhooks SET `url`=?,`expired`=?,timeStamp=? WHERE `openConversationId`=?",
-                              (self.webhook.url, self.webhook.expired_time, time.time(), str(self.openConversationId)))
-            else:
-                cache.execute(
-                    "INSERT INTO `webhooks` (id, openConversationId, url, expired, timeStamp) VALUES (?,?,?,?,?)",
-                    (self.id, str(self.openConversationId), self.webhook.url, self.webhook.expired_time, time.time()))
-            cache.commit()
+            openConversationId = str(self.openConversationId)
+            now = time.time() if timeStamp is None else timeStamp
+            cache.write_many([
+                cache.build_upsert("group_info", "openConversationId", {
+                    "id"                : self.id,
+                    "chatId"            : self.origin_id,
+                    "openConversationId": openConversationId,
+                    "name"              : self.name,
+                    "info"              : "{}",
+                    "timeStamp"         : now
+                }, update_columns=("id", "chatId", "name", "timeStamp"), newer_only=True),
+                cache.build_upsert("webhooks", "openConversationId", {
+                    "id"                : self.id,
+                    "openConversationId": openConversationId,
+                    "url"               : self.webhook.url,
+                    "expired"           : self.webhook.expired_time,
+                    "timeStamp"         : now
+                }, update_columns=("url", "expired", "timeStamp"), newer_only=True),
+            ], key=("group_info", openConversationId), timeStamp=now,
+                invalidate=[("group_info", "openConversationId", openConversationId)] if cache.info_changed(
+                    "group_info", "openConversationId", openConversationId,
+                    {"id": self.id, "chatId": self.origin_id, "name": self.name}, timeStamp=now) else ())
 
     def __int__(self) -> int:
         return self.id
@@ -181,13 +195,28 @@ class Member:
 
     def update_cache(self, origin: dict):
         if origin.get('conversationType') == '1':
-            if cache.value_exist("user_info", "id", str(self.id)):
-                cache.execute("UPDATE user_info SET `name`=?,`staffId`=?,timeStamp=? WHERE `id`=?",
-                              (self.name, self.staffId, time.time(), str(self.id)))
+            now = event_timestamp(origin)
+            values = {
+                "id"       : str(self.id),
+                "name"     : self.name,
+                "staffId"  : self.staffId or '',
+                "unionId"  : '',
+                "info"     : '{}',
+                "timeStamp": now
+            }
+            if self.staffId:
+                cache.upsert("user_info", "staffId", values, update_columns=("id", "name", "timeStamp"),
+                             invalidate=cache.info_changed("user_info", "staffId", self.staffId,
+                                                           {"id": self.id, "name": self.name}, timeStamp=now),
+                             newer_only=True)
             else:
-                cache.execute("INSERT INTO user_info (`id`,`name`,`staffId`,`unionId`, `info`,`timeStamp`) "
-                              "VALUES (?,?,?,?,?,?)", (str(self.id), self.name, self.staffId, '', '{}', time.time()))
-            cache.commit()
+                cache.write_many([
+                    ("UPDATE user_info SET `name`=?,timeStamp=? WHERE `id`=? AND (timeStamp IS NULL OR timeStamp<=?)",
+                     (self.name, now, str(self.id), now)),
+                    ("INSERT INTO user_info (`id`,`name`,`staffId`,`unionId`, `info`,`timeStamp`) "
+                     "SELECT ?,?,?,?,?,? WHERE NOT EXISTS (SELECT 1 FROM user_info WHERE `id`=?)",
+                     (*values.values(), str(self.id))),
+                ], key=("user_info", str(self.id)), invalidate=[("user_info", "id", self.id)], timeStamp=now)
 
     def __int__(self) -> int:
         return self.id
@@ -0,0 +1,201 @@
+import asyncio
+import threading
+import time
+from typing import Any, Callable, Coroutine, Dict, List
+
+from .log import logger
+
+
+class ListenerStats:
+    __slots__ = ("name", "calls", "wall", "wallMax", "blocking", "blockingMax", "slowSteps", "thread",
+                 "threadWait")
+
+    def __init__(self, name: str):
+        """单个监听函数的累计数据，时间单位均为秒"""
+        self.name = name
+        self.calls: int = 0
+        self.wall: float = 0
+        """从分发到完成的总耗时"""
+        self.wallMax: float = 0
+        self.blocking: float = 0
+        """在事件循环中连续运行(没有让出)的总时间"""
+        self.blockingMax: float = 0
+        """单次连续运行的最长时间"""
+        self.slowSteps: int = 0
+        """连续运行超过阈值的次数"""
+        self.thread: float = 0
+        """同步监听函数在线程池中运行的总时间"""
+        self.threadWait: float = 0
+        """同步监听函数等待线程池空闲的总时间"""
+
+    def to_dict(self) -> Dict[str, Any]:
+        result = {name: getattr(self, name) for name in self.__slots__}
+        result["wallAvg"] = self.wall / self.calls if self.calls else 0
+        return result
+
+
+class _ProfiledCoroutine:
+    __slots__ = ("profiler", "stats", "coro")
+
+    def __init__(self, profiler: "HandlerProfiler", stats: ListenerStats, coro: Coroutine):
+        self.profiler = profiler
+        self.stats = stats
+        self.coro = coro
+
+    def close(self):
+        """关闭被包装的协程"""
+        self.coro.close()
+
+    def __await__(self):
+        coro = self.coro
+        stats = self.stats
+        threshold = self.profiler.blockThreshold
+        start = time.perf_counter()
+        value = None
+        error = None
+        try:
+            while True:
+                stepStart = time.perf_counter()
+                try:
+                    if error is None:
+                        yielded = coro.send(value)
+                    else:
+                        yielded = coro.throw(error)
+                except StopIteration as result:
+                    return result.value
+                finally:
+                    step = time.perf_counter() - stepStart
+                    stats.blocking += step
+                    if step > stats.blockingMax:
+                        stats.blockingMax = step
+                    if threshold and step > threshold:
+                        stats.slowSteps += 1
+                        self.profiler.on_slow_step(stats, step)
+                try:
+                    value = yield yielded
+                    error = None
+                except (Exception, asyncio.CancelledError) as err:
+                    # 取消需要传入监听函数，让它可以执行清理
+                    value = None
+                    error = err
+                except BaseException:
+                    # close() 产生的 GeneratorExit 以及 KeyboardInterrupt 等不传入监听函数，直接关闭它
+                    coro.close()
+                    raise
+        finally:
+            self.profiler.finish(stats, time.perf_counter() - start)
+
+
+class HandlerProfiler:
+
+    def __init__(self, blockThreshold: float = 0.1, top: int = 20):
+        """监听函数的耗时统计
+
+        Notes:
+            异步监听函数被包装后逐步驱动，每一步(两次await之间)的耗时就是它占用事件循环的时间；
+            同步监听函数统计在线程池中的运行时间和排队时间。单步超过 `blockThreshold` 时输出警告
+
+        Args:
+            blockThreshold: 单步占用事件循环超过此时间时视为阻塞，单位为秒，为0时不检测
+            top: `report` 默认输出的监听函数数量
+        """
+        self.blockThreshold = blockThreshold
+        self.top = top
+        self.stats: Dict[str, ListenerStats] = {}
+        self._lock = threading.Lock()
+
+    def _get(self, name: str) -> ListenerStats:
+        stats = self.stats.get(name)
+        if stats is None:
+            with self._lock:
+                stats = self.stats.get(name)
+                if stats is None:
+                    stats = self.stats[name] = ListenerStats(name)
+        return stats
+
+    def profile_coroutine(self, name: str, coro: Coroutine) -> _ProfiledCoroutine:
+        """包装异步监听函数返回的协程
+
+        Args:
+            name: 监听函数的名称
+            coro: 协程
+
+        Returns:
+            可以await的对象
+        """
+        return _ProfiledCoroutine(self, self._get(name), coro)
+
+    def profile_sync(self, name: str, func: Callable[[], Any]) -> Callable[[], Any]:
+        """包装在线程池中运行的同步监听函数，需要在提交到线程池之前调用
+
+        Args:
+            name: 监听函数的名称
+            func: 没有参数的函数
+
+        Returns:
+            包装后的函数
+        """
+        stats = self._get(name)
+        submitted = time.perf_counter()
+
+        def run():
+            start = time.perf_counter()
+            try:
+                return func()
+            finally:
+                end = time.perf_counter()
+                with self._lock:
+                    stats.threadWait += start - submitted
+                    stats.thread += end - start
+                self.finish(stats, end - submitted)
+
+        return run
+
+    def finish(self, stats: ListenerStats, wall: float):
+        with self._lock:
+            stats.calls += 1
+            stats.wall += wall
+            if wall > stats.wallMax:
+                stats.wallMax = wall
+
+    def on_slow_step(self, stats: ListenerStats, step: float):
+        logger.warning(f"Listener {stats.name} blocked the event loop for {step * 1000:.1f}ms "
+                       f"(threshold {self.blockThreshold * 1000:.0f}ms)")
+
+    def snapshot(self) -> List[Dict[str, Any]]:
+        """所有监听函数的统计数据，按占用事件循环的总时间降序排列"""
+        with self._lock:
+            stats = [s.to_dict() for s in self.stats.values()]
+        return sorted(stats, key=lambda x: (x["blocking"], x["wall"]), reverse=True)
+
+    def report(self, top: int = None) -> str:
+        """生成统计表格
+
+        Args:
+            top: 输出的监听函数数量，为None时使用初始化时的值
+
+        Returns:
+            str
+        """
+        rows = self.snapshot()[:top or self.top]
+        if not rows:
+            return "No listener has been profiled"
+        header = f"{'listener':<48} {'calls':>7} {'wall avg':>10} {'wall max':>10} " \
+                 f"{'block':>10} {'block max':>10} {'slow':>5} {'thread':>10} {'queue':>10}"
+        lines = [header]
+        for row in rows:
+            name = row["name"] if len(row["name"]) <= 48 else "..." + row["name"][-45:]
+            lines.append(
+                f"{name:<48} {row['calls']:>7} {row['wallAvg'] * 1000:>8.2f}ms "
+                f"{row['wallMax'] * 1000:>8.2f}ms {row['blocking'] * 1000:>8.1f}ms {row['blockingMax'] * 1000:>8.2f}ms "
+                f"{row['slowSteps']:>5} {row['thread'] * 1000:>8.1f}ms {row['threadWait'] * 1000:>8.1f}ms"
+            )
+        return "\n".join(lines)
+
+    def dump(self, top: int = None):
+        """在日志中输出统计表格"""
+        logger.info("Listener profile:\n" + self.report(top))
+
+    def reset(self):
+        with self._lock:
+            self.stats.clear()
@@ -0,0 +1,213 @@
+import asyncio
+import random
+import time
+from typing import Dict, Optional, TYPE_CHECKING, Tuple
+
+from .log import logger
+
+if TYPE_CHECKING:
+    from aiohttp import ClientResponse
+
+    from .config import RateLimit
+
+RATE_LIMIT_CODES = {
+    90002,
+    90018,
+    "Forbidden.AccessDenied.QpsLimitForApi",
+    "Forbidden.AccessDenied.QpsLimitForAppkeyAndApi",
+}
+"""钉钉表示触发限流的错误码"""
+OAPI_HOST = "oapi.dingtalk.com"
+MAX_ERROR_BODY = 4096
+"""限流错误的返回体不会超过此长度，更长的返回不读取"""
+
+
+class TokenBucket:
+
+    def __init__(self, rate: float, capacity: Optional[float] = None):
+        """令牌桶限流器
+
+        Notes:
+            令牌以 `rate` 的速度持续补充，最多积累 `capacity` 个。等待的调用按先来后到的顺序获得令牌
+
+        Args:
+            rate: 每秒补充的令牌数，为0或负数时不限流
+            capacity: 令牌桶容量，即允许的突发请求数，默认与rate相同(至少为1)
+        """
+        self.rate = rate
+        self.capacity = capacity if capacity is not None else max(rate, 1)
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    def _refill(self, now: float):
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    @property
+    def tokens(self) -> float:
+        """当前可用的令牌数"""
+        if self.rate > 0:
+            self._refill(time.monotonic())
+        return self._tokens
+
+    def try_acquire(self, tokens: float = 1) -> bool:
+        """不等待地获取令牌，有其他调用在等待时不会插队
+
+        Returns:
+            是否获取成功
+        """
+        if self.rate <= 0:
+            return True
+        if self._lock.locked():
+            return False
+        self._refill(time.monotonic())
+        if self._tokens >= tokens:
+            self._tokens -= tokens
+            return True
+        return False
+
+    async def acquire(self, tokens: float = 1):
+        """获取令牌，令牌不足时等待
+
+        Args:
+            tokens: 需要的令牌数
+
+        Returns:
+            None
+        """
+        if self.rate <= 0:
+            return
+        tokens = min(tokens, self.capacity)
+        async with self._lock:
+            while True:
+                self._refill(time.monotonic())
+                if self._tokens >= tokens:
+                    self._tokens -= tokens
+                    return
+                await asyncio.sleep((tokens - self._tokens) / self.rate)
+
+    async def __aenter__(self):
+        await self.acquire()
+        return self
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        return False
+
+
+async def is_rate_limited(response: "ClientResponse") -> bool:
+    """判断钉钉的返回是否为限流错误
+
+    Notes:
+        HTTP 429视为限流。新版API的限流错误使用4xx状态码，旧版oapi的错误通过HTTP 200返回，
+        因此只解析4xx和oapi的较短的JSON返回，按其中的错误码(errcode或code)判断
+    """
+    if response.status == 429:
+        return True
+    if response.status >= 500 or (response.ok and response.url.host != OAPI_HOST):
+        return False
+    if not response.headers.get("Content-Type", "").startswith("application/json"):
+        return False
+    if response.content_length is not None and response.content_length > MAX_ERROR_BODY:
+        return False
+    try:
+        data = await response.json()
+    except Exception:
+        return False
+    if not isinstance(data, dict):
+        return False
+    return data.get("errcode", data.get("code")) in RATE_LIMIT_CODES
+
+
+class RateLimiter:
+
+    maxBuckets: int = 1024
+    """令牌桶数量超过此值时清理空闲的令牌桶，避免路径中包含ID的接口占用过多内存"""
+
+    def __init__(self, options: "RateLimit"):
+        """按应用和接口路径限流
+
+        Args:
+            options: 限流配置
+        """
+        self.options = options
+        self._pathBuckets: Dict[Tuple[Optional[str], str], TokenBucket] = {}
+        self._appBuckets: Dict[Optional[str], TokenBucket] = {}
+        self.limited: int = 0
+        """收到限流错误的次数"""
+        self.retried: int = 0
+        """因限流重试的次数"""
+
+    def _new_bucket(self, qps: float) -> TokenBucket:
+        return TokenBucket(qps, self.options.burst)
+
+    def bucket(self, appKey: Optional[str], path: str) -> Optional[TokenBucket]:
+        """获取应用调用某个接口使用的令牌桶，不限制时返回None"""
+        key = (appKey, path)
+        bucket = self._pathBuckets.get(key)
+        if bucket is None:
+            qps = self.options.paths.get(path, self.options.pathQps)
+            if not qps or qps <= 0:
+                return None
+            if len(self._pathBuckets) >= self.maxBuckets:
+                self._prune()
+            bucket = self._pathBuckets[key] = self._new_bucket(qps)
+        return bucket
+
+    def _prune(self):
+        for key, bucket in list(self._pathBuckets.items()):
+            if not bucket._lock.locked() and bucket.tokens >= bucket.capacity:  # NOQA
+                del self._pathBuckets[key]
+
+    async def acquire(self, appKey: Optional[str], path: str):
+        """等待应用和接口的令牌，没有启用限流时立即返回
+
+        Args:
+            appKey: 发起请求的应用
+            path: 接口路径，不包括域名和参数
+
+        Returns:
+            None
+        """
+        if not self.options.enabled:
+            return
+        if self.options.appQps and self.options.appQps > 0:
+            appBucket = self._appBuckets.get(appKey)
+            if appBucket is None:
+                appBucket = self._appBuckets[appKey] = self._new_bucket(self.options.appQps)
+            await appBucket.acquire()
+        bucket = self.bucket(appKey, path)
+        if bucket is not None:
+            await bucket.acquire()
+
+    def retry_delay(self, attempt: int, retryAfter: Optional[str] = None) -> float:
+        """第attempt次重试前的等待时间，优先使用服务端返回的 `Retry-After`"""
+        if retryAfter:
+            try:
+                return min(max(float(retryAfter), 0), self.options.retryMaxDelay)
+            except ValueError:
+                pass
+        delay = min(self.options.retryMaxDelay, self.options.retryBaseDelay * 2 ** attempt)
+        return random.uniform(delay / 2, delay)
+
+    async def check(self, response: "ClientResponse", attempt: int, retryable: bool = True) -> Optional[float]:
+        """检查返回是否触发了限流
+
+        Args:
+            response: 钉钉的返回
+            attempt: 已经重试的次数
+            retryable: 请求是否可以重新发送
+
+        Returns:
+            需要重试时返回等待时间，否则返回None
+        """
+        if not await is_rate_limited(response):
+            return None
+        self.limited += 1
+        if not retryable or attempt >= self.options.maxRetries:
+            return None
+        self.retried += 1
+        delay = self.retry_delay(attempt, response.headers.get("Retry-After"))
+        logger.warning(f"API {response.url.path} is rate limited, retry in {delay:.2f}s "
+                       f"({attempt + 1}/{self.options.maxRetries})")
+        return delay
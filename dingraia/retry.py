@@ -0,0 +1,206 @@
+import asyncio
+import collections
+import math
+import random
+import time
+from typing import Awaitable, Callable, Deque, Dict, List, Optional, TYPE_CHECKING, Union
+
+from .config import RetryPolicy
+from .log import logger
+
+if TYPE_CHECKING:
+    from aiohttp import ClientResponse
+
+
+class LatencyWindow:
+
+    def __init__(self, size: int = 256):
+        """接口最近的请求延迟
+
+        Args:
+            size: 保留的样本数
+        """
+        self._samples: Deque[float] = collections.deque(maxlen=size)
+        self._sorted: Optional[List[float]] = None
+        self._added: int = 0
+
+    def add(self, latency: float):
+        self._samples.append(latency)
+        self._added += 1
+        if self._added >= 16:
+            self._sorted = None
+
+    def percentile(self, p: float) -> Optional[float]:
+        """最近样本的p分位数，排序结果每新增16个样本重新计算一次
+
+        Args:
+            p: 0到100之间的分位数
+
+        Returns:
+            没有样本时返回None
+        """
+        if not self._samples:
+            return None
+        if self._sorted is None:
+            self._sorted = sorted(self._samples)
+            self._added = 0
+        index = min(len(self._sorted) - 1, max(0, math.ceil(p / 100 * len(self._sorted)) - 1))
+        return self._sorted[index]
+
+    def __len__(self):
+        return len(self._samples)
+
+
+class Retrier:
+
+    def __init__(self, policy: RetryPolicy):
+        """API请求的重试与对冲
+
+        Args:
+            policy: 默认的重试策略
+        """
+        self.policy = policy
+        self.latency: Dict[str, LatencyWindow] = {}
+        """每个接口最近的请求延迟"""
+        self.retries: int = 0
+        self.hedges: int = 0
+        """发出的对冲请求数"""
+        self.hedgeWins: int = 0
+        """对冲请求先返回的次数"""
+
+    def resolve(self, override: Union[RetryPolicy, bool, None]) -> Optional[RetryPolicy]:
+        """单次调用的重试策略，override为False时不重试，为None或True时使用默认策略"""
+        if override is False:
+            return None
+        if isinstance(override, RetryPolicy):
+            return override
+        return self.policy
+
+    @staticmethod
+    def is_idempotent(policy: Optional[RetryPolicy], method: str, kwargs: dict, idempotent: bool = None) -> bool:
+        """请求是否可以安全地重复发送
+
+        Args:
+            policy: 重试策略
+            method: 请求方法
+            kwargs: 请求参数
+            idempotent: 调用方指定的值，不为None时直接使用
+
+        Returns:
+            bool
+        """
+        if policy is None:
+            return False
+        if idempotent is not None:
+            return idempotent
+        if method.upper() in policy.idempotentMethods:
+            return True
+        body = kwargs.get("json")
+        if isinstance(body, dict):
+            return any(body.get(key) for key in policy.dedupKeys)
+        return False
+
+    @staticmethod
+    def delay(policy: RetryPolicy, attempt: int) -> float:
+        """第attempt次重试前的等待时间"""
+        delay = min(policy.maxDelay, policy.baseDelay * 2 ** attempt)
+        return random.uniform(delay * (1 - min(max(policy.jitter, 0), 1)), delay)
+
+    def can_retry(self, policy: Optional[RetryPolicy], attempt: int) -> bool:
+        return policy is not None and attempt < policy.maxRetries
+
+    async def wait(self, policy: RetryPolicy, attempt: int, path: str, reason: str):
+        """记录并等待重试"""
+        self.retries += 1
+        delay = self.delay(policy, attempt)
+        logger.warning(f"API {path} failed ({reason}), retry in {delay:.2f}s ({attempt + 1}/{policy.maxRetries})")
+        await asyncio.sleep(delay)
+
+    def hedge_delay(self, policy: Optional[RetryPolicy], path: str) -> Optional[float]:
+        """发出对冲请求前的等待时间，不对冲时返回None"""
+        if policy is None or policy.hedgePercentile is None:
+            return None
+        window = self.latency.get(path)
+        if window is None or len(window) < policy.hedgeMinSamples:
+            return None
+        return max(window.percentile(policy.hedgePercentile), policy.hedgeMinDelay)
+
+    def record(self, path: str, latency: float):
+        window = self.latency.get(path)
+        if window is None:
+            window = self.latency[path] = LatencyWindow()
+        window.add(latency)
+
+    async def send(
+            self,
+            factory: Callable[[], Awaitable["ClientResponse"]],
+            path: str,
+            policy: Optional[RetryPolicy],
+            canHedge: Callable[[], bool] = lambda: True
+    ) -> "ClientResponse":
+        """发送一次请求，耗时超过对冲阈值时再发出一个相同的请求，返回先完成的结果
+
+        Args:
+            factory: 发出请求的函数，每次调用发出一个新的请求
+            path: 接口路径，用于统计延迟
+            policy: 重试策略，为None时不对冲，只有幂等的请求应该传入
+            canHedge: 对冲前调用，返回False时不发出对冲请求(如限流令牌不足)
+
+        Returns:
+            ClientResponse
+        """
+        start = time.monotonic()
+        hedgeDelay = self.hedge_delay(policy, path)
+        if hedgeDelay is None:
+            resp = await factory()
+            self._record_response(path, resp, start)
+            return resp
+        first = asyncio.ensure_future(factory())
+        tasks = [first]
+        try:
+            done, _ = await asyncio.wait({first}, timeout=hedgeDelay)
+            if not done and canHedge():
+                self.hedges += 1
+                second = asyncio.ensure_future(factory())
+                tasks.append(second)
+                pending = {first, second}
+                error = None
+                while pending:
+                    done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                    winner = next((t for t in done if not t.cancelled() and t.exception() is None), None)
+                    if winner is None:
+                        failed = next(iter(done))
+                        error = asyncio.CancelledError() if failed.cancelled() else failed.exception()
+                        continue
+                    for task in done:
+                        if task is not winner and not task.cancelled() and task.exception() is None:
+                            task.result().release()
+                    if winner is second:
+                        self.hedgeWins += 1
+                    resp = winner.result()
+                    self._record_response(path, resp, start)
+                    return resp
+                raise error
+            resp = await first
+            self._record_response(path, resp, start)
+            return resp
+        finally:
+            # 调用方被取消或已经得到结果时，取消仍在进行的请求并等待它们结束，避免遗留任务和连接
+            unfinished = [task for task in tasks if not task.done()]
+            for task in unfinished:
+                self._discard(task)
+            if unfinished:
+                await asyncio.gather(*unfinished, return_exceptions=True)
+
+    def _record_response(self, path: str, resp: "ClientResponse", start: float):
+        if resp.status < 500:
+            self.record(path, time.monotonic() - start)
+
+    @staticmethod
+    def _discard(task: asyncio.Future):
+        def release(t: asyncio.Future):
+            if not t.cancelled() and t.exception() is None:
+                t.result().release()
+
+        task.cancel()
+        task.add_done_callback(release)
@@ -60,6 +60,7 @@ class Saya:
                 modules = list(module.keys())
                 if module_name in modules:
                     channel.reg_event[event].pop(module_name)
+            channel.invalidate_index()
             if module_name in sys.modules:
                 del sys.modules[module_name]
         else:
@@ -1,3 +1,8 @@
+from .command import Command, CommandRouter
+from .filters import Filter, FilterContext, GroupFilter, PrefixFilter, RegexFilter, SenderFilter
 from .schema import ListenerSchema
 
-__all__ = "ListenerSchema"
+__all__ = [
+    "Command", "CommandRouter", "Filter", "FilterContext", "GroupFilter", "ListenerSchema", "PrefixFilter",
+    "RegexFilter", "SenderFilter"
+]
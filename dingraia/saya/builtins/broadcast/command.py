@@ -0,0 +1,129 @@
+import re
+from typing import Any, Dict, List, Optional, Pattern, Tuple, Union
+
+
+class Command:
+
+    def __init__(self, *prefixes: str, pattern: Union[str, Pattern] = None, flags: int = 0, fullMatch: bool = False):
+        """命令匹配规则，消息会忽略开头的空白字符后进行匹配
+
+        Notes:
+            同一事件的所有命令会被编译为一个前缀树和一个合并的正则表达式，合并的正则表达式用于预先过滤，
+            没有正则表达式命令匹配时每条消息只需搜索一次。
+            监听函数中注解为 `re.Match` 的参数会被注入匹配结果，`match.string[match.end():]` 即为命令的参数
+
+        Args:
+            *prefixes: 命令前缀，如 "/ping"
+            pattern: 正则表达式，与前缀任意一个匹配即可
+            flags: 正则表达式的flags
+            fullMatch: 正则表达式是否需要匹配整条消息，默认为在消息中搜索
+        """
+        if not prefixes and pattern is None:
+            raise ValueError("Command requires at least one prefix or a pattern")
+        self.prefixes: Tuple[str, ...] = tuple(p for p in prefixes if p)
+        self.pattern: Optional[Pattern] = re.compile(pattern, flags) if isinstance(pattern, str) else pattern
+        self.fullMatch = fullMatch
+
+    def __repr__(self):
+        return f"<Command prefixes={self.prefixes} pattern={self.pattern.pattern if self.pattern else None}>"
+
+
+class CommandRouter:
+    _END = object()
+    _GROUP = "_dingraia_command_{}"
+
+    def __init__(self):
+        """将多个命令编译为前缀树和合并的正则表达式"""
+        self._trie: Dict[Any, Any] = {}
+        self._regexes: List[Tuple[Command, List[Any]]] = []
+        """(命令, 使用相同正则表达式的对象列表)"""
+        self._search: Optional[Pattern] = None
+        self._fullMatch: Optional[Pattern] = None
+        self._prefixPatterns: Dict[str, Pattern] = {}
+
+    def add(self, target: Any, command: Command):
+        """添加一个命令
+
+        Args:
+            target: 匹配成功时返回的对象，一般为监听器
+            command: 命令
+
+        Returns:
+            None
+        """
+        for prefix in command.prefixes:
+            node = self._trie
+            for ch in prefix:
+                node = node.setdefault(ch, {})
+            node.setdefault(self._END, []).append((target, prefix))
+            if prefix not in self._prefixPatterns:
+                self._prefixPatterns[prefix] = re.compile(re.escape(prefix))
+        if command.pattern is not None:
+            for existed, targets in self._regexes:
+                if existed.pattern == command.pattern and existed.fullMatch == command.fullMatch:
+                    targets.append(target)
+                    break
+            else:
+                self._regexes.append((command, [target]))
+                self._compile()
+
+    def _compile(self):
+        search = [(i, c.pattern) for i, (c, _) in enumerate(self._regexes) if not c.fullMatch]
+        full = [(i, c.pattern) for i, (c, _) in enumerate(self._regexes) if c.fullMatch]
+        self._search = self._combine(search)
+        self._fullMatch = self._combine(full)
+
+    @classmethod
+    def _combine(cls, patterns: List[Tuple[int, Pattern]]) -> Optional[Pattern]:
+        """合并为一个正则表达式，每个分支是一个命名分组，无法安全合并时返回None"""
+        if not patterns:
+            return None
+        parts = []
+        for index, p in patterns:
+            # 外层的分组会改变反向引用和条件分组的序号
+            if not isinstance(p.pattern, str) or re.search(r"\\[1-9]|\(\?P=|\(\?\(", p.pattern):
+                return None
+            flags = "".join(c for f, c in ((re.I, "i"), (re.M, "m"), (re.S, "s"), (re.X, "x")) if p.flags & f)
+            body = f"{p.pattern}\n" if "x" in flags else p.pattern
+            parts.append(f"(?P<{cls._GROUP.format(index)}>(?{flags}:{body}))" if flags else
+                         f"(?P<{cls._GROUP.format(index)}>{body})")
+        try:
+            return re.compile("|".join(parts))
+        except re.error:
+            return None
+
+    def match(self, text: str) -> Dict[Any, "re.Match"]:
+        """匹配消息
+
+        Notes:
+            合并的正则表达式先搜索一次，没有匹配时跳过所有正则表达式命令，否则逐个匹配，所有匹配的命令都会生效。
+            无法合并的正则表达式(如包含反向引用)不进行预先过滤
+
+        Args:
+            text: 消息文本
+
+        Returns:
+            匹配成功的对象与匹配结果的字典，前缀匹配时取最长的前缀
+        """
+        text = text.lstrip()
+        result = {}
+        node = self._trie
+        for ch in text:
+            node = node.get(ch)
+            if node is None:
+                break
+            for target, prefix in node.get(self._END, ()):
+                result[target] = self._prefixPatterns[prefix].match(text)
+        if not self._regexes:
+            return result
+        search = self._search is None or self._search.search(text) is not None
+        fullMatch = self._fullMatch is None or self._fullMatch.fullmatch(text) is not None
+        for command, targets in self._regexes:
+            if command.fullMatch:
+                m = command.pattern.fullmatch(text) if fullMatch else None
+            else:
+                m = command.pattern.search(text) if search else None
+            if m is not None:
+                for target in targets:
+                    result.setdefault(target, m)
+        return result
@@ -0,0 +1,160 @@
+import abc
+import re
+from typing import Optional, Pattern, Tuple, Union
+
+from ....element import OpenConversationId
+from ....message.chain import MessageChain
+from ....model import Group, Member
+
+
+class FilterContext:
+    """一次广播中过滤器共用的参数，群组、发送者和消息文本只会查找一次"""
+
+    _unset = object()
+
+    def __init__(self, args: tuple):
+        self.args = args
+        self._group = self._unset
+        self._member = self._unset
+        self._message = self._unset
+        self._text: Optional[str] = None
+
+    def _find(self, typ):
+        for a in self.args:
+            if isinstance(a, typ):
+                return a
+        return None
+
+    @property
+    def group(self) -> Optional[Group]:
+        if self._group is self._unset:
+            self._group = self._find(Group)
+        return self._group
+
+    @property
+    def member(self) -> Optional[Member]:
+        if self._member is self._unset:
+            self._member = self._find(Member)
+        return self._member
+
+    @property
+    def message(self) -> Optional[MessageChain]:
+        if self._message is self._unset:
+            self._message = self._find(MessageChain)
+        return self._message
+
+    @property
+    def text(self) -> str:
+        """消息的文本，没有消息时为空字符串"""
+        if self._text is None:
+            self._text = str(self.message) if self.message is not None else ""
+        return self._text
+
+
+class Filter(abc.ABC):
+    """监听器的前置过滤器，在创建处理任务前判断，返回False时跳过该监听器"""
+
+    @abc.abstractmethod
+    def __call__(self, context: FilterContext) -> bool:
+        ...
+
+
+class GroupFilter(Filter):
+
+    def __init__(self, *groups: Union[Group, OpenConversationId, int, str]):
+        """只处理指定群组的事件
+
+        Args:
+            *groups: 群组、OpenConversationId、群组ID或openConversationId字符串
+        """
+        self.ids = set()
+        self.openConversationIds = set()
+        for g in groups:
+            if isinstance(g, Group):
+                if g.id:
+                    self.ids.add(int(g.id))
+                if g.openConversationId:
+                    self.openConversationIds.add(str(g.openConversationId))
+            elif isinstance(g, OpenConversationId):
+                self.openConversationIds.add(str(g))
+            elif isinstance(g, int):
+                self.ids.add(g)
+            elif isinstance(g, str) and g.isdigit():
+                self.ids.add(int(g))
+            else:
+                self.openConversationIds.add(str(g))
+
+    def __call__(self, context: FilterContext) -> bool:
+        group = context.group
+        if group is None:
+            return False
+        if group.id and int(group.id) in self.ids:
+            return True
+        return bool(group.openConversationId) and str(group.openConversationId) in self.openConversationIds
+
+
+class SenderFilter(Filter):
+
+    def __init__(self, *members: Union[Member, int, str]):
+        """只处理指定发送者的事件
+
+        Args:
+            *members: 成员、成员ID或staffId
+        """
+        self.ids = set()
+        self.staffIds = set()
+        for m in members:
+            if isinstance(m, Member):
+                if m.id:
+                    self.ids.add(int(m.id))
+                if m.staffId:
+                    self.staffIds.add(str(m.staffId))
+            elif isinstance(m, int):
+                self.ids.add(m)
+            else:
+                self.staffIds.add(str(m))
+
+    def __call__(self, context: FilterContext) -> bool:
+        member = context.member
+        if member is None:
+            return False
+        if member.id and int(member.id) in self.ids:
+            return True
+        return bool(member.staffId) and str(member.staffId) in self.staffIds
+
+
+class PrefixFilter(Filter):
+
+    def __init__(self, *prefixes: str, strip: bool = True):
+        """只处理以指定前缀开头的消息
+
+        Args:
+            *prefixes: 前缀
+            strip: 是否忽略消息开头的空白字符
+        """
+        self.prefixes: Tuple[str, ...] = tuple(prefixes)
+        self.strip = strip
+
+    def __call__(self, context: FilterContext) -> bool:
+        text = context.text.lstrip() if self.strip else context.text
+        return text.startswith(self.prefixes)
+
+
+class RegexFilter(Filter):
+
+    def __init__(self, pattern: Union[str, Pattern], flags: int = 0, *, fullMatch: bool = False):
+        """只处理匹配正则表达式的消息
+
+        Args:
+            pattern: 正则表达式
+            flags: 正则表达式的flags
+            fullMatch: 是否要求整条消息匹配，默认为在消息中搜索
+        """
+        self.pattern = re.compile(pattern, flags) if isinstance(pattern, str) else pattern
+        self.fullMatch = fullMatch
+
+    def __call__(self, context: FilterContext) -> bool:
+        text = context.text.strip()
+        if self.fullMatch:
+            return self.pattern.fullmatch(text) is not None
+        return self.pattern.search(text) is not None
@@ -7,17 +7,35 @@ class ListenerSchema:
             inline_dispatchers=None,
             decorators=None,
             priority: int = 16,
-            extra_priorities=None
+            extra_priorities=None,
+            filters=None,
+            command=None
     ):
+        """监听器配置
+
+        Args:
+            listening_events: 监听的事件，开启 `Channel.dispatchSubclasses` 时监听父类也会收到子类的事件
+            namespace: 命名空间
+            inline_dispatchers: 内联分发器
+            decorators: 装饰器
+            priority: 优先级，数值越小越先执行
+            extra_priorities: 对特定事件的优先级，键为事件，值为优先级
+            filters: 前置过滤器列表，全部通过时才会执行监听器
+            command: 命令匹配规则(Command)，匹配成功时才会执行监听器
+        """
         if extra_priorities is None:
             extra_priorities = {}
         if decorators is None:
             decorators = []
         if inline_dispatchers is None:
             inline_dispatchers = []
+        if filters is None:
+            filters = []
         self.listening_events = listening_events
         self.namespace = namespace
         self.inline_dispatchers = inline_dispatchers
         self.decorators = decorators
         self.priority = priority
         self.extra_priorities = extra_priorities
+        self.filters = filters
+        self.command = command
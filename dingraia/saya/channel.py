@@ -2,29 +2,154 @@ import asyncio
 import functools
 import inspect
 import itertools
+import re
+import time
+import weakref
 from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional, Union
 
+from .builtins.broadcast.command import Command, CommandRouter
+from .builtins.broadcast.filters import Filter, FilterContext
 from .builtins.broadcast.schema import ListenerSchema
 from .context import channel_instance
 from ..event.event import *
+from ..event.message import GroupMessage
 from ..log import logger
+from ..metrics import LISTENER_SECONDS, PENDING_RADIOS, RADIO_EVENTS, registry as metrics
+from ..profiler import HandlerProfiler
+
+
+class Listener:
+    """监听函数的注入计划，在注册时生成，广播时直接按参数类型取值"""
+
+    _order = itertools.count()
+
+    def __init__(
+            self,
+            func: Callable,
+            priority: int = 16,
+            extraPriorities: Dict[type, int] = None,
+            filters: List[Filter] = None,
+            command: Command = None
+    ):
+        self.func = func
+        self.priority = priority
+        self.extraPriorities = extraPriorities or {}
+        self.filters = list(filters or [])
+        self.command = command
+        self.matchParams: List[str] = []
+        """需要注入命令匹配结果(re.Match)的参数名"""
+        self.order = next(self._order)
+        """注册顺序，优先级相同时先注册的先执行"""
+        self.isCoroutine = inspect.iscoroutinefunction(func)
+        self.name = f"{getattr(func, '__module__', None)}.{getattr(func, '__qualname__', repr(func))}"
+        """模块名.函数名，用于统计"""
+        self.caughtFunc = logger.catch(func)
+        self.appParams: List[str] = []
+        """需要注入Dingtalk实例的参数名"""
+        self.typedParams: List[tuple] = []
+        """(参数名, 类型)"""
+        self._plans: Dict[tuple, List[tuple]] = {}
+        for name, param in inspect.signature(func).parameters.items():
+            annotation = self._resolve_annotation(func, param.annotation)
+            if annotation is inspect.Parameter.empty:
+                continue
+            if param.annotation == "Dingtalk" or getattr(annotation, "__name__", None) == "Dingtalk":
+                self.appParams.append(name)
+            elif annotation is re.Match:
+                self.matchParams.append(name)
+            else:
+                self.typedParams.append((name, annotation))
+
+    @staticmethod
+    def _resolve_annotation(func: Callable, annotation: Any) -> Any:
+        namespace = getattr(inspect.unwrap(func), "__globals__", {})
+        for _ in range(2):  # from __future__ import annotations 时带引号的注解会被再包一层
+            if not isinstance(annotation, str) or annotation == "Dingtalk":
+                break
+            try:
+                annotation = eval(annotation, namespace)
+            except Exception:
+                break
+        return annotation
+
+    def plan(self, argTypes: tuple) -> List[tuple]:
+        """获取参数类型组合对应的注入计划 [(参数名, 参数位置)]，结果会被缓存"""
+        plan = self._plans.get(argTypes)
+        if plan is None:
+            plan = []
+            for name, annotation in self.typedParams:
+                index = None
+                for i, argType in enumerate(argTypes):
+                    try:
+                        if issubclass(argType, annotation):
+                            index = i
+                    except TypeError:
+                        pass
+                if index is not None:
+                    plan.append((name, index))
+            self._plans[argTypes] = plan
+        return plan
+
+    def priority_of(self, event: type) -> int:
+        return self.extraPriorities.get(event, self.priority)
+
+    def check(self, context: FilterContext) -> bool:
+        for f in self.filters:
+            if not f(context):
+                return False
+        return True
+
+    def resolve(self, args: tuple, argTypes: tuple, app=None) -> dict:
+        send = {name: args[index] for name, index in self.plan(argTypes)}
+        if args:
+            for name in self.appParams:
+                send[name] = app
+        return send
+
+
+async def _observe_listener(name: str, awaitable):
+    start = time.perf_counter()
+    try:
+        return await awaitable
+    finally:
+        LISTENER_SECONDS.observe(time.perf_counter() - start, name)
 
 
 class Channel:
     reg_event = {}
+    listeners: "weakref.WeakKeyDictionary[Callable, Listener]" = weakref.WeakKeyDictionary()
+    """监听函数的注入计划"""
+    _index: Dict[type, List[Listener]] = {}
+    """按事件类型排好序的监听器，reg_event 改变时需要清空"""
+    _routers: Dict[type, Optional[CommandRouter]] = {}
+    """按事件类型合并的命令匹配器"""
     pool: ThreadPoolExecutor = None
     onStop = False
     pendingRadios: List[asyncio.Task] = []
+    profiler: Optional[HandlerProfiler] = None
+    """不为None时统计每个监听函数的耗时"""
+    dispatchSubclasses: bool = False
+    """为True时监听父类事件的监听器也会收到子类事件，修改后需要调用 `invalidate_index`"""
 
     def __init__(self) -> None:
         pass
 
     def use(self, ListenEvent: Union[list, ListenerSchema]):
+        schema = None
         if isinstance(ListenEvent, ListenerSchema):
+            schema = ListenEvent
             ListenEvent = ListenEvent.listening_events
 
         def wrapper(func):
             module_name = inspect.getmodule(func).__name__
+            if schema is not None:
+                self.listeners[func] = Listener(
+                    func, priority=schema.priority, extraPriorities=schema.extra_priorities, filters=schema.filters,
+                    command=schema.command
+                )
+            else:
+                self.listeners[func] = Listener(func)
             for event in ListenEvent:
                 if event in self.reg_event:
                     if module_name in self.reg_event[event]:
@@ -34,10 +159,42 @@ class Channel:
                 else:
                     self.reg_event[event] = {}
                     self.reg_event[event][module_name] = [func]
+            self.invalidate_index()
             return func
 
         return wrapper
 
+    def command(
+            self,
+            *prefixes: str,
+            pattern: Union[str, "re.Pattern"] = None,
+            flags: int = 0,
+            fullMatch: bool = False,
+            events: list = None,
+            priority: int = 16,
+            filters: List[Filter] = None
+    ):
+        """注册命令监听器，等同于 use(ListenerSchema(..., command=Command(...)))
+
+        Args:
+            *prefixes: 命令前缀
+            pattern: 正则表达式
+            flags: 正则表达式的flags
+            fullMatch: 正则表达式是否需要匹配整条消息
+            events: 监听的事件，默认为 GroupMessage
+            priority: 优先级
+            filters: 前置过滤器
+
+        Returns:
+            装饰器
+        """
+        return self.use(ListenerSchema(
+            listening_events=events or [GroupMessage],
+            priority=priority,
+            filters=filters,
+            command=Command(*prefixes, pattern=pattern, flags=flags, fullMatch=fullMatch)
+        ))
+
     async def radio(self, RadioEvent, *args, async_await: bool = False, traceId: TraceId = None, **kwargs):
         # logger.debug(f"{type(RadioEvent) in self.reg_event} {RadioEvent} {type(RadioEvent)} {self.reg_event}")
         # logger.debug(traceId)
@@ -50,12 +207,17 @@ class Channel:
                     break
         if type(RadioEvent) is not type:
             RadioEvent = type(RadioEvent)
-        if RadioEvent in self.reg_event:
-            modules = list(itertools.chain(*self.reg_event[RadioEvent].values()))
+        listeners = self._index.get(RadioEvent)
+        if listeners is None:
+            listeners = self._build_index(RadioEvent)
+        router = self._routers.get(RadioEvent)
+        if listeners:
             async_tasks = []
             loop = asyncio.get_event_loop()
             if not self.pool:
-                self.pool = ThreadPoolExecutor()
+                Channel.pool = ThreadPoolExecutor(thread_name_prefix="Dingraia-Listener")
+            pool = self.pool
+            argTypes = tuple(type(a) for a in args)
 
             def callback():
                 event = RadioComplete()
@@ -63,48 +225,57 @@ class Channel:
                 loop.create_task(self.radio(RadioComplete, *[event, traceId, app], traceId=traceId))
 
             async def radio():
-                with ThreadPoolExecutor() as pool:
-                    for f in modules:
-                        send = {}
-                        sig = inspect.signature(f)
-                        params = sig.parameters
-                        for name, param in params.items():
-                            for typ in args:
-                                if param.annotation == "Dingtalk":
-                                    send[name] = app
-                                    continue
-                                if isinstance(typ, param.annotation):
-                                    send[name] = typ
-                        send.update(kwargs)
-                        if inspect.iscoroutinefunction(f):
-                            async_tasks.append(logger.catch(f)(**send))
-                        else:
-                            async_tasks.append(loop.run_in_executor(pool, functools.partial(logger.catch(f), **send)))
-                    should_callback = traceId and RadioEvent is not RadioComplete and app is not None
-
-                    # async_tasks.append(callback())
-
-                    async def _callback():
-                        await asyncio.gather(*async_tasks)
-                        if should_callback:
-                            callback()
-                        async_tasks.clear()
-
-                    def _done_callback(future: asyncio.Task):
+                context = FilterContext(args)
+                matches = router.match(context.text) if router is not None else {}
+                for listener in listeners:
+                    if listener.command is not None and listener not in matches:
+                        continue
+                    if listener.filters and not listener.check(context):
+                        continue
+                    send = listener.resolve(args, argTypes, app)
+                    for name in listener.matchParams:
+                        send[name] = matches.get(listener)
+                    send.update(kwargs)
+                    profiler = self.profiler
+                    if listener.isCoroutine:
+                        task = listener.caughtFunc(**send)
+                        if profiler is not None:
+                            task = profiler.profile_coroutine(listener.name, task)
+                    else:
+                        func = functools.partial(listener.caughtFunc, **send)
+                        if profiler is not None:
+                            func = profiler.profile_sync(listener.name, func)
+                        task = loop.run_in_executor(pool, func)
+                    if metrics.enabled:
+                        task = _observe_listener(listener.name, task)
+                    async_tasks.append(task)
+                should_callback = traceId and RadioEvent is not RadioComplete and app is not None
+
+                # async_tasks.append(callback())
+
+                async def _callback():
+                    await asyncio.gather(*async_tasks)
+                    if should_callback:
+                        callback()
+                    async_tasks.clear()
+
+                def _done_callback(future: asyncio.Task):
+                    try:
+                        r = future.result()
+                    finally:
                         try:
-                            r = future.result()
-                        finally:
-                            try:
-                                self.pendingRadios.remove(future)
-                            except ValueError:
-                                pass
-                    if async_tasks:
-                        t = loop.create_task(_callback())
-                        self.pendingRadios.append(t)
-                        t.add_done_callback(_done_callback)
-                        if async_await:
-                            await t
+                            self.pendingRadios.remove(future)
+                        except ValueError:
+                            pass
+                if async_tasks:
+                    t = loop.create_task(_callback())
+                    self.pendingRadios.append(t)
+                    t.add_done_callback(_done_callback)
+                    if async_await:
+                        await t
 
+
+            RADIO_EVENTS.inc(RadioEvent.__name__)
             app = None
             for e in args:
                 check = e
@@ -118,6 +289,33 @@ class Channel:
             if async_await:
                 await task
 
+    def _build_index(self, event: type) -> List[Listener]:
+        """收集监听该事件的监听器，按优先级和注册顺序排序。开启 `dispatchSubclasses` 时包括监听其父类的监听器"""
+        listeners = {}
+        classes = getattr(event, "__mro__", (event,)) if self.dispatchSubclasses else (event,)
+        for cls in classes:
+            for funcs in self.reg_event.get(cls, {}).values():
+                for f in funcs:
+                    listener = self.listeners.get(f)
+                    if listener is None:
+                        listener = self.listeners[f] = Listener(f)
+                    listeners[id(listener)] = listener
+        result = sorted(listeners.values(), key=lambda x: (x.priority_of(event), x.order))
+        router = None
+        for listener in result:
+            if listener.command is not None:
+                if router is None:
+                    router = CommandRouter()
+                router.add(listener, listener.command)
+        self._routers[event] = router
+        self._index[event] = result
+        return result
+
+    def invalidate_index(self):
+        """reg_event 被修改后需要调用，下次广播时重新生成索引"""
+        self._index.clear()
+        self._routers.clear()
+
     def set_channel(self):
         channel_instance.set(self)
 
@@ -128,3 +326,6 @@ class Channel:
         except LookupError:
             cls().set_channel()
             return channel_instance.get()
+
+
+PENDING_RADIOS.set_function(lambda: len(Channel.pendingRadios))
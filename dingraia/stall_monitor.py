@@ -0,0 +1,166 @@
+import asyncio
+import sys
+import threading
+import time
+import traceback
+from typing import Any, Dict, List, Optional
+
+from .log import logger
+from .metrics import LOOP_LAG, LOOP_STALL_SECONDS, LOOP_STALLS
+
+
+class StallMonitor:
+
+    def __init__(self, threshold: float = 1, interval: float = 0.1, captureStack: bool = True,
+                 stackLimit: int = 30):
+        """事件循环卡顿监控
+
+        Notes:
+            后台线程每隔 `interval` 秒通过 `call_soon_threadsafe` 向事件循环提交一次心跳，从提交到执行的时间就是事件循环的延迟。
+            心跳超过 `threshold` 秒仍未执行时，在卡顿期间抓取事件循环线程的调用栈和正在运行的任务并输出警告，
+            恢复后再输出卡顿的总时长。每次卡顿只报告一次
+
+        Args:
+            threshold: 判定为卡顿的延迟，单位为秒
+            interval: 心跳的间隔，单位为秒
+            captureStack: 是否抓取调用栈
+            stackLimit: 调用栈最多保留的帧数
+        """
+        self.threshold = threshold
+        self.interval = interval
+        self.captureStack = captureStack
+        self.stackLimit = stackLimit
+        self.stalls: int = 0
+        """检测到的卡顿次数"""
+        self.stallTime: float = 0
+        """卡顿的总时长，单位为秒"""
+        self.maxStall: float = 0
+        """最长的一次卡顿，单位为秒"""
+        self.lag: float = 0
+        """最近一次心跳的延迟，单位为秒"""
+        self.lastStall: Optional[Dict[str, Any]] = None
+        """最近一次卡顿的信息，包括开始时间、任务名、调用栈和时长"""
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._loopThreadId: Optional[int] = None
+        self._thread: Optional[threading.Thread] = None
+        self._stopEvent = threading.Event()
+        self._pendingSince: Optional[float] = None
+        self._reported: bool = False
+        self._lock = threading.Lock()
+        """保护 `_pendingSince` 、 `_reported` 和卡顿统计，监控线程和事件循环线程都会修改它们"""
+
+    def start(self, loop: asyncio.AbstractEventLoop = None):
+        """开始监控，需要在事件循环所在的线程中调用
+
+        Args:
+            loop: 要监控的事件循环，默认为当前运行的事件循环
+        """
+        if self._thread is not None:
+            return
+        self._loop = loop or asyncio.get_running_loop()
+        self._loopThreadId = threading.get_ident()
+        self._stopEvent.clear()
+        self._pendingSince = None
+        self._reported = False
+        self._thread = threading.Thread(target=self._run, name="Dingraia.StallMonitor", daemon=True)
+        self._thread.start()
+        LOOP_LAG.add_function(self.current_lag)
+
+    def stop(self):
+        if self._thread is None:
+            return
+        self._stopEvent.set()
+        self._thread.join(self.interval * 2 + 1)
+        self._thread = None
+        LOOP_LAG.remove_function(self.current_lag)
+
+    def current_lag(self) -> float:
+        """当前的延迟，心跳未执行时为已等待的时间"""
+        pendingSince = self._pendingSince
+        if pendingSince is not None:
+            return max(self.lag, time.monotonic() - pendingSince)
+        return self.lag
+
+    def _run(self):
+        loop = self._loop
+        while not self._stopEvent.wait(self.interval):
+            if loop.is_closed():
+                break
+            postedAt = None
+            with self._lock:
+                pendingSince = self._pendingSince
+                if pendingSince is None:
+                    postedAt = self._pendingSince = time.monotonic()
+            if postedAt is not None:
+                try:
+                    loop.call_soon_threadsafe(self._beat, postedAt)
+                except RuntimeError:
+                    break
+                continue
+            waited = time.monotonic() - pendingSince
+            if waited < self.threshold:
+                continue
+            message = None
+            with self._lock:
+                # 心跳可能在判断之后执行，只报告仍未执行的同一次心跳
+                if self._pendingSince == pendingSince and not self._reported:
+                    self._reported = True
+                    message = self._report(waited)
+            if message is not None:
+                logger.warning(message)
+
+    def _beat(self, postedAt: float):
+        lag = time.monotonic() - postedAt
+        with self._lock:
+            self.lag = lag
+            recovered = self._reported
+            if recovered:
+                self.stallTime += lag
+                self.maxStall = max(self.maxStall, lag)
+                if self.lastStall is not None:
+                    self.lastStall["duration"] = lag
+                self._reported = False
+            self._pendingSince = None
+        if recovered:
+            LOOP_STALL_SECONDS.observe(lag)
+            logger.warning(f"Event loop recovered after a {lag:.2f}s stall")
+
+    def _capture(self) -> List[str]:
+        frame = sys._current_frames().get(self._loopThreadId)  # NOQA
+        if frame is None:
+            return []
+        return traceback.format_stack(frame, limit=self.stackLimit)
+
+    def _current_task_name(self) -> Optional[str]:
+        try:
+            task = asyncio.current_task(self._loop)
+        except RuntimeError:
+            return None
+        return task.get_name() if task is not None else None
+
+    def _report(self, waited: float) -> str:
+        """记录一次卡顿，需要持有 `_lock` ，返回要输出的警告"""
+        self.stalls += 1
+        LOOP_STALLS.inc()
+        taskName = self._current_task_name()
+        stack = self._capture() if self.captureStack else []
+        self.lastStall = {
+            "time"    : time.time() - waited,
+            "task"    : taskName,
+            "stack"   : stack,
+            "duration": None,
+        }
+        message = f"Event loop has been blocked for {waited:.2f}s, running task: {taskName or 'None'}"
+        if stack:
+            message += "\n" + "".join(stack).rstrip()
+        return message
+
+    def snapshot(self) -> Dict[str, Any]:
+        """用于告警的计数"""
+        return {
+            "stalls"   : self.stalls,
+            "stallTime": self.stallTime,
+            "maxStall" : self.maxStall,
+            "lag"      : self.current_lag(),
+            "lastStall": self.lastStall,
+        }
@@ -0,0 +1,305 @@
+import asyncio
+import collections
+import json
+import math
+import random
+import time
+from typing import Any, Awaitable, Callable, Deque, Dict, Hashable, Optional, Set, Tuple, Union
+
+from .log import logger
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import msgspec
+except ImportError:
+    msgspec = None
+
+if orjson is not None:
+    JSON_BACKEND = "orjson"
+    _loads = orjson.loads
+
+    def _dumps(obj) -> str:
+        return orjson.dumps(obj).decode()
+elif msgspec is not None:
+    JSON_BACKEND = "msgspec"
+    _loads = msgspec.json.decode
+
+    def _dumps(obj) -> str:
+        return msgspec.json.encode(obj).decode()
+else:
+    JSON_BACKEND = "json"
+    _loads = json.loads
+
+    def _dumps(obj) -> str:
+        return json.dumps(obj, ensure_ascii=False, separators=(",", ":"))
+
+
+def frame_loads(raw: Union[str, bytes]) -> Any:
+    """解析Stream帧使用的JSON，安装了orjson或msgspec时使用对应的实现"""
+    return _loads(raw)
+
+
+def frame_dumps(obj) -> str:
+    """序列化Stream帧使用的JSON，可选实现不支持的对象(如超过64位的整数)回退到标准库"""
+    try:
+        return _dumps(obj)
+    except (TypeError, ValueError, OverflowError):
+        return json.dumps(obj, ensure_ascii=False, separators=(",", ":"))
+
+
+class StreamDispatcher:
+
+    def __init__(self, maxConcurrency: int = 64, keepConversationOrder: bool = True, name: str = "Stream"):
+        """Stream消息的并发处理器
+
+        Notes:
+            同时处理(包括等待同一会话前序消息)的消息数达到 `maxConcurrency` 时，`submit` 会等待空位，
+            从而暂停读取Websocket，将压力交给服务端
+
+        Args:
+            maxConcurrency: 同时处理的最大消息数
+            keepConversationOrder: 是否保证同一会话的消息按接收顺序处理
+            name: 名称，用于日志
+        """
+        self.maxConcurrency = maxConcurrency
+        self.keepConversationOrder = keepConversationOrder
+        self.name = name
+        self._semaphore = asyncio.Semaphore(maxConcurrency)
+        self._chains: Dict[Hashable, asyncio.Task] = {}
+        self._tasks: Set[asyncio.Task] = set()
+        self.closed: bool = False
+        """关闭后不应再提交消息，此时收到的消息不回复确认，由服务端重新推送"""
+
+    def close(self):
+        self.closed = True
+
+    @property
+    def pending(self) -> int:
+        """正在处理或等待处理的消息数"""
+        return len(self._tasks)
+
+    async def submit(self, key: Optional[Hashable], func: Callable[..., Awaitable[Any]], *args):
+        """提交一条消息，窗口已满时等待
+
+        Args:
+            key: 会话键，相同键的消息按顺序处理，为None时不保证顺序
+            func: 处理消息的异步函数
+            *args: 传入处理函数的参数
+
+        Returns:
+            None
+        """
+        await self._semaphore.acquire()
+        previous = None
+        if key is not None and self.keepConversationOrder:
+            previous = self._chains.get(key)
+        task = asyncio.create_task(self._run(key, previous, func, args))
+        if key is not None and self.keepConversationOrder:
+            self._chains[key] = task
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _run(self, key: Optional[Hashable], previous: Optional[asyncio.Task], func, args):
+        try:
+            if previous is not None and not previous.done():
+                await asyncio.wait([previous])
+            await func(*args)
+        except asyncio.CancelledError:
+            raise
+        except Exception as err:
+            logger.exception(f"[{self.name}] Error happened while handing the message", err)
+        finally:
+            self._semaphore.release()
+            if key is not None and self._chains.get(key) is asyncio.current_task():
+                del self._chains[key]
+
+    async def drain(self, timeout: float = None) -> int:
+        """等待所有已提交的消息处理完成
+
+        Args:
+            timeout: 超时时间，为None时一直等待
+
+        Returns:
+            超时后仍未完成的消息数
+        """
+        if not self._tasks:
+            return 0
+        _, pending = await asyncio.wait(set(self._tasks), timeout=timeout)
+        return len(pending)
+
+
+class EventDeduplicator:
+
+    def __init__(self, maxSize: int = 4096, ttl: float = 600):
+        """Stream推送的重复消息检测
+
+        Notes:
+            使用集合判断是否重复，使用按接收顺序排列的环形队列淘汰旧记录，判断和淘汰均为O(1)。
+            记录在超过 `ttl` 秒或超过 `maxSize` 条后被淘汰。记录只保存在当前进程中，多进程模式下各个进程分别去重
+
+        Args:
+            maxSize: 最多记录的消息数，为0时不限制
+            ttl: 记录的保留时间，单位为秒，为0时不限制
+        """
+        self.maxSize = maxSize
+        self.ttl = ttl
+        self._seen: Set[str] = set()
+        self._order: Deque[Tuple[float, str]] = collections.deque()
+        self.duplicates: int = 0
+        """检测到的重复消息数"""
+
+    def __len__(self):
+        return len(self._seen)
+
+    def __contains__(self, eventId: str) -> bool:
+        self._expire(time.monotonic())
+        return eventId in self._seen
+
+    def seen(self, eventId: Optional[str]) -> bool:
+        """判断消息是否已经接收过，没有接收过时记录下来
+
+        Args:
+            eventId: 消息ID，为空时不判断
+
+        Returns:
+            是否为重复消息
+        """
+        if not eventId:
+            return False
+        now = time.monotonic()
+        self._expire(now)
+        if eventId in self._seen:
+            self.duplicates += 1
+            return True
+        self._seen.add(eventId)
+        self._order.append((now, eventId))
+        if self.maxSize and len(self._order) > self.maxSize:
+            self._seen.discard(self._order.popleft()[1])
+        return False
+
+    def _expire(self, now: float):
+        if not self.ttl:
+            return
+        deadline = now - self.ttl
+        order = self._order
+        while order and order[0][0] < deadline:
+            self._seen.discard(order.popleft()[1])
+
+
+def conversation_key(data: dict) -> Optional[str]:
+    """从Stream推送的数据中获取会话键，没有会话信息时返回None"""
+    for k in ("conversationId", "openConversationId", "OpenConversationId", "ChatId", "chatId"):
+        value = data.get(k)
+        if value and isinstance(value, str):
+            return value
+    return None
+
+
+class Backoff:
+
+    def __init__(self, baseDelay: float = 1, maxDelay: float = 60, factor: float = 2, jitter: float = 0.5):
+        """带随机抖动的指数退避
+
+        Notes:
+            第n次重试的等待时间为 `min(maxDelay, baseDelay * factor ** n)`，再随机减少至多 `jitter` 的比例，
+            避免大量客户端在同一时刻重连
+
+        Args:
+            baseDelay: 第一次重试的等待时间，单位为秒
+            maxDelay: 最长的等待时间，单位为秒
+            factor: 每次重试等待时间的倍数
+            jitter: 随机减少的最大比例，在0到1之间
+        """
+        self.baseDelay = baseDelay
+        self.maxDelay = maxDelay
+        self.factor = factor
+        self.jitter = min(max(jitter, 0), 1)
+        self.attempts: int = 0
+        """连续失败的次数"""
+
+    def next(self) -> float:
+        """获取下一次重试前的等待时间，并增加失败次数"""
+        exponent = self.attempts
+        if self.factor > 1:
+            # 达到最长等待时间后不再增大指数，避免连续失败很多次后 factor ** attempts 溢出
+            if 0 < self.baseDelay < self.maxDelay:
+                exponent = min(exponent, math.ceil(math.log(self.maxDelay / self.baseDelay, self.factor)))
+            else:
+                exponent = 0
+        delay = min(self.maxDelay, self.baseDelay * self.factor ** exponent)
+        self.attempts += 1
+        return random.uniform(delay * (1 - self.jitter), delay)
+
+    def reset(self):
+        """连接成功后重置"""
+        self.attempts = 0
+
+
+_ACK_OK = '{"code":200,"headers":%s,"message":"OK","data":%s}'
+_ACK_INVALID = '{"code":400,"headers":%s,"message":"Invalid request","data":{"success":false,"reason":"Access denied"}}'
+_ACK_RESPONSE = '{"code":200,"headers":%%s,"message":"","data":%s}' % frame_dumps(frame_dumps({"response": {
+    "body"      : frame_dumps({}),
+    "headers"   : {"Content-Type": "application/json"},
+    "statusLine": {"code": 200, "reasonPhrase": "OK"}
+}}))
+
+
+class StreamFrame:
+    __slots__ = ("message", "type", "headers", "rawData", "_data", "receivedAt")
+
+    def __init__(self, message: dict):
+        """Stream网关推送的一帧
+
+        Notes:
+            `data` 字段在第一次访问时解析并缓存，确认帧由预先生成的模板拼接，不会再次解析或序列化整个帧
+
+        Args:
+            message: 解析后的帧
+        """
+        self.message = message
+        self.type: str = message.get("type", "")
+        self.headers: dict = message.get("headers") or {}
+        self.rawData: Optional[str] = message.get("data")
+        self._data: Optional[dict] = None
+        self.receivedAt: float = time.perf_counter()
+        """收到帧的时间 (time.perf_counter)"""
+
+    @classmethod
+    def decode(cls, raw: Union[str, bytes]) -> "StreamFrame":
+        """解析Websocket收到的原始消息"""
+        return cls(frame_loads(raw))
+
+    @property
+    def data(self) -> dict:
+        """解析后的 `data` 字段，只解析一次"""
+        if self._data is None:
+            raw = self.rawData
+            if not raw:
+                self._data = {}
+            elif isinstance(raw, (str, bytes)):
+                self._data = frame_loads(raw)
+            else:
+                self._data = raw
+        return self._data
+
+    def ack(self) -> str:
+        """生成回复给网关的确认帧
+
+        Notes:
+            HTTP请求形式的推送(包含 `requestLine` 和 `headers`)回复空的200响应，其他推送原样返回 `data`，
+            没有 `data` 字段时回复400
+
+        Returns:
+            序列化后的确认帧
+        """
+        headers = frame_dumps(self.headers)
+        if self.rawData is None:
+            return _ACK_INVALID % headers
+        data = self.data
+        if isinstance(data, dict) and "requestLine" in data and "headers" in data:
+            return _ACK_RESPONSE % headers
+        return _ACK_OK % (headers, frame_dumps(self.rawData))
@@ -0,0 +1,129 @@
+import asyncio
+import time
+from typing import Dict, Optional, TYPE_CHECKING
+
+from .element import AccessToken
+from .log import logger
+
+if TYPE_CHECKING:
+    from .DingTalk import Dingtalk
+
+
+class AccessTokenManager:
+
+    def __init__(self, app: "Dingtalk", tokens: Dict[str, AccessToken], refreshAhead: int = 300):
+        """异步的AccessToken管理器
+
+        Notes:
+            同一个AppKey同时只会进行一次刷新，其他请求会等待这次刷新的结果。
+            后台任务会在AccessToken过期前 `refreshAhead` 秒主动刷新，请求时一般不需要等待
+
+        Args:
+            app: Dingtalk实例，使用其ClientSession进行请求
+            tokens: AppKey与AccessToken的字典，管理器会直接更新其中的对象
+            refreshAhead: 提前刷新的时间，单位为秒
+        """
+        self.app = app
+        self.tokens = tokens
+        self.refreshAhead = refreshAhead
+        self.retryInterval: float = 5
+        """后台刷新失败时的重试间隔"""
+        self._refreshing: Dict[str, asyncio.Task] = {}
+        self._refreshTask: Optional[asyncio.Task] = None
+
+    def register(self, token: AccessToken) -> AccessToken:
+        """将AccessToken交给管理器维护。已经存在相同AppKey时返回已有的对象
+
+        Args:
+            token: 含有AppKey和AppSecret的AccessToken
+
+        Returns:
+            由管理器维护的AccessToken
+        """
+        if not token.appKey or not token.appSecret:
+            return token
+        existed = self.tokens.get(token.appKey)
+        if existed is not None and existed.appSecret == token.appSecret:
+            return existed
+        self.tokens[token.appKey] = token
+        return token
+
+    async def get(self, token: AccessToken) -> AccessToken:
+        """获取有效的AccessToken，过期时等待刷新完成
+
+        Args:
+            token: AccessToken，没有AppKey或AppSecret的(如用户AccessToken)将原样返回
+
+        Returns:
+            AccessToken
+        """
+        if not token.appKey or not token.appSecret:
+            return token
+        self.start()
+        if token.token and token.ok:
+            return token
+        return await self.refresh(token)
+
+    async def refresh(self, token: AccessToken, force: bool = False) -> AccessToken:
+        """刷新AccessToken，同一个AppKey同时只会发出一次请求
+
+        Args:
+            token: AccessToken
+            force: 是否在未过期时也刷新
+
+        Returns:
+            AccessToken
+        """
+        task = self._refreshing.get(token.appKey)
+        if task is None:
+            if not force and token.token and token.ok:
+                return token
+            task = asyncio.create_task(self._refresh(token), name=f"RefreshAccessToken-{token.appKey}")
+            self._refreshing[token.appKey] = task
+        await asyncio.shield(task)
+        return token
+
+    async def _refresh(self, token: AccessToken):
+        try:
+            await token.async_refresh(self.app.clientSession, force=True)
+            for t in self.tokens.values():
+                if t is not token and t.appKey == token.appKey and t.appSecret == token.appSecret:
+                    t.token, t.expired = token.token, token.expired
+            logger.debug(f"AccessToken of {token.appKey} refreshed, expires at "
+                         f"{time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(token.expired))}")
+        finally:
+            self._refreshing.pop(token.appKey, None)
+
+    def start(self):
+        """启动后台刷新任务，需要在事件循环中调用"""
+        if self._refreshTask is None or self._refreshTask.done():
+            self._refreshTask = asyncio.get_running_loop().create_task(self._refresh_loop(),
+                                                                       name="AccessTokenRefresher")
+
+    async def stop(self):
+        """停止后台刷新任务"""
+        if self._refreshTask is not None and not self._refreshTask.done():
+            self._refreshTask.cancel()
+            try:
+                await self._refreshTask
+            except asyncio.CancelledError:
+                pass
+        self._refreshTask = None
+
+    async def _refresh_loop(self):
+        while True:
+            now = time.time()
+            wait = 60.0
+            for token in list(self.tokens.values()):
+                if not token.appKey or not token.appSecret:
+                    continue
+                if token.token and token.expired - self.refreshAhead > now:
+                    wait = min(wait, token.expired - self.refreshAhead - now)
+                    continue
+                try:
+                    await self.refresh(token, force=True)
+                except Exception as err:
+                    logger.error(f"Failed to refresh AccessToken of {token.appKey} -> "
+                                 f"{err.__class__.__name__}: {err}")
+                    wait = min(wait, self.retryInterval)
+            await asyncio.sleep(max(wait, 1))
@@ -1,16 +1,63 @@
+import asyncio
 import json
-from typing import Union
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Optional, Union
 
 import aiohttp
-from aiohttp import ClientResponse
+from aiohttp import ClientResponse, ClientSession, ClientTimeout
 
 from .element import AccessToken
 
 get_token_url = "https://oapi.dingtalk.com/gettoken"
 
+_clientSession: Optional[ClientSession] = None
+_streamingTimeout = ClientTimeout(total=None, sock_connect=30, sock_read=120)
+
+
+def set_client_session(session: Optional[ClientSession], streamingTimeout: ClientTimeout = None):
+    """设置全局共享的ClientSession，框架外的请求(如AI接口)也会复用其连接池
+
+    Args:
+        session: 共享的ClientSession
+        streamingTimeout: 流式请求使用的超时设置，为None时保持不变
+    """
+    global _clientSession, _streamingTimeout
+    _clientSession = session
+    if streamingTimeout is not None:
+        _streamingTimeout = streamingTimeout
+
+
+def streaming_timeout() -> ClientTimeout:
+    """流式请求(如AI接口)的超时设置，不限制总时间，只限制两次收到数据之间的间隔"""
+    return _streamingTimeout
+
+
+def get_client_session() -> Optional[ClientSession]:
+    """获取当前事件循环中可用的共享ClientSession，不存在时返回None"""
+    session = _clientSession
+    if session is None or session.closed:
+        return None
+    try:
+        if getattr(session, "_loop", None) is not asyncio.get_running_loop():
+            return None
+    except RuntimeError:
+        return None
+    return session
+
+
+@asynccontextmanager
+async def client_session() -> AsyncIterator[ClientSession]:
+    """优先使用共享的ClientSession，没有时创建一个临时的ClientSession并在结束时关闭"""
+    session = get_client_session()
+    if session is not None:
+        yield session
+    else:
+        async with aiohttp.ClientSession() as session:
+            yield session
+
 
 async def url_res(url, method: str = 'GET', headers=None, res: str = 'str', **kwargs) -> Union[ClientResponse, str, dict]:
-    async with aiohttp.ClientSession() as session:
+    async with client_session() as session:
         async with session.request(method.upper(), url, headers=headers, **kwargs) as _res:
             resp = await _res.text()
     if res == 'json':
@@ -0,0 +1,262 @@
+import asyncio
+import multiprocessing
+import os
+import queue
+import signal
+import time
+from typing import Dict, List, Optional, TYPE_CHECKING
+
+from .cache import cache
+from .config import Stream
+from .log import logger
+from .metrics import registry
+
+if TYPE_CHECKING:
+    from .DingTalk import Dingtalk
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+
+def fork_supported() -> bool:
+    """当前平台是否支持fork"""
+    return "fork" in multiprocessing.get_all_start_methods()
+
+
+def shard_streams(streams: List[Stream], workers: int) -> List[List[Stream]]:
+    """将Stream分配给各个进程
+
+    Notes:
+        进程数多于Stream数时，多出的进程会为同一个应用建立额外的连接，钉钉会在同一应用的连接之间分配消息
+
+    Args:
+        streams: 配置的Stream
+        workers: 进程数
+
+    Returns:
+        每个进程负责的Stream列表
+    """
+    shards = [streams[i::workers] for i in range(workers)]
+    for i, shard in enumerate(shards):
+        if not shard:
+            shards[i] = [streams[i % len(streams)]]
+    return shards
+
+
+def worker_stats(app: "Dingtalk", index: int) -> dict:
+    """当前进程的统计数据"""
+    return {
+        "index"     : index,
+        "pid"       : os.getpid(),
+        "streams"   : len(app.config.stream),
+        "received"  : sum(app.stream_received.values()),
+        "duplicates": sum(d.duplicates for d in app.stream_checker.values()),
+        "pending"   : sum(d.pending for d in app.stream_dispatchers.values()),
+        "cpuTime"   : time.process_time(),
+        "maxRss"    : resource.getrusage(resource.RUSAGE_SELF).ru_maxrss if resource is not None else 0,
+        "time"      : time.time(),
+    }
+
+
+class WorkerContext:
+
+    def __init__(self, index: int, stopEvent, statsQueue, statsInterval: float, metricsQueue=None):
+        """子进程中与父进程通信的对象
+
+        Args:
+            index: 进程序号
+            stopEvent: 所有进程共用的停止事件
+            statsQueue: 向父进程发送统计数据的队列
+            statsInterval: 发送统计数据的间隔，单位为秒
+            metricsQueue: 父进程转发其他进程运行指标的队列，只有运行HTTP服务的第一个进程需要
+        """
+        self.index = index
+        self.stopEvent = stopEvent
+        self.statsQueue = statsQueue
+        self.statsInterval = statsInterval
+        self.metricsQueue = metricsQueue
+        self.peerMetrics: Dict[int, dict] = {}
+        """其他进程最近一次发送的运行指标，{进程序号: `MetricsRegistry.dump` 的结果}"""
+
+    def report(self, app: "Dingtalk"):
+        try:
+            stats = worker_stats(app, self.index)
+            if registry.enabled:
+                stats["metrics"] = registry.dump()
+            self.statsQueue.put_nowait(stats)
+        except Exception as err:
+            logger.debug(f"Failed to report worker stats -> {err.__class__.__name__}: {err}")
+
+    def _receive_metrics(self):
+        if self.metricsQueue is None:
+            return
+        try:
+            while True:
+                self.peerMetrics = self.metricsQueue.get_nowait()
+        except queue.Empty:
+            pass
+
+    async def run(self, app: "Dingtalk"):
+        """定时发送统计数据，其他进程请求停止时停止当前进程"""
+        lastReport = 0.0
+        while True:
+            if self.stopEvent.is_set():
+                app.loop.create_task(app.stop())
+                return
+            now = time.monotonic()
+            if now - lastReport >= self.statsInterval:
+                self.report(app)
+                lastReport = now
+            self._receive_metrics()
+            await asyncio.sleep(0.5)
+
+
+class WorkerSupervisor:
+
+    def __init__(self, app: "Dingtalk", workers: int, statsInterval: float = 10, infoCacheTtl: float = 5):
+        """多进程运行模式的父进程
+
+        Notes:
+            父进程只负责创建和管理子进程，每个子进程独立运行事件循环并处理分配给自己的Stream。
+            所有进程共用WAL模式的SQLite数据库，`InfoCache` 在每个进程中独立存在，其他进程写入数据库时不会失效，
+            因此缓存时间会被缩短到 `infoCacheTtl`。
+            子进程的运行指标随统计数据一起发送给父进程，再转发给运行HTTP服务的第一个子进程，指标路径导出所有进程合并后的值。
+            任意一个子进程调用 `Dingtalk.stop` 或父进程收到停止信号时，所有子进程都会停止
+
+        Args:
+            app: Dingtalk实例，子进程由其fork得到
+            workers: 子进程数
+            statsInterval: 子进程发送统计数据和运行指标的间隔，单位为秒
+            infoCacheTtl: 子进程中 `InfoCache` 的最长缓存时间，单位为秒，为0时不缓存
+        """
+        self.app = app
+        self.workers = workers
+        self.statsInterval = statsInterval
+        self.infoCacheTtl = infoCacheTtl
+        self.processes: List[multiprocessing.Process] = []
+        self.workerStats: Dict[int, dict] = {}
+        self.workerMetrics: Dict[int, dict] = {}
+        """每个子进程最近一次发送的运行指标"""
+        self._context = multiprocessing.get_context("fork")
+        self.stopEvent = self._context.Event()
+        self.statsQueue = self._context.Queue()
+        self.metricsQueue = self._context.Queue()
+        self._signalCount = 0
+        self._lastSummary: Optional[dict] = None
+
+    def run(self, port: int = None, routes: list = None, host: str = None):
+        """创建子进程并等待全部退出，HTTP服务只在第一个子进程中运行
+
+        Args:
+            port: HTTP服务端口
+            routes: 路由列表
+            host: 入口地址
+
+        Returns:
+            None
+        """
+        shards = shard_streams(self.app.config.stream, self.workers)
+        cache.enable_wal()
+        self._limit_info_cache()
+        cache.prepare_fork()
+        for index, streams in enumerate(shards):
+            process = self._context.Process(
+                target=self._worker_main,
+                args=(index, streams, port if index == 0 else None, routes, host),
+                name=f"Dingraia-Worker-{index}"
+            )
+            process.start()
+            self.processes.append(process)
+            logger.info(f"[Workers] Worker #{index} started (pid {process.pid}) with {len(streams)} stream(s)")
+        previous = {sig: signal.signal(sig, self._on_signal) for sig in (signal.SIGINT, signal.SIGTERM)}
+        try:
+            lastSummary = time.monotonic()
+            while any(p.is_alive() for p in self.processes):
+                self._collect(0.5)
+                if time.monotonic() - lastSummary >= self.statsInterval:
+                    self._log_summary()
+                    lastSummary = time.monotonic()
+            self._collect(0)
+        finally:
+            for sig, handler in previous.items():
+                signal.signal(sig, handler)
+            for process in self.processes:
+                process.join()
+            cache.reconnect()
+        self._log_summary()
+        for process in self.processes:
+            if process.exitcode:
+                logger.warning(f"[Workers] {process.name} exited with code {process.exitcode}")
+
+    def _limit_info_cache(self):
+        """其他进程写入数据库时不会使当前进程的 `InfoCache` 失效，只能缩短缓存时间"""
+        if self.infoCacheTtl > 0:
+            cache.infoCache.ttl = min(cache.infoCache.ttl, self.infoCacheTtl)
+        else:
+            cache.infoCache.maxSize = 0
+        cache.infoCache.clear()
+
+    def stop(self):
+        """请求所有子进程停止"""
+        self.stopEvent.set()
+
+    def stats(self) -> dict:
+        """汇总的统计数据
+
+        Returns:
+            包含每个进程数据的 `workers` 和汇总的 `total`
+        """
+        workers = dict(self.workerStats)
+        total = {k: sum(w.get(k, 0) for w in workers.values())
+                 for k in ("streams", "received", "duplicates", "pending", "cpuTime", "maxRss")}
+        total["alive"] = sum(1 for p in self.processes if p.is_alive())
+        return {"workers": workers, "total": total}
+
+    def _worker_main(self, index: int, streams: List[Stream], port: Optional[int], routes: list, host: str):
+        cache.reconnect(keepPending=False)
+        signal.signal(signal.SIGINT, signal.default_int_handler)
+        signal.signal(signal.SIGTERM, signal.SIG_DFL)
+        self.app.config.stream = streams
+        self.app.worker = WorkerContext(index, self.stopEvent, self.statsQueue, self.statsInterval,
+                                        self.metricsQueue if index == 0 else None)
+        self.app.start(port=port, routes=routes, host=host)
+
+    def _collect(self, timeout: float):
+        try:
+            stats = self.statsQueue.get(timeout=timeout) if timeout else self.statsQueue.get_nowait()
+            while True:
+                metrics = stats.pop("metrics", None)
+                self.workerStats[stats["index"]] = stats
+                if metrics is not None:
+                    self.workerMetrics[stats["index"]] = metrics
+                    if stats["index"] != 0:
+                        self.metricsQueue.put_nowait({i: m for i, m in self.workerMetrics.items() if i != 0})
+                stats = self.statsQueue.get_nowait()
+        except queue.Empty:
+            pass
+
+    def _log_summary(self):
+        total = self.stats()["total"]
+        received = total["received"]
+        rate = ""
+        if self._lastSummary is not None:
+            elapsed = time.monotonic() - self._lastSummary["at"]
+            if elapsed > 0:
+                rate = f" ({(received - self._lastSummary['received']) / elapsed:.1f}/s)"
+        self._lastSummary = {"at": time.monotonic(), "received": received}
+        logger.info(f"[Workers] {total['alive']}/{len(self.processes)} alive, received {received}{rate}, "
+                    f"pending {total['pending']}, duplicates {total['duplicates']}, "
+                    f"cpu {total['cpuTime']:.1f}s")
+
+    def _on_signal(self, signum, _):
+        self._signalCount += 1
+        if self._signalCount == 1:
+            logger.warning(f"[Workers] Received signal {signum}, stopping all workers...")
+            self.stop()
+        else:
+            logger.warning("[Workers] Forced to terminate all workers")
+            for process in self.processes:
+                if process.is_alive():
+                    process.terminate()
@@ -0,0 +1,8 @@
+import os
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# dingraia.cache 在导入时会在当前目录创建数据库，测试时放到临时目录中
+os.chdir(tempfile.mkdtemp(prefix="dingraia-tests-"))
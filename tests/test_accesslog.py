@@ -0,0 +1,36 @@
+import json
+
+from dingraia.accesslog import AccessLogWriter, check_ua
+
+
+def test_ua_policies():
+    browser = "Mozilla/5.0 (Windows NT 10.0)"
+    dingtalk = "Mozilla/5.0 AliApp(DingTalk/7.0.0) com.alibaba.android.rimet"
+    assert check_ua("curl/8.0", "all") is None
+    assert check_ua(browser, "user") is None
+    assert check_ua("curl/8.0", "user").status == 400
+    assert check_ua(dingtalk, "dingtalk-user") is None
+    assert check_ua(browser, "dingtalk-user").status == 400
+    assert check_ua(browser, "dingtalk") is None
+    assert check_ua("python-requests/2.0", "dingtalk").status == 400
+    assert check_ua("-", "dingtalk").status == 400
+
+
+def test_writer_flushes_on_close(tmp_path):
+    path = tmp_path / "access.jsonl"
+    writer = AccessLogWriter(str(path), flushInterval=60)
+    writer.start()
+    for i in range(3):
+        writer.write({"path": f"/{i}", "status": 200})
+    writer.write({"bad": object()})
+    writer.close()
+    lines = path.read_text(encoding="utf-8").splitlines()
+    assert [json.loads(line)["path"] for line in lines] == ["/0", "/1", "/2"]
+    assert writer.written == 3
+
+
+def test_writer_drops_when_full(tmp_path):
+    writer = AccessLogWriter(str(tmp_path / "access.jsonl"), maxQueue=2)
+    for i in range(5):
+        writer.write({"i": i})
+    assert writer.dropped == 3
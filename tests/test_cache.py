@@ -0,0 +1,170 @@
+import time
+
+import pytest
+
+from dingraia.cache import Cache, InfoCache
+
+
+@pytest.fixture
+def db(tmp_path):
+    c = Cache()
+    c.raiseOnExecuteError = True
+    c.connect(str(tmp_path / "cache.db"), check_same_thread=False)
+    yield c
+    if c.is_connected():
+        c.close()
+
+
+def user(staffId: str, unionId: str, name: str, timeStamp: float = 1) -> dict:
+    return {"id": '', "name": name, "staffId": staffId, "unionId": unionId, "info": '{}', "timeStamp": timeStamp}
+
+
+def users(c: Cache) -> list:
+    return sorted((row[2], row[3], row[1]) for row in c.get_table("user_info"))
+
+
+def test_upsert_inserts_and_updates(db):
+    db.upsert("file", "sha256", {"sha256": "a", "mediaId": "1"})
+    db.upsert("file", "sha256", {"sha256": "a", "mediaId": "2"})
+    assert db.get_table("file") == [("a", "2")]
+
+
+def test_upsert_update_columns(db):
+    db.upsert("user_info", "staffId", user("s1", "u1", "old"))
+    db.upsert("user_info", "staffId", user("s1", "u2", "new"), update_columns=("name",))
+    assert users(db) == [("s1", "u1", "new")]
+
+
+def test_upsert_resolves_union_id_conflict(db):
+    db.upsert("user_info", "staffId", user("s1", "u1", "a"))
+    db.upsert("user_info", "staffId", user("s2", "u1", "b"))
+    assert users(db) == [("s2", "u1", "b")]
+    db.upsert("user_info", "staffId", user("s3", "", "c"))
+    db.upsert("user_info", "staffId", user("s4", "", "d"))
+    assert users(db) == [("s2", "u1", "b"), ("s3", "", "c"), ("s4", "", "d")]
+
+
+def test_counts_are_accumulated(db):
+    db.add_openapi_count()
+    db.add_openapi_count(2)
+    assert db.get_api_counts() == 3
+
+
+def test_write_behind_merges_and_flushes(db):
+    db.enable_write_behind(flushInterval=60)
+    for i in range(5):
+        db.upsert("file", "sha256", {"sha256": "a", "mediaId": str(i)})
+    db.add_openapi_count(4)
+    assert len(db._pendingWrites) == 1
+    assert db.get_api_counts() == 4
+    assert db.get_table("file") == []
+    db.flush()
+    assert db.get_table("file") == [("a", "4")]
+    assert db.get_api_counts() == 4
+    db.disable_write_behind()
+
+
+def test_flush_keeps_writes_while_disabled(db):
+    db.enable_write_behind(flushInterval=60)
+    db.upsert("file", "sha256", {"sha256": "a", "mediaId": "1"})
+    db.enable = False
+    db.flush()
+    assert len(db._pendingWrites) == 1
+    db.enable = True
+    db.upsert("file", "sha256", {"sha256": "b", "mediaId": "2"})
+    db.flush()
+    assert sorted(db.get_table("file")) == [("a", "1"), ("b", "2")]
+    db.disable_write_behind()
+
+
+def test_reconnect_flushes_held_writes(db):
+    db.enable_write_behind(flushInterval=60)
+    db.upsert("file", "sha256", {"sha256": "a", "mediaId": "1"})
+    db.enable = False
+    db.prepare_fork()
+    db.enable = True
+    assert len(db._pendingWrites) == 1
+    db.reconnect()
+    assert db.get_table("file") == [("a", "1")]
+    assert db.writeBehind
+
+
+def test_migrate_schema_removes_duplicates(db):
+    db.execute("DROP INDEX `idx_file_sha256`;")
+    db.execute("INSERT INTO `file` VALUES (?, ?);", ("a", "old"))
+    db.execute("INSERT INTO `file` VALUES (?, ?);", ("a", "new"))
+    db.commit()
+    db.migrate_schema()
+    assert db.get_table("file") == [("a", "new")]
+    assert "idx_file_sha256" in db.get_indexes()
+    assert db.execute("PRAGMA user_version", result=True)[0][0] == Cache.SCHEMA_VERSION
+
+
+def test_wal_is_opt_in(db):
+    assert db.execute("PRAGMA journal_mode", result=True)[0][0] != "wal"
+    db.enable_wal()
+    assert db.execute("PRAGMA journal_mode", result=True)[0][0] == "wal"
+
+
+def test_info_changed_refreshes_timestamp(db):
+    key = ("user_info", "staffId", "s1")
+    db.infoCache.set([key], ({"dingraia_cache": {"id": 1, "name": "n", "timeStamp": 100}}, 100))
+    assert db.info_changed("user_info", "staffId", "s1", {"name": "other"})
+    assert not db.info_changed("user_info", "staffId", "s1", {"id": 1, "name": "n"}, timeStamp=200)
+    info, timeStamp = db.infoCache.get(key)
+    assert timeStamp == 200
+    assert info["dingraia_cache"]["timeStamp"] == 200
+    assert db.info_changed("user_info", "staffId", "missing", {"name": "n"})
+
+
+def test_info_cache_ttl_and_lru():
+    cache = InfoCache(maxSize=2, ttl=0.05)
+    cache.set(["a"], 1)
+    cache.set(["b"], 2)
+    assert cache.get("a") == 1
+    cache.set(["c"], 3)
+    assert cache.get("b") is None
+    assert cache.evictions == 1
+    time.sleep(0.06)
+    assert cache.get("a") is None
+    assert cache.stats()["hits"] == 1
+
+
+def test_info_cache_multiple_keys():
+    cache = InfoCache()
+    cache.set(["staffId:s1", "unionId:u1"], "user")
+    assert cache.get("unionId:u1") == "user"
+    cache.invalidate("staffId:s1")
+    assert cache.get("unionId:u1") is None
+    cache.set(["a", "b"], 1)
+    assert cache.replace("a", 2)
+    assert cache.get("b") == 2
+    assert not cache.replace("missing", 1)
+    assert InfoCache(maxSize=0).set(["a"], 1) is None
+
+
+def test_newer_only_upsert_keeps_newer_row(db):
+    db.upsert("user_info", "staffId", user("s1", "", "new", 200), newer_only=True)
+    db.upsert("user_info", "staffId", user("s1", "", "old", 100), newer_only=True)
+    assert users(db) == [("s1", "", "new")]
+    db.enable_write_behind(flushInterval=60)
+    db.upsert("user_info", "staffId", user("s1", "", "newest", 300), newer_only=True)
+    db.upsert("user_info", "staffId", user("s1", "", "stale", 250), newer_only=True)
+    db.flush()
+    assert users(db) == [("s1", "", "newest")]
+    db.disable_write_behind()
+
+
+def test_member_cache_uses_event_time(db, monkeypatch):
+    from dingraia import model
+    from dingraia.model import Member, event_timestamp
+    monkeypatch.setattr(model, "cache", db)
+    assert event_timestamp({"createAt": 1700000000000}) == 1700000000
+    assert event_timestamp({}) > 1700000000
+    member = Member.__new__(Member)
+    member.id, member.name, member.staffId = 1, "new", "s1"
+    member.update_cache({"conversationType": "1", "createAt": 1700000200000})
+    member.name = "old"
+    member.update_cache({"conversationType": "1", "createAt": 1700000100000})
+    assert users(db) == [("s1", "", "new")]
+    assert db.get_table("user_info")[0][5] == 1700000200
@@ -0,0 +1,96 @@
+import asyncio
+import json
+import time
+
+from dingraia.card.callback import CardCallbackHub
+from dingraia.card.streaming import StreamingUpdater
+
+
+def callback(outTrackId: str, *actionIds: str) -> dict:
+    return {"outTrackId": outTrackId, "value": json.dumps({"cardPrivateData": {"actionIds": list(actionIds)}})}
+
+
+def test_hub_keeps_latest_callback():
+    hub = CardCallbackHub()
+    hub.publish(callback("t1", "a"))
+    hub.publish(callback("t1", "b", "c"))
+    assert hub.actions("t1") == {"b", "c"}
+    assert "t1" in hub
+    assert len(hub) == 1
+    assert hub.get("missing") is None
+    assert hub.actions("missing") == set()
+
+
+def test_hub_ignores_invalid_value():
+    hub = CardCallbackHub()
+    hub.publish({"outTrackId": "t1", "value": "not json"})
+    assert hub["t1"]["value"] == "not json"
+    assert hub.actions("t1") == set()
+
+
+def test_hub_expires_records():
+    hub = CardCallbackHub(ttl=0.05, maxSize=2)
+    for outTrackId in ("t1", "t2", "t3"):
+        hub.publish(callback(outTrackId))
+    assert "t1" not in hub
+    assert len(hub) == 2
+    time.sleep(0.06)
+    assert len(hub) == 0
+
+
+def test_hub_wait_is_notified():
+    hub = CardCallbackHub()
+
+    async def main():
+        waiter = asyncio.ensure_future(hub.wait("t1", timeout=1))
+        await asyncio.sleep(0)
+        hub.publish(callback("t1", "ok"))
+        data = await waiter
+        timeout = await hub.wait("t2", timeout=0.01)
+        return data, timeout
+
+    data, timeout = asyncio.run(main())
+    assert data["outTrackId"] == "t1"
+    assert timeout is None
+    assert hub._events == {}
+
+
+def test_streaming_updater_merges_updates():
+    sent = []
+
+    async def send(content: str, final: bool):
+        await asyncio.sleep(0.01)
+        sent.append((content, final))
+
+    async def main():
+        updater = StreamingUpdater(send, minInterval=0.05, maxInterval=0.05)
+        text = ""
+        for i in range(20):
+            text += str(i % 10)
+            updater.update(text)
+            await asyncio.sleep(0.005)
+        ok = await updater.finish()
+        return updater, text, ok
+
+    updater, text, ok = asyncio.run(main())
+    assert ok
+    assert sent[-1] == (text, True)
+    assert all(not final for _, final in sent[:-1])
+    assert updater.chunks == 20
+    assert updater.updates == len(sent) < 20
+
+
+def test_streaming_updater_retries_final_update():
+    attempts = []
+
+    async def send(content: str, final: bool):
+        attempts.append(final)
+        if len(attempts) < 2:
+            raise RuntimeError("temporary")
+
+    async def main():
+        updater = StreamingUpdater(send, minInterval=0.01, finalRetries=2)
+        return await updater.finish("done")
+
+    assert asyncio.run(main())
+    assert attempts == [True, True]
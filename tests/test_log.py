@@ -0,0 +1,37 @@
+import io
+import sys
+
+import pytest
+
+from dingraia import log
+from dingraia.log import LazyMessage, logger
+
+
+@pytest.fixture
+def output():
+    stream = io.StringIO()
+    log.configure_logging(sink=stream, level="INFO", enqueue=False, colorize=False)
+    yield stream
+    log.configure_logging(sink=sys.stdout, level="DEBUG", enqueue=True, colorize=None)
+
+
+def test_level_is_checked_before_formatting(output):
+    calls = []
+    logger.debug(LazyMessage(lambda: calls.append("debug") or "debug message"))
+    logger.info(LazyMessage(lambda: calls.append("info") or "info message"))
+    assert calls == ["info"]
+    assert "info message" in output.getvalue()
+    assert "debug message" not in output.getvalue()
+    log.set_level("ERROR")
+    logger.warning("warning message")
+    logger.error("error message")
+    assert "warning message" not in output.getvalue()
+    assert "error message" in output.getvalue()
+
+
+def test_functions_are_not_called(output):
+    def message():
+        raise AssertionError("should not be called")
+
+    logger.info(message)
+    assert "function" in output.getvalue()
@@ -0,0 +1,130 @@
+import asyncio
+import gc
+
+import pytest
+
+from dingraia.metrics import MetricsRegistry, timed
+
+
+def test_disabled_registry_records_nothing():
+    registry = MetricsRegistry()
+    counter = registry.counter("c_total", "counter", ("path",))
+    histogram = registry.histogram("h_seconds", "histogram")
+    counter.inc("/x")
+    histogram.observe(0.1)
+    assert counter.snapshot() == {}
+    assert histogram.snapshot() == {}
+
+
+def test_same_name_returns_same_metric():
+    registry = MetricsRegistry(enabled=True)
+    counter = registry.counter("c_total", "counter")
+    assert registry.counter("c_total", "counter") is counter
+    assert registry.get("c_total") is counter
+    with pytest.raises(ValueError):
+        registry.gauge("c_total", "gauge")
+
+
+def test_counter_labels_and_overflow():
+    registry = MetricsRegistry(enabled=True)
+    counter = registry.counter("requests_total", "requests", ("path",), maxSeries=2)
+    counter.inc("/a")
+    counter.inc("/a", amount=2)
+    counter.inc("/b")
+    counter.inc("/c")
+    assert counter.get("/a") == 3
+    assert counter.get("other") == 1
+    with pytest.raises(ValueError):
+        counter.inc()
+
+
+def test_histogram_render():
+    registry = MetricsRegistry(enabled=True)
+    histogram = registry.histogram("latency_seconds", "latency", ("path",), buckets=(0.1, 1))
+    histogram.observe(0.05, "/a")
+    histogram.observe(0.5, "/a")
+    histogram.observe(5, "/a")
+    text = registry.render()
+    assert "# TYPE latency_seconds histogram" in text
+    assert 'latency_seconds_bucket{path="/a",le="0.1"} 1' in text
+    assert 'latency_seconds_bucket{path="/a",le="1"} 2' in text
+    assert 'latency_seconds_bucket{path="/a",le="+Inf"} 3' in text
+    assert 'latency_seconds_count{path="/a"} 3' in text
+    assert 'latency_seconds_sum{path="/a"} 5.55' in text
+
+
+def test_label_values_are_escaped():
+    registry = MetricsRegistry(enabled=True)
+    registry.counter("c_total", "counter", ("v",)).inc('a"b\n')
+    assert 'c_total{v="a\\"b\\n"} 1' in registry.render()
+
+
+def test_gauge_functions_are_aggregated():
+    registry = MetricsRegistry(enabled=True)
+    gauge = registry.gauge("inflight", "inflight", ("stream",))
+
+    class App:
+        def __init__(self, values):
+            self.values = values
+
+        def collect(self):
+            return self.values
+
+    first = App({("s1",): 1})
+    second = App({("s1",): 2, ("s2",): 3})
+    gauge.add_function(first.collect)
+    gauge.add_function(second.collect)
+    assert gauge.snapshot() == {("s1",): 3, ("s2",): 3}
+    gauge.remove_function(first.collect)
+    assert gauge.snapshot() == {("s1",): 2, ("s2",): 3}
+    del second
+    gc.collect()
+    assert gauge.snapshot() == {}
+
+
+def test_registry_acquire_release():
+    registry = MetricsRegistry()
+    registry.acquire()
+    registry.acquire()
+    registry.release()
+    assert registry.enabled
+    registry.release()
+    assert not registry.enabled
+
+
+def test_timed_decorator():
+    registry = MetricsRegistry(enabled=True)
+    histogram = registry.histogram("call_seconds", "calls")
+
+    @timed(histogram)
+    async def call():
+        await asyncio.sleep(0.01)
+        return 1
+
+    assert asyncio.run(call()) == 1
+    assert histogram.snapshot()[()]["count"] == 1
+
+
+def test_render_merges_other_processes():
+    registry = MetricsRegistry(enabled=True)
+    counter = registry.counter("c_total", "counter", ("path",))
+    lag = registry.gauge("lag_seconds", "lag", aggregate="max")
+    inflight = registry.gauge("inflight", "inflight")
+    histogram = registry.histogram("h_seconds", "histogram", buckets=(1,))
+    counter.inc("/x")
+    lag.set(0.5)
+    inflight.set(2)
+    histogram.observe(0.5)
+    other = registry.dump()
+    counter.inc("/y")
+    lag.set(0.1)
+    text = registry.render([other])
+    assert 'c_total{path="/x"} 2' in text
+    assert 'c_total{path="/y"} 1' in text
+    assert "lag_seconds 0.5" in text
+    assert "inflight 4" in text
+    assert 'h_seconds_bucket{le="1"} 2' in text
+    assert "h_seconds_count 2" in text
+    assert 'c_total{path="/x"} 1' in registry.render()
+    with pytest.raises(ValueError):
+        registry.gauge("bad", "bad", aggregate="avg")
@@ -0,0 +1,109 @@
+import asyncio
+import time
+
+from dingraia.profiler import HandlerProfiler
+
+
+def test_profiler_measures_blocking_steps():
+    profiler = HandlerProfiler(blockThreshold=0.02)
+    slow = []
+    profiler.on_slow_step = lambda stats, step: slow.append(step)
+
+    async def listener():
+        await asyncio.sleep(0.03)
+        time.sleep(0.05)
+        return "done"
+
+    async def main():
+        return await profiler.profile_coroutine("listener", listener())
+
+    assert asyncio.run(main()) == "done"
+    stats = profiler.stats["listener"]
+    assert stats.calls == 1
+    assert stats.slowSteps == 1 and len(slow) == 1
+    assert stats.blockingMax >= 0.05
+    assert stats.wall >= 0.08
+    assert stats.blocking < stats.wall
+
+
+def test_profiler_propagates_exceptions():
+    profiler = HandlerProfiler(blockThreshold=0)
+
+    async def listener():
+        await asyncio.sleep(0)
+        raise ValueError("boom")
+
+    async def main():
+        try:
+            await profiler.profile_coroutine("failing", listener())
+        except ValueError:
+            return True
+        return False
+
+    assert asyncio.run(main())
+    assert profiler.stats["failing"].calls == 1
+
+
+def test_profiler_sync_and_report():
+    profiler = HandlerProfiler()
+    func = profiler.profile_sync("sync", lambda: time.sleep(0.01) or 1)
+    assert func() == 1
+    stats = profiler.snapshot()[0]
+    assert stats["name"] == "sync"
+    assert stats["thread"] >= 0.01
+    assert "sync" in profiler.report()
+    profiler.reset()
+    assert profiler.report() == "No listener has been profiled"
+
+
+def test_profiler_close_does_not_run_handler_except_blocks():
+    profiler = HandlerProfiler()
+    events = []
+
+    async def listener():
+        try:
+            await asyncio.sleep(10)
+        except Exception:
+            events.append("except")
+        finally:
+            events.append("finally")
+
+    async def main():
+        iterator = profiler.profile_coroutine("closed", listener()).__await__()
+        next(iterator)
+        iterator.close()
+
+    asyncio.run(main())
+    assert events == ["finally"]
+    assert profiler.stats["closed"].calls == 1
+    unawaited = listener()
+    profiler.profile_coroutine("unawaited", unawaited).close()
+    assert unawaited.cr_frame is None
+
+
+def test_profiler_forwards_cancellation():
+    profiler = HandlerProfiler()
+    events = []
+
+    async def listener():
+        try:
+            await asyncio.sleep(10)
+        except asyncio.CancelledError:
+            events.append("cancelled")
+            raise
+
+    async def main():
+        async def run():
+            await profiler.profile_coroutine("cancelled", listener())
+
+        task = asyncio.ensure_future(run())
+        await asyncio.sleep(0.01)
+        task.cancel()
+        try:
+            await task
+        except asyncio.CancelledError:
+            return True
+        return False
+
+    assert asyncio.run(main())
+    assert events == ["cancelled"]
@@ -0,0 +1,113 @@
+import asyncio
+import json
+import time
+
+from yarl import URL
+
+from dingraia.config import RateLimit
+from dingraia.ratelimit import RateLimiter, TokenBucket, is_rate_limited
+
+
+class FakeResponse:
+
+    def __init__(self, status: int, body: dict, host: str = "api.dingtalk.com", contentType: str = "application/json",
+                 headers: dict = None):
+        self.status = status
+        self.ok = status < 400
+        self.url = URL(f"https://{host}/v1.0/test")
+        self.headers = {"Content-Type": contentType, **(headers or {})}
+        self._body = json.dumps(body).encode()
+        self.content_length = len(self._body)
+        self.reads = 0
+
+    async def read(self) -> bytes:
+        self.reads += 1
+        return self._body
+
+    async def json(self):
+        return json.loads(await self.read())
+
+
+def test_token_bucket_burst_and_rate():
+    async def main():
+        bucket = TokenBucket(20, capacity=2)
+        assert bucket.try_acquire()
+        assert bucket.try_acquire()
+        assert not bucket.try_acquire()
+        start = time.monotonic()
+        for _ in range(3):
+            await bucket.acquire()
+        return time.monotonic() - start
+
+    elapsed = asyncio.run(main())
+    assert 0.1 <= elapsed < 0.5
+
+
+def test_token_bucket_unlimited():
+    async def main():
+        bucket = TokenBucket(0)
+        for _ in range(1000):
+            await bucket.acquire()
+        return bucket.try_acquire()
+
+    assert asyncio.run(main())
+
+
+def test_is_rate_limited_only_reads_possible_errors():
+    async def check(response):
+        return await is_rate_limited(response), response.reads
+
+    assert asyncio.run(check(FakeResponse(429, {}))) == (True, 0)
+    assert asyncio.run(check(FakeResponse(200, {"result": 1}))) == (False, 0)
+    assert asyncio.run(check(FakeResponse(503, {"code": 90018}))) == (False, 0)
+    assert asyncio.run(check(FakeResponse(403, {"code": "Forbidden.AccessDenied.QpsLimitForApi"}))) == (True, 1)
+    assert asyncio.run(check(FakeResponse(200, {"errcode": 90018}, host="oapi.dingtalk.com"))) == (True, 1)
+    assert asyncio.run(check(FakeResponse(200, {"errcode": 0}, host="oapi.dingtalk.com"))) == (False, 1)
+    assert asyncio.run(check(FakeResponse(200, {"errcode": 0, "id": 900190001, "time": 1700090001},
+                                          host="oapi.dingtalk.com"))) == (False, 1)
+    assert asyncio.run(check(FakeResponse(404, {"code": "NotFound", "message": "id 90018"}))) == (False, 1)
+    assert asyncio.run(check(FakeResponse(400, {}, contentType="text/html"))) == (False, 0)
+
+
+def test_limiter_disabled_by_default():
+    limiter = RateLimiter(RateLimit())
+    assert not limiter.options.enabled
+
+    async def main():
+        start = time.monotonic()
+        for _ in range(100):
+            await limiter.acquire("app", "/v1.0/test")
+        return time.monotonic() - start
+
+    assert asyncio.run(main()) < 0.1
+
+
+def test_limiter_buckets_per_app_and_path():
+    limiter = RateLimiter(RateLimit(enabled=True, pathQps=5, paths={"/fast": 50}))
+    assert limiter.bucket("a", "/x") is limiter.bucket("a", "/x")
+    assert limiter.bucket("a", "/x") is not limiter.bucket("b", "/x")
+    assert limiter.bucket("a", "/fast").rate == 50
+    assert RateLimiter(RateLimit(enabled=True, pathQps=0)).bucket("a", "/x") is None
+
+
+def test_limiter_check_retries_by_default():
+    limiter = RateLimiter(RateLimit(maxRetries=2, retryMaxDelay=5))
+
+    async def main():
+        first = await limiter.check(FakeResponse(429, {}, headers={"Retry-After": "1.5"}), 0)
+        exhausted = await limiter.check(FakeResponse(429, {}), 2)
+        notResendable = await limiter.check(FakeResponse(429, {}), 0, retryable=False)
+        ok = await limiter.check(FakeResponse(200, {}), 0)
+        return first, exhausted, notResendable, ok
+
+    first, exhausted, notResendable, ok = asyncio.run(main())
+    assert first == 1.5
+    assert exhausted is None and notResendable is None and ok is None
+    assert limiter.limited == 3
+    assert limiter.retried == 1
+
+
+def test_retry_delay_is_capped():
+    limiter = RateLimiter(RateLimit(retryBaseDelay=1, retryMaxDelay=4))
+    assert all(2 <= limiter.retry_delay(10) <= 4 for _ in range(20))
+    assert limiter.retry_delay(0, "100") == 4
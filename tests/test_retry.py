@@ -0,0 +1,146 @@
+import asyncio
+
+from dingraia.config import RetryPolicy
+from dingraia.retry import LatencyWindow, Retrier
+
+
+class FakeResponse:
+    status = 200
+
+    def __init__(self, name: str):
+        self.name = name
+        self.released = False
+
+    def release(self):
+        self.released = True
+
+
+def test_latency_window_percentile():
+    window = LatencyWindow(size=100)
+    assert window.percentile(50) is None
+    for i in range(1, 101):
+        window.add(i / 100)
+    assert window.percentile(50) == 0.5
+    assert window.percentile(95) == 0.95
+    assert window.percentile(100) == 1
+
+
+def test_resolve_and_idempotency():
+    policy = RetryPolicy()
+    retrier = Retrier(policy)
+    assert retrier.resolve(None) is policy
+    assert retrier.resolve(False) is None
+    override = RetryPolicy(maxRetries=5)
+    assert retrier.resolve(override) is override
+    assert retrier.is_idempotent(policy, "GET", {})
+    assert not retrier.is_idempotent(policy, "POST", {"json": {"msgKey": "sampleText"}})
+    assert not retrier.is_idempotent(policy, "PUT", {})
+    assert not retrier.is_idempotent(policy, "DELETE", {})
+    assert not retrier.is_idempotent(policy, "POST", {"json": {"outTrackId": "t1"}})
+    assert retrier.is_idempotent(RetryPolicy(dedupKeys=("outTrackId",)), "POST", {"json": {"outTrackId": "t1"}})
+    assert retrier.is_idempotent(policy, "POST", {}, idempotent=True)
+    assert not retrier.is_idempotent(None, "GET", {})
+
+
+def test_delay_bounds():
+    policy = RetryPolicy(baseDelay=1, maxDelay=3, jitter=0.5)
+    for attempt in range(5):
+        delay = Retrier.delay(policy, attempt)
+        assert 0 < delay <= 3
+
+
+def hedging_retrier() -> Retrier:
+    retrier = Retrier(RetryPolicy(hedgePercentile=50, hedgeMinSamples=1, hedgeMinDelay=0.01))
+    retrier.record("/x", 0.01)
+    return retrier
+
+
+def test_send_without_hedge_records_latency():
+    retrier = Retrier(RetryPolicy())
+
+    async def factory():
+        return FakeResponse("only")
+
+    resp = asyncio.run(retrier.send(factory, "/x", None))
+    assert resp.name == "only"
+    assert len(retrier.latency["/x"]) == 1
+
+
+def test_hedge_uses_faster_response():
+    retrier = hedging_retrier()
+    delays = [0.3, 0]
+    created = []
+
+    async def factory():
+        delay = delays[len(created)]
+        resp = FakeResponse(f"r{len(created)}")
+        created.append(resp)
+        await asyncio.sleep(delay)
+        return resp
+
+    resp = asyncio.run(retrier.send(factory, "/x", retrier.policy))
+    assert resp.name == "r1"
+    assert retrier.hedges == 1
+    assert retrier.hedgeWins == 1
+
+
+def test_hedge_ignores_cancelled_request():
+    retrier = hedging_retrier()
+    created = []
+
+    async def factory():
+        index = len(created)
+        created.append(index)
+        if index == 0:
+            await asyncio.sleep(0.05)
+            raise asyncio.CancelledError
+        await asyncio.sleep(0.1)
+        return FakeResponse("second")
+
+    resp = asyncio.run(retrier.send(factory, "/x", retrier.policy))
+    assert resp.name == "second"
+
+
+def test_hedge_skipped_when_not_allowed():
+    retrier = hedging_retrier()
+    calls = []
+
+    async def factory():
+        calls.append(1)
+        await asyncio.sleep(0.05)
+        return FakeResponse("slow")
+
+    resp = asyncio.run(retrier.send(factory, "/x", retrier.policy, canHedge=lambda: False))
+    assert resp.name == "slow"
+    assert len(calls) == 1
+    assert retrier.hedges == 0
+
+
+def test_hedge_cancels_requests_when_caller_is_cancelled():
+    retrier = hedging_retrier()
+    started = []
+    cancelled = []
+
+    async def factory():
+        started.append(1)
+        try:
+            await asyncio.sleep(10)
+        except asyncio.CancelledError:
+            cancelled.append(1)
+            raise
+        return FakeResponse("never")
+
+    async def main():
+        task = asyncio.ensure_future(retrier.send(factory, "/x", retrier.policy))
+        await asyncio.sleep(0.05)
+        task.cancel()
+        try:
+            await task
+        except asyncio.CancelledError:
+            pass
+        return [t for t in asyncio.all_tasks() if t is not asyncio.current_task()]
+
+    leftover = asyncio.run(main())
+    assert len(started) == 2
+    assert len(cancelled) == 2
+    assert leftover == []
@@ -0,0 +1,137 @@
+import asyncio
+import re
+
+import pytest
+
+from dingraia.message.chain import MessageChain
+from dingraia.saya import Channel
+from dingraia.saya.builtins.broadcast import Command, CommandRouter, Filter, FilterContext, ListenerSchema, PrefixFilter
+from dingraia.saya.builtins.broadcast.filters import RegexFilter
+
+
+class BaseEvent:
+    pass
+
+
+class ChildEvent(BaseEvent):
+    pass
+
+
+@pytest.fixture
+def channel(monkeypatch):
+    monkeypatch.setattr(Channel, "reg_event", {})
+    monkeypatch.setattr(Channel, "_index", {})
+    monkeypatch.setattr(Channel, "_routers", {})
+    monkeypatch.setattr(Channel, "pendingRadios", [])
+    monkeypatch.setattr(Channel, "onStop", False)
+    return Channel()
+
+
+def radio(channel: Channel, event: type, *args):
+    async def main():
+        await channel.radio(event, *args, async_await=True)
+        await asyncio.gather(*channel.pendingRadios)
+
+    asyncio.run(main())
+
+
+def test_router_prefix_and_regex():
+    router = CommandRouter()
+    router.add("ping", Command("/ping", "/p"))
+    router.add("roll", Command(pattern=r"roll (\d+)", flags=re.I, fullMatch=True))
+    router.add("hello", Command(pattern=r"(?P<greeting>hi|hello)\s+(\w+)"))
+    assert router.match("  ROLL 12")["roll"].group(1) == "12"
+    match = router.match("say hello bob")["hello"]
+    assert match.groups() == ("hello", "bob")
+    assert match.group("greeting") == "hello"
+    result = router.match("/ping hi there")
+    assert result["ping"].group(0) == "/ping"
+    assert result["hello"].group(0) == "hi there"
+    assert router.match("nothing") == {}
+
+
+def test_router_shared_pattern_and_fallback():
+    router = CommandRouter()
+    router.add("a", Command(pattern=r"x(\d)"))
+    router.add("b", Command(pattern=r"x(\d)"))
+    assert set(router.match("x1")) == {"a", "b"}
+    router.add("backref", Command(pattern=r"(a)\1"))
+    assert router._search is None
+    assert set(router.match("aa x2")) == {"a", "b", "backref"}
+
+
+def test_router_dispatches_every_matching_regex():
+    router = CommandRouter()
+    router.add("roll", Command(pattern=r"roll (\d+)"))
+    router.add("number", Command(pattern=r"\d+"))
+    router.add("exact", Command(pattern=r"roll \d+", fullMatch=True))
+    router.add("other", Command(pattern=r"ping"))
+    result = router.match("roll 12")
+    assert set(result) == {"roll", "number", "exact"}
+    assert result["roll"].group(1) == "12"
+    assert result["number"].group(0) == "12"
+    assert router.match("hello") == {}
+
+
+def test_command_requires_prefix_or_pattern():
+    with pytest.raises(ValueError):
+        Command()
+
+
+def test_filter_is_abstract():
+    with pytest.raises(TypeError):
+        Filter()
+
+
+def test_text_filters():
+    context = FilterContext((MessageChain("  /echo hi"),))
+    assert PrefixFilter("/echo")(context)
+    assert not PrefixFilter("/echo", strip=False)(context)
+    assert RegexFilter(r"echo\s+\w+")(context)
+    assert not RegexFilter(r"echo", fullMatch=True)(context)
+    assert FilterContext(()).text == ""
+
+
+def test_listeners_run_in_priority_order(channel):
+    calls = []
+
+    @channel.use(ListenerSchema([BaseEvent], priority=20))
+    async def late():
+        calls.append("late")
+
+    @channel.use(ListenerSchema([BaseEvent], priority=1))
+    async def early():
+        calls.append("early")
+
+    listeners = channel._build_index(BaseEvent)
+    assert [listener.func for listener in listeners] == [early, late]
+
+
+def test_base_listeners_ignore_subclass_events_by_default(channel, monkeypatch):
+    @channel.use([BaseEvent])
+    async def base():
+        pass
+
+    assert channel._build_index(ChildEvent) == []
+    monkeypatch.setattr(Channel, "dispatchSubclasses", True)
+    channel.invalidate_index()
+    assert [listener.func for listener in channel._build_index(ChildEvent)] == [base]
+
+
+def test_radio_injects_match_and_applies_filters(channel):
+    received = []
+
+    @channel.use(ListenerSchema([BaseEvent], command=Command(pattern=r"roll (\d+)")))
+    async def roll(message: MessageChain, match: re.Match):
+        received.append(("roll", match.group(1)))
+
+    @channel.use(ListenerSchema([BaseEvent], filters=[PrefixFilter("/skip")]))
+    async def skipped():
+        received.append("skipped")
+
+    @channel.use([BaseEvent])
+    def sync_listener(message: MessageChain):
+        received.append(("sync", str(message)))
+
+    radio(channel, BaseEvent, MessageChain("roll 6"))
+    assert sorted(received, key=str) == [("roll", "6"), ("sync", "roll 6")]
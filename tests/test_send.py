@@ -0,0 +1,78 @@
+import asyncio
+import time
+
+from aiohttp import web
+
+from dingraia.DingTalk import Dingtalk
+from dingraia.config import AdvancedSendMessage, HttpClient
+from dingraia.context import send_accepted
+from dingraia.verify import set_client_session
+
+
+class FakeApp:
+
+    def __init__(self, keepSendOrder: bool = True):
+        self.config = type("Config", (), {"advancedSendMessage": AdvancedSendMessage(keepSendOrder=keepSendOrder)})
+        self.requests = []
+        self.running = 0
+        self.peak = 0
+
+    async def upload_file(self, m):
+        return m
+
+    async def send_message(self, target, m, headers=None, concurrent=None):
+        await asyncio.sleep(0.005 if m % 2 else 0.001)  # 准备请求的耗时
+        self.requests.append(m)
+        self.running += 1
+        self.peak = max(self.peak, self.running)
+        accepted = send_accepted.get()
+        if accepted is not None:
+            accepted.set()
+        await asyncio.sleep(0.05)  # 等待响应
+        self.running -= 1
+        if m == 3:
+            raise RuntimeError("failed")
+        return m
+
+
+def test_ordered_sends_are_pipelined():
+    app = FakeApp()
+    start = time.perf_counter()
+    res = asyncio.run(Dingtalk._send_messages_concurrently(app, None, list(range(6)), {}))
+    elapsed = time.perf_counter() - start
+    assert app.requests == list(range(6))
+    assert res == [0, 1, 2, 4, 5]
+    assert app.peak > 1
+    assert elapsed < 0.05 * 3
+
+
+def test_headers_sent_releases_next_message():
+    async def handler(_):
+        await asyncio.sleep(0.2)
+        return web.Response(text="ok")
+
+    async def main():
+        server = web.Application()
+        server.router.add_post("/send", handler)
+        runner = web.AppRunner(server)
+        await runner.setup()
+        site = web.TCPSite(runner, "127.0.0.1", 0)
+        await site.start()
+        port = runner.addresses[0][1]
+        session = Dingtalk._new_client_session(type("App", (), {
+            "config"                  : type("Config", (), {"httpClient": HttpClient()}),
+            "_on_request_headers_sent": Dingtalk._on_request_headers_sent,
+        }))
+        accepted = asyncio.Event()
+        try:
+            request = asyncio.ensure_future(session.post(f"http://127.0.0.1:{port}/send", json={},
+                                                         trace_request_ctx={"sendAccepted": accepted}))
+            await asyncio.wait_for(accepted.wait(), 0.1)
+            assert not request.done()
+            (await request).release()
+        finally:
+            await session.close()
+            set_client_session(None)
+            await runner.cleanup()
+
+    asyncio.run(main())
@@ -0,0 +1,34 @@
+import asyncio
+import threading
+import time
+
+from dingraia.stall_monitor import StallMonitor
+
+
+def test_stall_monitor_reports_and_closes_stall():
+    monitor = StallMonitor(threshold=0.1, interval=0.01, stackLimit=5)
+
+    async def main():
+        monitor.start()
+        await asyncio.sleep(0.05)
+        time.sleep(0.3)
+        await asyncio.sleep(0.05)
+        monitor.stop()
+
+    asyncio.run(main())
+    snapshot = monitor.snapshot()
+    assert snapshot["stalls"] == 1
+    assert snapshot["stallTime"] >= 0.25
+    assert snapshot["lastStall"]["duration"] is not None
+    assert snapshot["lastStall"]["stack"]
+    assert not monitor._reported
+
+
+def test_stall_monitor_does_not_count_late_heartbeat():
+    monitor = StallMonitor(threshold=0.05, interval=0.01)
+    monitor._pendingSince = time.monotonic() - 1
+    monitor._loopThreadId = threading.get_ident()
+    monitor._beat(monitor._pendingSince)
+    # 心跳已经执行，监控线程之后的判断不应再报告这次卡顿
+    assert monitor._pendingSince is None
+    assert monitor.stalls == 0
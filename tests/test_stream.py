@@ -0,0 +1,139 @@
+import asyncio
+import json
+import time
+
+from dingraia.stream import Backoff, EventDeduplicator, StreamDispatcher, StreamFrame, conversation_key
+
+
+def test_backoff_grows_and_caps():
+    backoff = Backoff(1, 10, 2, jitter=0)
+    assert [backoff.next() for _ in range(6)] == [1, 2, 4, 8, 10, 10]
+    assert backoff.attempts == 6
+    backoff.reset()
+    assert backoff.next() == 1
+
+
+def test_backoff_does_not_overflow():
+    backoff = Backoff(1, 60, 2.0, jitter=0)
+    backoff.attempts = 5000
+    assert backoff.next() == 60
+    backoff = Backoff(100, 60, 2.0, jitter=0)
+    backoff.attempts = 5000
+    assert backoff.next() == 60
+
+
+def test_backoff_jitter_range():
+    backoff = Backoff(4, 60, 2, jitter=0.5)
+    for _ in range(20):
+        backoff.reset()
+        assert 2 <= backoff.next() <= 4
+
+
+def test_deduplicator_detects_duplicates():
+    dedup = EventDeduplicator(maxSize=3, ttl=0)
+    assert not dedup.seen("a")
+    assert dedup.seen("a")
+    assert dedup.duplicates == 1
+    assert not dedup.seen(None)
+    for eventId in ("b", "c", "d"):
+        dedup.seen(eventId)
+    assert "a" not in dedup
+    assert len(dedup) == 3
+
+
+def test_deduplicator_ttl():
+    dedup = EventDeduplicator(ttl=0.05)
+    dedup.seen("a")
+    time.sleep(0.06)
+    assert not dedup.seen("a")
+
+
+def test_frame_ack_echoes_data():
+    frame = StreamFrame.decode(json.dumps({
+        "type"   : "CALLBACK",
+        "headers": {"messageId": "m1", "topic": "/v1.0/im/bot/messages/get"},
+        "data"   : json.dumps({"text": {"content": "hi"}}),
+    }))
+    assert frame.data == {"text": {"content": "hi"}}
+    ack = json.loads(frame.ack())
+    assert ack["code"] == 200
+    assert ack["headers"]["messageId"] == "m1"
+    assert json.loads(ack["data"]) == frame.data
+
+
+def test_frame_ack_http_request_and_invalid():
+    frame = StreamFrame({"type": "EVENT", "headers": {"messageId": "m2"},
+                         "data": json.dumps({"requestLine": {}, "headers": {}})})
+    ack = json.loads(frame.ack())
+    assert json.loads(ack["data"])["response"]["statusLine"]["code"] == 200
+    invalid = json.loads(StreamFrame({"type": "SYSTEM", "headers": {}}).ack())
+    assert invalid["code"] == 400
+
+
+def test_conversation_key():
+    assert conversation_key({"conversationId": "cid1"}) == "cid1"
+    assert conversation_key({"openConversationId": "cid2"}) == "cid2"
+    assert conversation_key({"other": 1}) is None
+
+
+def test_dispatcher_keeps_conversation_order():
+    async def main():
+        dispatcher = StreamDispatcher(maxConcurrency=8)
+        order = []
+
+        async def handle(key, index, delay):
+            await asyncio.sleep(delay)
+            order.append((key, index))
+
+        await dispatcher.submit("a", handle, "a", 0, 0.03)
+        await dispatcher.submit("b", handle, "b", 0, 0)
+        await dispatcher.submit("a", handle, "a", 1, 0)
+        await dispatcher.submit("a", handle, "a", 2, 0)
+        assert await dispatcher.drain(1) == 0
+        return order
+
+    order = asyncio.run(main())
+    assert [i for k, i in order if k == "a"] == [0, 1, 2]
+    assert order[0] == ("b", 0)
+
+
+def test_dispatcher_limits_concurrency():
+    async def main():
+        dispatcher = StreamDispatcher(maxConcurrency=2, keepConversationOrder=False)
+        running = 0
+        peak = 0
+
+        async def handle():
+            nonlocal running, peak
+            running += 1
+            peak = max(peak, running)
+            await asyncio.sleep(0.01)
+            running -= 1
+
+        for _ in range(6):
+            await dispatcher.submit(None, handle)
+        await dispatcher.drain(1)
+        return peak, dispatcher.pending
+
+    peak, pending = asyncio.run(main())
+    assert peak == 2
+    assert pending == 0
+
+
+def test_dispatcher_survives_handler_error():
+    async def main():
+        dispatcher = StreamDispatcher(maxConcurrency=1)
+        handled = []
+
+        async def fail():
+            raise RuntimeError("boom")
+
+        async def ok():
+            handled.append(1)
+
+        await dispatcher.submit("a", fail)
+        await dispatcher.submit("a", ok)
+        await dispatcher.drain(1)
+        return handled
+
+    assert asyncio.run(main()) == [1]
@@ -0,0 +1,77 @@
+import asyncio
+import time
+
+import pytest
+
+from dingraia.element import AccessToken
+from dingraia.token_manager import AccessTokenManager
+
+
+class FakeApp:
+    clientSession = None
+
+
+class CountingToken(AccessToken):
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.refreshes = 0
+
+    async def async_refresh(self, session, force=False):
+        self.refreshes += 1
+        await asyncio.sleep(0.02)
+        self.token = f"token-{self.refreshes}"
+        self.expired = int(time.time()) + 7200
+        return self
+
+
+def test_concurrent_gets_refresh_once():
+    token = CountingToken(AppKey="key", AppSecret="secret")
+
+    async def main():
+        manager = AccessTokenManager(FakeApp(), {})
+        managed = manager.register(token)
+        results = await asyncio.gather(*[manager.get(managed) for _ in range(10)])
+        await manager.stop()
+        return results
+
+    results = asyncio.run(main())
+    assert token.refreshes == 1
+    assert all(r.token == "token-1" for r in results)
+
+
+def test_register_returns_existing_token():
+    manager = AccessTokenManager(FakeApp(), {})
+    first = manager.register(AccessToken(AppKey="key", AppSecret="secret"))
+    assert manager.register(AccessToken(AppKey="key", AppSecret="secret")) is first
+    other = AccessToken(AppKey="key", AppSecret="changed")
+    assert manager.register(other) is other
+    userToken = AccessToken("user-token", 7200)
+    assert manager.register(userToken) is userToken
+
+
+def test_valid_token_is_not_refreshed():
+    token = CountingToken("cached", 7200, AppKey="key", AppSecret="secret")
+
+    async def main():
+        manager = AccessTokenManager(FakeApp(), {})
+        result = await manager.get(manager.register(token))
+        await manager.refresh(token)
+        await manager.stop()
+        return result
+
+    assert asyncio.run(main()).token == "cached"
+    assert token.refreshes == 0
+
+
+def test_access_token_property_never_refreshes():
+    from dingraia.DingTalk import Dingtalk
+
+    class App:
+        _access_token = CountingToken(AppKey="key", AppSecret="secret")
+
+    with pytest.raises(ValueError):
+        Dingtalk.access_token.fget(App())
+    App._access_token = CountingToken("cached", 7200, AppKey="key", AppSecret="secret")
+    assert Dingtalk.access_token.fget(App()) == "cached"
+    assert App._access_token.refreshes == 0
@@ -0,0 +1,36 @@
+import time
+
+from dingraia.cache import cache
+from dingraia.workers import WorkerContext, WorkerSupervisor, shard_streams
+
+
+def test_shard_streams_covers_every_worker():
+    assert shard_streams(["a", "b", "c"], 2) == [["a", "c"], ["b"]]
+    assert shard_streams(["a"], 3) == [["a"], ["a"], ["a"]]
+
+
+def test_supervisor_forwards_peer_metrics_to_first_worker():
+    supervisor = WorkerSupervisor(None, 3)
+    supervisor.statsQueue.put({"index": 0, "received": 1, "metrics": {"c_total": {(): 1}}})
+    supervisor.statsQueue.put({"index": 1, "received": 2, "metrics": {"c_total": {(): 2}}})
+    supervisor.statsQueue.put({"index": 2, "received": 3, "metrics": {"c_total": {(): 3}}})
+    time.sleep(0.1)
+    supervisor._collect(0.5)
+    assert supervisor.stats()["total"]["received"] == 6
+    assert "metrics" not in supervisor.workerStats[1]
+    context = WorkerContext(0, supervisor.stopEvent, supervisor.statsQueue, 10, supervisor.metricsQueue)
+    time.sleep(0.1)
+    context._receive_metrics()
+    assert context.peerMetrics == {1: {"c_total": {(): 2}}, 2: {"c_total": {(): 3}}}
+
+
+def test_supervisor_limits_info_cache(monkeypatch):
+    monkeypatch.setattr(cache.infoCache, "ttl", 300)
+    monkeypatch.setattr(cache.infoCache, "maxSize", 1024)
+    cache.infoCache.set(["a"], 1)
+    WorkerSupervisor(None, 2, infoCacheTtl=3)._limit_info_cache()
+    assert cache.infoCache.ttl == 3
+    assert cache.infoCache.get("a") is None
+    WorkerSupervisor(None, 2, infoCacheTtl=0)._limit_info_cache()
+    cache.infoCache.set(["a"], 1)
+    assert cache.infoCache.get("a") is None